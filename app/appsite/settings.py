@@ -17,6 +17,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'orders.middleware.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -24,6 +25,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'orders.middleware.LockTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'appsite.urls'
@@ -73,4 +75,65 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 拠点（店舗/倉庫）ごとのCSV配置。キーが拠点コード（APIの ?location=）
+ORDERS_LOCATIONS = {
+    "default": {"name": "本店", "data_dir": BASE_DIR / "data"},
+}
+
+# CSV/DBロックの待ち時間上限(秒)と、落ちたプロセスのロック行を無効とみなすまでの秒数
+# （長い確定/取込はチャンクごとに期限を延ばすので、処理中に TTL を超えても奪われない）
+ORDERS_LOCK_TIMEOUT = 30
+ORDERS_LOCK_TTL = 300
+
+# 処理時間の計測（/api/metrics/ と orders.metrics ロガー）。False の間はほぼオーバーヘッド無し
+# 1件ごとの JSON ログは orders.metrics を DEBUG にしたときだけ出る
+ORDERS_METRICS_ENABLED = False
+
+# リクエストごとのSQL件数/DB時間の計測と Server-Timing ヘッダ（既定は無効）
+ORDERS_QUERY_PROFILING = False
+ORDERS_SLOW_REQUEST_MS = 500
+ORDERS_SLOW_REQUEST_QUERIES = 50
+
+# CSVのパース結果を隣に .<名前>.cache.parquet/.rows.json として保存し、CSVが変わるまで再利用
+ORDERS_CSV_SIDECAR_CACHE = True
+
+# data/exports の保持（直近この件数まで、かつこの日数以内）
+ORDERS_EXPORT_KEEP = 20
+ORDERS_EXPORT_MAX_AGE_DAYS = 30
+
+# CSV出力ジョブを処理するプロセス内スレッド数。0 にすると manage.py run_export_worker に任せる
+ORDERS_EXPORT_WORKERS = 2
+# queued/running のままこの秒数更新が無いジョブは、ワーカーが落ちたとみなして作り直す
+ORDERS_EXPORT_STALE_SECONDS = 600
+
+# CSVの読み書きエンジン。"auto"（pandas があれば pandas）/ "pandas" / "stdlib"（標準ライブラリ csv のみ）
+ORDERS_CSV_ENGINE = "auto"
+
+# このサイズ(バイト)以上の zaikokanri.csv と .csv.gz は ORDERS_CSV_CHUNK_ROWS 行ずつ読み書きする（メモリ使用量を一定に）
+ORDERS_CSV_STREAM_THRESHOLD = 32 * 1024 * 1024
+ORDERS_CSV_CHUNK_ROWS = 5000
+
+# 未確定がこの件数を超える一括確定は、この件数ずつコミットする（途中で止まっても次回の確定で再開）
+ORDERS_CONFIRM_CHUNK_ORDERS = 500
+# 止まったチャンク確定の再開がこの回数続けて失敗したら中止（abandoned）にして、CSVの取込を再開する
+ORDERS_CONFIRM_MAX_RESUMES = 3
+
+# これ以上のサイズ(バイト)のJSON応答は、クライアントが対応していれば gzip で返す
+ORDERS_JSON_GZIP_MIN_BYTES = 4096
+
+# 差分同期（/api/changes/）用の変更履歴の保持件数と、1回の差分で返す最大件数（超えたら resync）
+ORDERS_CHANGELOG_KEEP = 50000
+ORDERS_CHANGES_MAX = 5000
+
+# 取込/確定のたびに data/.inventory.snapshot を書き出し、各ワーカーは mmap して在庫と名簿を読む
+ORDERS_SHARED_SNAPSHOT = True
+
+# 注文の名前が有効な名簿（meibo.csv → Member）に無ければ受け付けない（名簿が空のときは確認しない）
+ORDERS_REQUIRE_MEMBER = True
+
+# manage.py archive_orders がアーカイブする注文（この月数より前の月に作成された確定済み/取消済み）
+ORDERS_ARCHIVE_AFTER_MONTHS = 12
+# 読んだアーカイブ（月ファイル）をプロセス内に覚えておく合計行数（超えたら古く使った月から捨てる）
+ORDERS_ARCHIVE_CACHE_ROWS = 200_000
@@ -50,17 +50,13 @@ export default function InventoryCsv() {
   const [pollMs, setPollMs] = useState(2000);
 
   const loadAll = async () => {
-    const [s1, s2, s3, s4] = await Promise.all([
-      apiGet("/api/inventory_csv/summary/"),
-      apiGet("/api/inventory_csv/lots/"),
-      apiGet("/api/inventory_csv/alerts/"),
-      apiGet("/api/carryover/report/"),
-    ]);
-    setSummary(s1.summary || []);
-    setLots(s2.lots || []);
-    setAlerts(s3.alerts || []);
-    setExportedName(s3.exported || "");
-    setCarry(s4 || { month: "", has_snapshot: false, rows: [] });
+    // summary / lots / alerts / carryover を1リクエストで取得（サーバ側も取込・全件読込は1回）
+    const d = await apiGet("/api/inventory_csv/dashboard/");
+    setSummary(d.summary || []);
+    setLots(d.lots || []);
+    setAlerts(d.alerts || []);
+    setExportedName(d.exported || "");
+    setCarry(d.carryover || { month: "", has_snapshot: false, rows: [] });
   };
 
   const loadSync = async () => {
@@ -1,6 +1,7 @@
 import React, { useEffect, useMemo, useState } from 'react'
 import {
   Alert,
+  Autocomplete,
   Box,
   Button,
   Card,
@@ -15,6 +16,7 @@ import {
   TableCell,
   TableHead,
   TableRow,
+  TextField,
   Typography,
 } from '@mui/material'
 import { apiGet, apiPost } from '../utils/api.js'
@@ -31,6 +33,8 @@ export default function OrderPage() {
 
   // form state
   const [name, setName] = useState('')
+  const [nameInput, setNameInput] = useState('')
+  const [names, setNames] = useState([])
   const [okazu, setOkazu] = useState('')
   const [gohan, setGohan] = useState('')
   const [okazuExpiry, setOkazuExpiry] = useState('')
@@ -44,10 +48,10 @@ export default function OrderPage() {
 
   const load = async () => {
     setError(''); setSuccess('')
-    const o = await apiGet('/api/options/')
-    setOpts(o)
-    const p = await apiGet('/api/pending/')
-    setPending(p.orders || [])
+    // options と未確定一覧を1往復で取得（名簿は全件取らず、下の /api/members/ で引く）
+    const b = await apiGet('/api/bootstrap/?names=0')
+    setOpts(b.options)
+    setPending(b.orders || [])
   }
 
   // okazu/gohan が変わったら expiry を先頭に寄せる
@@ -72,6 +76,17 @@ export default function OrderPage() {
 
   useEffect(() => { load().catch(e => setError(String(e.message || e))) }, [])
 
+  // 名前は入力に合わせて前方一致で候補を取る（かな/カナは区別しない）
+  useEffect(() => {
+    let active = true
+    const t = setTimeout(() => {
+      apiGet(`/api/members/?q=${encodeURIComponent(nameInput)}`)
+        .then(r => { if (active) setNames(r.members || []) })
+        .catch(e => { if (active) setError(String(e.message || e)) })
+    }, 200)
+    return () => { active = false; clearTimeout(t) }
+  }, [nameInput])
+
   const submit = async () => {
     setError(''); setSuccess('')
     try {
@@ -81,6 +96,7 @@ export default function OrderPage() {
       setSuccess('仮送信しました（未確定に追加 / 在庫はまだ減りません）')
       // 要望：仮送信後はコンボボックスを全て空に戻す
       setName('')
+      setNameInput('')
       setOkazu('')
       setOkazuExpiry('')
       setGohan('')
@@ -119,7 +135,6 @@ export default function OrderPage() {
     }
   }
 
-  const names = opts?.names || []
   const okazuItems = opts?.okazu_items || []
   const gohanItems = opts?.gohan_items || []
 
@@ -134,13 +149,17 @@ export default function OrderPage() {
         <CardContent>
           <Stack spacing={2}>
             <Stack direction={{ xs: 'column', md: 'row' }} spacing={2}>
-              <FormControl fullWidth>
-                <InputLabel>名前</InputLabel>
-                <Select label="名前" value={name} onChange={(e) => setName(e.target.value)}>
-                  <MenuItem value="">（未選択）</MenuItem>
-                  {names.map(n => <MenuItem key={n} value={n}>{n}</MenuItem>)}
-                </Select>
-              </FormControl>
+              <Autocomplete
+                fullWidth
+                options={names}
+                filterOptions={(x) => x}
+                value={name || null}
+                onChange={(e, v) => setName(v || '')}
+                inputValue={nameInput}
+                onInputChange={(e, v) => setNameInput(v)}
+                noOptionsText="該当なし"
+                renderInput={(params) => <TextField {...params} label="名前" />}
+              />
               <Box sx={{ flex: 1 }} />
             </Stack>
 
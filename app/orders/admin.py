@@ -1,12 +1,26 @@
 from django.contrib import admin
-from .models import Inventory, Order
+from .models import Inventory, LotAllocation, Member, Order
 
 @admin.register(Inventory)
 class InventoryAdmin(admin.ModelAdmin):
-    list_display = ('item', 'expiry', 'qty', 'refill_line', 'alert')
-    list_filter = ('item', 'expiry')
+    list_display = ('location', 'item', 'expiry', 'qty', 'refill_line', 'alert')
+    list_filter = ('location', 'item', 'expiry')
+
+class LotAllocationInline(admin.TabularInline):
+    model = LotAllocation
+    fields = ('part', 'item', 'expiry', 'qty')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'name', 'okazu', 'okazu_expiry', 'gohan', 'gohan_expiry', 'confirmed', 'cancelled')
-    list_filter = ('confirmed', 'cancelled', 'name')
+    list_display = ('created_at', 'location', 'name', 'okazu', 'okazu_expiry', 'gohan', 'gohan_expiry', 'confirmed', 'cancelled')
+    list_filter = ('location', 'confirmed', 'cancelled', 'name')
+    inlines = [LotAllocationInline]
+
+@admin.register(Member)
+class MemberAdmin(admin.ModelAdmin):
+    list_display = ('location', 'position', 'name', 'kana', 'active', 'updated_at')
+    list_filter = ('location', 'active')
+    search_fields = ('name', 'kana')
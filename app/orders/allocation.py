@@ -0,0 +1,69 @@
+"""確定時の在庫ロット引当（賞味期限の早い順）
+
+    alloc = LotAllocator(lots, today)
+    taken, short = alloc.allocate("唐揚げ", "2026-03-07")
+
+- 注文で選ばれたロット（お弁当 + 賞味期限）に在庫があればそこから引く
+- 足りない分は同じお弁当の、期限切れでないロットを賞味期限の早い順に引く（0 になったら次のロットへ）
+- 品目ごとのヒープは最初に1回だけ作る。確定1回分の注文はすべてメモリ上で引き当て、
+  変わったロットは changed() でまとめて保存する（changed() は前回呼んだ後に変わった分だけ返す）
+"""
+from __future__ import annotations
+
+import heapq
+from datetime import date
+
+from django.utils.dateparse import parse_date
+
+from .models import Inventory
+
+
+def _expiry_date(expiry: str) -> date | None:
+    try:
+        return parse_date(expiry or "")
+    except ValueError:
+        return None
+
+
+class LotAllocator:
+    def __init__(self, lots: list[Inventory], today: date):
+        self._lots = {(lot.item, lot.expiry): lot for lot in lots}
+        self._heaps: dict[str, list] = {}
+        for lot in lots:
+            d = _expiry_date(lot.expiry)
+            if d is not None and d < today:
+                continue
+            # 日付として読めない期限は最後に回す
+            self._heaps.setdefault(lot.item, []).append((d or date.max, lot.expiry, lot.id, lot))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+        self._changed: dict[int, Inventory] = {}
+
+    def _take(self, lot: Inventory, need: int, taken: list) -> int:
+        n = min(need, lot.qty)
+        lot.qty -= n
+        self._changed[id(lot)] = lot
+        taken.append((lot, n))
+        return need - n
+
+    def allocate(self, item: str, expiry: str = "", qty: int = 1) -> tuple[list[tuple[Inventory, int]], int]:
+        """(引き当てた [(ロット, 数)], 足りなかった数)"""
+        taken: list[tuple[Inventory, int]] = []
+        need = qty
+        lot = self._lots.get((item, expiry))
+        if lot is not None and lot.qty > 0:
+            need = self._take(lot, need, taken)
+
+        heap = self._heaps.get(item)
+        while need > 0 and heap:
+            lot = heap[0][3]
+            if lot.qty <= 0:
+                heapq.heappop(heap)
+                continue
+            need = self._take(lot, need, taken)
+        return taken, need
+
+    def changed(self) -> list[Inventory]:
+        lots = list(self._changed.values())
+        self._changed.clear()
+        return lots
@@ -6,4 +6,9 @@ class OrdersConfig(AppConfig):
 
     def ready(self):
         # 起動時にDB/CSVへアクセスしない（Django警告回避）
-        return
+        from django.db.models.signals import post_migrate
+
+        from . import search
+
+        # テーブルを作り直すマイグレーションで消えた全文検索のトリガーを戻す
+        post_migrate.connect(search.ensure_index, sender=self)
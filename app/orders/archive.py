@@ -0,0 +1,238 @@
+"""古い注文の月別アーカイブ（data/archive/orders_YYYY-MM.csv.gz）
+
+確定済み/取消済みで一定期間より古い注文を月ごとの gzip CSV に移し、Order テーブルからは消す
+（`python manage.py archive_orders`）。月は Asia/Tokyo（settings.TIME_ZONE）の作成日で分ける。
+その注文の LotAllocation も allocations 列（JSON）に残す。
+
+履歴・集計は、指定された期間にアーカイブ済みの月が含まれるときだけ該当月のファイルを読み、
+DB の結果と合わせる（期間を指定しない場合は archive=1 を付けたときだけ読む）。
+読んだファイルは mtime が変わるまでプロセス内に覚えておく（合計 ORDERS_ARCHIVE_CACHE_ROWS 行まで、古く使ったものから捨てる）。
+
+消した注文は ChangeLog に記録するので、差分同期（/api/changes/）のクライアントには deleted_orders として届く。
+
+アーカイブはファイルを書いてから DB の行を消す。その間（またはその間に落ちた場合）に同じ注文が
+両方にあっても、履歴は id で重複を除き、次回のアーカイブはファイル側を id で上書きする。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import changes, search
+from .csv_engine import get_engine, write_stream
+from .locations import Location
+from .locks import heartbeat, resource_lock
+from .metrics import timer
+from .models import LotAllocation, Order
+
+COLUMNS = (
+    "id", "name", "okazu", "okazu_expiry", "gohan", "gohan_expiry",
+    "created_at", "confirmed", "confirmed_at", "cancelled", "allocations",
+)
+# 1回の DELETE で消す注文数
+_DELETE_BATCH = 500
+
+
+def archive_dir(loc: Location) -> Path:
+    return loc.data_dir / "archive"
+
+
+def _month_path(loc: Location, month: str) -> Path:
+    return archive_dir(loc) / f"orders_{month}.csv.gz"
+
+
+def archived_months(loc: Location) -> list[str]:
+    d = archive_dir(loc)
+    if not d.exists():
+        return []
+    return sorted(p.name[len("orders_"):-len(".csv.gz")] for p in d.glob("orders_????-??.csv.gz"))
+
+
+def months_for(loc: Location, start: date | None = None, end: date | None = None) -> list[str]:
+    """start〜end（None は制限なし）にかかるアーカイブ済みの月"""
+    lo = start.strftime("%Y-%m") if start else ""
+    hi = end.strftime("%Y-%m") if end else "9999-99"
+    return [m for m in archived_months(loc) if lo <= m <= hi]
+
+
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _parse_month(path: Path) -> tuple[tuple, ...]:
+    """(id, name, okazu, okazu_expiry, gohan, gohan_expiry, created_at, confirmed, cancelled) のタプル"""
+    table = get_engine().read(path)
+    idx = [table.index(c) for c in COLUMNS[:10]]
+    out = []
+    for r in table.rows:
+        v = [None if i is None else r[i] for i in idx]
+        out.append((
+            int(v[0]), v[1] or "", v[2] or "", v[3] or "", v[4] or "", v[5] or "",
+            datetime.fromisoformat(v[6]), v[7] == "1", v[9] == "1",
+        ))
+    return tuple(out)
+
+
+class _MonthCache:
+    """パース済みの月ファイル（path → (mtime_ns, rows)）。合計行数が上限を超えたら古く使ったものから捨てる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._months: OrderedDict[str, tuple[int, tuple]] = OrderedDict()
+        self.rows = 0
+
+    def get(self, path: str, mtime_ns: int) -> tuple | None:
+        with self._lock:
+            hit = self._months.get(path)
+            if hit is None or hit[0] != mtime_ns:
+                return None
+            self._months.move_to_end(path)
+            return hit[1]
+
+    def put(self, path: str, mtime_ns: int, rows: tuple) -> None:
+        limit = int(getattr(settings, "ORDERS_ARCHIVE_CACHE_ROWS", 200_000))
+        with self._lock:
+            old = self._months.pop(path, None)
+            if old is not None:
+                self.rows -= len(old[1])
+            if len(rows) > limit:
+                return
+            self._months[path] = (mtime_ns, rows)
+            self.rows += len(rows)
+            while self.rows > limit:
+                _, (_, evicted) = self._months.popitem(last=False)
+                self.rows -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._months.clear()
+            self.rows = 0
+
+
+_months = _MonthCache()
+
+
+def read_month(loc: Location, month: str) -> tuple[tuple, ...]:
+    path = _month_path(loc, month)
+    mtime = _mtime_ns(path)
+    if not mtime:
+        return ()
+    rows = _months.get(str(path), mtime)
+    if rows is not None:
+        return rows
+    with timer("archive.read") as t:
+        rows = _parse_month(path)
+        t.rows = len(rows)
+    _months.put(str(path), mtime, rows)
+    return rows
+
+
+def _in_range(created_at: datetime, start: date | None, end: date | None) -> bool:
+    d = timezone.localtime(created_at).date()
+    return (start is None or d >= start) and (end is None or d <= end)
+
+
+def confirmed_rows(loc: Location, name: str = "", start: date | None = None, end: date | None = None, q: str = ""):
+    """アーカイブ済みの確定済み（取消除く）注文 (id, name, okazu, okazu_expiry, gohan, gohan_expiry, created_at)
+
+    q は search.filter_orders と同じ条件（名前/おかず/ご飯の部分一致）。
+    """
+    for month in months_for(loc, start, end):
+        for r in read_month(loc, month):
+            if not r[7] or r[8]:
+                continue
+            if name and r[1] != name:
+                continue
+            if q and not search.matches(q, r[1], r[2], r[4]):
+                continue
+            if _in_range(r[6], start, end):
+                yield r[:7]
+
+
+def item_counts(loc: Location, part: str, start: date | None = None, end: date | None = None) -> Counter:
+    """アーカイブ済みの確定済み注文を part（okazu / gohan）の品目名ごとに数える"""
+    col = 2 if part == "okazu" else 4
+    return Counter(r[col] for r in confirmed_rows(loc, start=start, end=end) if r[col])
+
+
+def cutoff_for(months: int, today: date | None = None) -> date:
+    """months か月前の月初（この日より前に作成された注文がアーカイブ対象）"""
+    today = today or timezone.localdate()
+    y, m = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return date(y, m + 1, 1)
+
+
+def archive_orders(loc: Location, before: date, dry_run: bool = False) -> dict[str, int]:
+    """before（月初）より前に作成された確定済み/取消済みの注文を月ごとのファイルへ移す。{月: 件数}"""
+    cutoff = timezone.make_aware(datetime(before.year, before.month, before.day))
+    qs = Order.objects.filter(location=loc.code, created_at__lt=cutoff).filter(Q(confirmed=True) | Q(cancelled=True))
+    done: dict[str, int] = {}
+    with resource_lock(f"archive:{loc.code}", file=archive_dir(loc) / "orders"):
+        for month_start in qs.dates("created_at", "month"):
+            month = month_start.strftime("%Y-%m")
+            lo = timezone.make_aware(datetime(month_start.year, month_start.month, 1))
+            hi_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+            hi = timezone.make_aware(datetime(hi_month.year, hi_month.month, 1))
+            month_qs = qs.filter(created_at__gte=lo, created_at__lt=min(hi, cutoff))
+            if dry_run:
+                done[month] = month_qs.count()
+            else:
+                done[month] = _archive_month(loc, month, month_qs)
+            heartbeat()
+    return done
+
+
+def _archive_month(loc: Location, month: str, qs) -> int:
+    orders = list(qs.order_by("id").values_list(*COLUMNS[:10]))
+    if not orders:
+        return 0
+    ids = [o[0] for o in orders]
+    allocations: dict[int, list] = {}
+    for i in range(0, len(ids), _DELETE_BATCH):
+        for order_id, part, item, expiry, qty in LotAllocation.objects.filter(
+            order_id__in=ids[i:i + _DELETE_BATCH]
+        ).values_list("order_id", "part", "item", "expiry", "qty"):
+            allocations.setdefault(order_id, []).append([part, item, expiry, qty])
+
+    rows = {}
+    path = _month_path(loc, month)
+    if path.exists():
+        # 以前のアーカイブ後に確定/取消された同じ月の注文を足す
+        table = get_engine().read(path)
+        for r in table.rows:
+            rows[int(r[0])] = r
+    for o in orders:
+        rows[o[0]] = [
+            o[0], o[1], o[2], o[3], o[4], o[5],
+            o[6].isoformat(), "1" if o[7] else "0", o[8].isoformat() if o[8] else "", "1" if o[9] else "0",
+            json.dumps(allocations.get(o[0], []), ensure_ascii=False),
+        ]
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with timer("archive.write") as t:
+        t.rows = write_stream(tmp, list(COLUMNS), (rows[k] for k in sorted(rows)), compressed=True)
+        os.replace(tmp, path)
+        t.bytes = path.stat().st_size
+
+    # ファイルに書けてから消す
+    with timer("archive.delete") as t:
+        for i in range(0, len(ids), _DELETE_BATCH):
+            batch = ids[i:i + _DELETE_BATCH]
+            with transaction.atomic():
+                Order.objects.filter(id__in=batch).delete()
+                changes.record_orders(loc.code, batch)
+        t.rows = len(ids)
+    return len(orders)
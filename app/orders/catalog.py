@@ -0,0 +1,83 @@
+"""品目カタログ（Item）
+
+CSV取込・注文登録・繰越スナップショットで出てきた品目名を Item に登録し、
+Inventory / Order / CarryoverSnapshot には品目の整数id（*_ref）も持たせる。
+集計（ランキング等）はこの id でまとめ、表示のときだけ名前に戻す。
+名前の列（item / okazu / gohan）は残している（CSVの書き戻し・ChangeLog・スナップショット・API が名前で動くため）。
+そのため行は小さくならない（id を足した分だけ増える）。
+
+    ids = ids_for({"唐揚げ", "ご飯(大)"})   # 無ければ登録して {名前: id}
+    categories(["ご飯(大)"]) == {"ご飯(大)": Item.GOHAN}
+
+名前 → (id, 区分) はプロセス内に覚えておく（品目名は増えるだけで変わらない）。
+ロールバックされうる行を覚えないよう、覚えるのはコミットされてから。
+"""
+from __future__ import annotations
+
+import threading
+
+from django.db import transaction
+
+from . import kana
+from .models import Item
+
+_lock = threading.Lock()
+_known: dict[str, tuple[int, str]] = {}
+
+
+def category_for(name: str) -> str:
+    """新しく登録する品目の区分"""
+    return Item.GOHAN if name.startswith("ご飯") else Item.OKAZU
+
+
+def _remember(rows) -> None:
+    def done():
+        with _lock:
+            for name, item_id, cat in rows:
+                _known[name] = (item_id, cat)
+
+    transaction.on_commit(done)
+
+
+def _lookup(names) -> dict[str, tuple[int, str]]:
+    """names のうち登録済みの (id, 区分)。キャッシュに無いものは DB から引く"""
+    found = {n: _known[n] for n in names if n in _known}
+    missing = [n for n in names if n not in found]
+    if missing:
+        rows = list(Item.objects.filter(name__in=missing).values_list("name", "id", "category"))
+        _remember(rows)
+        found.update((n, (i, c)) for n, i, c in rows)
+    return found
+
+
+def ids_for(names) -> dict[str, int]:
+    """{名前: Item id}。未登録の名前は登録する（空の名前は含めない）"""
+    names = {n for n in names if n}
+    found = _lookup(names)
+    new = names - found.keys()
+    if new:
+        Item.objects.bulk_create(
+            [Item(name=n, category=category_for(n), key=kana.normalize(n)) for n in sorted(new)], ignore_conflicts=True
+        )
+        rows = list(Item.objects.filter(name__in=new).values_list("name", "id", "category"))
+        _remember(rows)
+        found.update((n, (i, c)) for n, i, c in rows)
+    return {n: v[0] for n, v in found.items()}
+
+
+def categories(names) -> dict[str, str]:
+    found = _lookup(set(names))
+    return {n: found[n][1] if n in found else category_for(n) for n in names}
+
+
+def names_for(ids) -> dict[int, str]:
+    """{Item id: 名前}"""
+    ids = set(ids)
+    with _lock:
+        out = {v[0]: n for n, v in _known.items() if v[0] in ids}
+    missing = ids - out.keys()
+    if missing:
+        rows = list(Item.objects.filter(id__in=missing).values_list("name", "id", "category"))
+        _remember(rows)
+        out.update((i, n) for n, i, _ in rows)
+    return out
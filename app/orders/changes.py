@@ -0,0 +1,110 @@
+"""在庫ロット/注文の変更履歴と差分取得
+
+取込・確定・注文登録・取消・アーカイブのたびに、変わったロット（お弁当 + 賞味期限）と注文 id を
+同じトランザクション内で ChangeLog に記録する。ChangeLog.id は単調増加なので、そのまま版として使う。
+
+    changes_since("default", since=120)
+    → {"version": 135, "resync": False, "lots": [...], "deleted_lots": [...], "orders": [...], "deleted_orders": [...]}
+
+記録は最新 ORDERS_CHANGELOG_KEEP 件だけ残す。since がそれより古い、変更が ORDERS_CHANGES_MAX 件を超える、
+全件入れ替え（チャンク取込）をまたぐ場合は resync=True を返すので、クライアントは一覧を取り直す。
+管理画面など ORM を直接使った変更は記録されない。
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from .models import ChangeLog, Inventory, Order
+
+RESET = "*"
+ORDER_COLUMNS = ("id", "name", "okazu", "okazu_expiry", "gohan", "gohan_expiry", "created_at", "confirmed", "cancelled")
+# /api/inventory_csv/lots/ と同じ列
+LOT_COLUMNS = ("item", "expiry", "qty", "refill_line", "alert")
+
+
+def lot_key(item: str, expiry: str) -> str:
+    return f"{item}\t{expiry}"
+
+
+def record(location: str, kind: str, keys) -> None:
+    keys = {str(k) for k in keys}
+    if not keys:
+        return
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(location=location, kind=kind, key=k) for k in sorted(keys)], batch_size=1000
+    )
+    _prune()
+
+
+def record_lots(location: str, lots) -> None:
+    """lots: Inventory または (お弁当, 賞味期限) のイテラブル"""
+    record(location, ChangeLog.LOT, (lot_key(*_lot_ident(x)) for x in lots))
+
+
+def record_lot_reset(location: str) -> None:
+    record(location, ChangeLog.LOT, [RESET])
+
+
+def record_orders(location: str, ids) -> None:
+    record(location, ChangeLog.ORDER, ids)
+
+
+def _lot_ident(x) -> tuple[str, str]:
+    if isinstance(x, Inventory):
+        return x.item, x.expiry
+    return x[0], x[1]
+
+
+def _prune() -> None:
+    keep = int(getattr(settings, "ORDERS_CHANGELOG_KEEP", 50000))
+    agg = ChangeLog.objects.aggregate(first=Min("id"), last=Max("id"))
+    # 毎回は消さず、1割はみ出したらまとめて消す
+    if agg["last"] and agg["last"] - agg["first"] >= keep + keep // 10:
+        ChangeLog.objects.filter(id__lte=agg["last"] - keep).delete()
+
+
+def current_version(location: str | None = None, kind: str | None = None) -> int:
+    qs = ChangeLog.objects.all() if location is None else ChangeLog.objects.filter(location=location)
+    if kind is not None:
+        qs = qs.filter(kind=kind)
+    return qs.aggregate(m=Max("id"))["m"] or 0
+
+
+def changes_since(location: str, since: int) -> dict:
+    version = current_version()
+    out = {"version": version, "resync": False}
+    # 古い記録は消えている（先頭から消すので、最小 id の直前までしか差分を出せない）
+    oldest = ChangeLog.objects.aggregate(m=Min("id"))["m"]
+    if since > version or (oldest is not None and since < oldest - 1):
+        out["resync"] = True
+        return out
+
+    log = ChangeLog.objects.filter(location=location, id__gt=since)
+    lot_keys = set(log.filter(kind=ChangeLog.LOT).values_list("key", flat=True).distinct())
+    order_ids = {int(k) for k in log.filter(kind=ChangeLog.ORDER).values_list("key", flat=True).distinct()}
+    limit = int(getattr(settings, "ORDERS_CHANGES_MAX", 5000))
+    if RESET in lot_keys or len(lot_keys) + len(order_ids) > limit:
+        out["resync"] = True
+        return out
+
+    idents = [tuple(k.split("\t", 1)) for k in lot_keys]
+    lots = []
+    if idents:
+        found = {}
+        qs = Inventory.objects.filter(
+            location=location, item__in={i for i, _ in idents}, expiry__in={e for _, e in idents}
+        ).values_list(*LOT_COLUMNS)
+        for row in qs:
+            if lot_key(row[0], row[1]) in lot_keys:
+                found[(row[0], row[1])] = (*row[:4], row[4] or "")
+        lots = [found[i] for i in sorted(found)]
+        out["deleted_lots"] = sorted([list(i) for i in idents if i not in found])
+    else:
+        out["deleted_lots"] = []
+    out["lots"] = lots
+
+    orders = list(Order.objects.filter(location=location, id__in=order_ids).order_by("id").values_list(*ORDER_COLUMNS))
+    out["orders"] = orders
+    out["deleted_orders"] = sorted(order_ids - {o[0] for o in orders})
+    return out
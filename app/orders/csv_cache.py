@@ -0,0 +1,147 @@
+"""CSVのパース結果サイドカーキャッシュ
+
+zaikokanri.csv の隣に .zaikokanri.csv.cache.parquet（pyarrow が無ければ .rows.json）と
+.zaikokanri.csv.cache.json（元CSVの size / mtime_ns / blake2b）を置き、
+元CSVが変わっていなければパース済みの CsvTable をそのまま読む。
+
+- size と mtime が一致 → 有効
+- size は同じで mtime だけ違う（上書き保存しただけ等）→ 内容ハッシュが一致すれば有効
+
+サイドカーはデータディレクトリ（利用者が書き込める場所）に置くので、読み込んでもコードが実行されない
+形式（parquet / JSON）だけを使う。pickle は使わない。
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+from .csv_engine import CsvTable
+
+# キャッシュの中身の形式が変わったら上げる（古いサイドカーは無効になる）
+SCHEMA = 3
+
+
+def _has_pyarrow() -> bool:
+    # pyarrow 自体の import は重いので有無だけ調べる
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "ORDERS_CSV_SIDECAR_CACHE", True))
+
+
+def _meta_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.cache.json")
+
+
+def _data_path(path: Path, fmt: str) -> Path:
+    return path.with_name(f".{path.name}.cache.{fmt}")
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def load(path: Path):
+    """有効なキャッシュがあれば CsvTable、無ければ None"""
+    sig = signature(path)
+    if sig is None:
+        return None
+    meta_path = _meta_path(path)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+    if meta.get("schema") != SCHEMA or meta.get("size") != sig[0]:
+        return None
+    if meta.get("mtime_ns") != sig[1]:
+        try:
+            if meta.get("hash") != file_hash(path):
+                return None
+        except OSError:
+            return None
+        # 内容は同じなので mtime を更新して次回はハッシュ不要に
+        meta["mtime_ns"] = sig[1]
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    data_path = _data_path(path, meta.get("format", ""))
+    try:
+        if meta["format"] == "parquet":
+            import pyarrow.parquet as pq
+
+            cols = pq.read_table(data_path).columns
+            rows = [list(r) for r in zip(*(c.to_pylist() for c in cols))]
+            return CsvTable(list(meta["columns"]), rows, meta.get("encoding"))
+        rows = json.loads(data_path.read_bytes())
+        return CsvTable(list(meta["columns"]), rows, meta.get("encoding"))
+    except Exception:
+        return None
+
+
+def store(path: Path, table: CsvTable, sig: tuple[int, int] | None) -> None:
+    """table を保存。sig はパース前に取った signature()（途中でCSVが変わっていたら保存しない）"""
+    if sig is None or signature(path) != sig:
+        return
+    try:
+        digest = file_hash(path)
+    except OSError:
+        return
+    if signature(path) != sig:
+        return
+
+    fmt = None
+    if _has_pyarrow():
+        tmp = _data_path(path, "parquet.tmp")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # 列名は空/重複がありうるので位置で保存し、本当の列名は meta に持つ
+            data = {f"c{i}": pa.array([r[i] for r in table.rows], type=pa.string()) for i in range(len(table.columns))}
+            pq.write_table(pa.table(data), tmp)
+            os.replace(tmp, _data_path(path, "parquet"))
+            fmt = "parquet"
+        except Exception:
+            tmp.unlink(missing_ok=True)
+    if fmt is None:
+        tmp = _data_path(path, "rows.json.tmp")
+        try:
+            tmp.write_bytes(json.dumps(table.rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            os.replace(tmp, _data_path(path, "rows.json"))
+            fmt = "rows.json"
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            return
+
+    meta = {
+        "schema": SCHEMA, "size": sig[0], "mtime_ns": sig[1], "hash": digest, "format": fmt,
+        "columns": table.columns, "encoding": table.encoding,
+    }
+    _write_atomic(_meta_path(path), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+
+def _write_atomic(dst: Path, data: bytes) -> None:
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, dst)
+    except OSError:
+        tmp.unlink(missing_ok=True)
@@ -0,0 +1,310 @@
+"""CSVの読み書きエンジン（pandas / 標準ライブラリ csv）
+
+どちらのエンジンも CsvTable（列名 + 行のリスト、値は文字列・空欄は None）を返すので、
+services 側はエンジンを意識しない。
+
+- 文字コード: utf-8-sig → cp932 → utf-8 の順に試し、だめなら utf-8 で読めない文字を捨てる
+- 列名: 空の列名は pandas と同じく "Unnamed: <位置>"、重複は "<名前>.1" のように番号を付ける
+- 空行は読み飛ばす。列が足りない行は None で埋める
+- ファイル名が .gz で終わるものは gzip として読み書きする
+
+大きなCSVは iter_chunks() で一定行数ずつ読み、write_stream() で行を流しながら書けば
+ファイルサイズに関係なくメモリ使用量が一定になる。
+
+settings.ORDERS_CSV_ENGINE = "auto" | "pandas" | "stdlib"
+（auto は pandas がインストールされていれば pandas、無ければ stdlib）
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import gzip
+import importlib.util
+import io
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+ENCODINGS = ("utf-8-sig", "cp932", "utf-8")
+# 書き出すCSVの文字コード（どちらのエンジンも同じ）
+WRITE_ENCODING = "utf-8-sig"
+# iter_chunks() はこの大きさの先頭（.gz は展開後）で文字コードを決める
+SNIFF_BYTES = 1 << 20
+# iter_chunks() の既定の行数
+CHUNK_ROWS = 5000
+
+
+class CsvTable:
+    """encoding は読んだときの文字コード（分からなければ None。追記分を同じ文字コードで読むため）"""
+
+    __slots__ = ("columns", "rows", "encoding")
+
+    def __init__(self, columns: list[str], rows: list[list], encoding: str | None = None):
+        self.columns = columns
+        self.rows = rows
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def empty(self) -> bool:
+        return not self.rows or not self.columns
+
+    def index(self, name: str, default: int | None = None) -> int | None:
+        try:
+            return self.columns.index(name)
+        except ValueError:
+            return default
+
+    def __eq__(self, other):
+        return isinstance(other, CsvTable) and self.columns == other.columns and self.rows == other.rows
+
+
+def _dedupe_columns(header: list[str]) -> list[str]:
+    cols = []
+    seen: dict[str, int] = {}
+    for i, name in enumerate(header):
+        name = name if name != "" else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        cols.append(name)
+    return cols
+
+
+def is_gzip(path: Path) -> bool:
+    return Path(path).name.endswith(".gz")
+
+
+def _open_binary(path: Path, mode: str = "rb", compressed: bool | None = None):
+    if compressed is None:
+        compressed = is_gzip(path)
+    return gzip.open(path, mode) if compressed else open(path, mode)
+
+
+def _read_bytes(path: Path) -> bytes:
+    with _open_binary(path) as f:
+        return f.read()
+
+
+def sniff_encoding(head: bytes, final: bool = False) -> str | None:
+    """先頭のバイト列が通る最初の文字コード。どれもだめなら None
+
+    final=False なら末尾で切れた多バイト文字は問わない（続きがあるブロック用）。
+    """
+    for enc in ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(head, final=final)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+class _Prefixed(io.RawIOBase):
+    """覗き見た先頭 head を返してから raw の続きを読む（.gz を展開し直さないため）"""
+
+    def __init__(self, head: bytes, raw):
+        self._head = memoryview(head)
+        self._raw = raw
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        return self._raw.readinto(b)
+
+
+@contextmanager
+def open_text(path: Path):
+    """先頭 SNIFF_BYTES で決めた文字コードで開いたテキストストリーム（全体を読み込まず、展開も1回だけ）
+
+    先頭では読めたのに後ろに読めないバイトがあれば UnicodeDecodeError（取込はロールバックされる）。
+    """
+    with _open_binary(path) as raw:
+        head = raw.read(SNIFF_BYTES)
+        enc = sniff_encoding(head, final=len(head) < SNIFF_BYTES)
+        f = io.TextIOWrapper(
+            io.BufferedReader(_Prefixed(head, raw)), encoding=enc or "utf-8", errors="strict" if enc else "ignore", newline=""
+        )
+        try:
+            yield f
+        finally:
+            f.detach()
+
+
+def _stream_encoding(f) -> str | None:
+    # open_text() が文字コードを決められず読めない文字を捨てている場合は None
+    return f.encoding if f.errors == "strict" else None
+
+
+def _decode(data: bytes) -> tuple[str, str | None]:
+    """(テキスト, 文字コード)。どれでも読めなければ utf-8 で読めない文字を捨て、文字コードは None"""
+    for enc in ENCODINGS:
+        try:
+            return data.decode(enc), enc
+        except UnicodeDecodeError:
+            pass
+    return data.decode("utf-8", errors="ignore"), None
+
+
+class StdlibEngine:
+    name = "stdlib"
+
+    def read(self, path: Path) -> CsvTable:
+        text, enc = _decode(_read_bytes(path))
+        reader = csv.reader(io.StringIO(text, newline=""))
+        header, rows = _parse(reader, None)
+        if header is None:
+            return CsvTable([], [], enc)
+        return CsvTable(header, rows, enc)
+
+    def iter_chunks(self, path: Path, chunk_rows: int = CHUNK_ROWS):
+        with open_text(path) as f:
+            enc = _stream_encoding(f)
+            reader = csv.reader(f)
+            header = None
+            while True:
+                header, rows = _parse(reader, chunk_rows, header)
+                if not rows:
+                    return
+                yield CsvTable(header, rows, enc)
+
+    def write(self, path: Path, table: CsvTable, compressed: bool | None = None) -> None:
+        write_stream(path, table.columns, table.rows, compressed=compressed)
+
+
+def _parse(reader, limit: int | None, header: list[str] | None = None):
+    """reader から最大 limit 行（None なら全部）読む。header が None なら先頭行を列名にする"""
+    rows = []
+    for rec in reader:
+        if not rec:
+            continue
+        if header is None:
+            header = _dedupe_columns(rec)
+            continue
+        width = len(header)
+        row = [v if v != "" else None for v in rec[:width]]
+        if len(row) < width:
+            row.extend([None] * (width - len(row)))
+        rows.append(row)
+        if limit is not None and len(rows) >= limit:
+            break
+    return header, rows
+
+
+def read_rows(data: bytes, columns: list[str], encoding: str | None = None) -> CsvTable | None:
+    """ヘッダ行の無いCSV断片（追記された行など）を columns の列として読む
+
+    encoding は全件取込のときの文字コード（CsvIngestState.encoding）。その文字コードで読めなければ None。
+    encoding が分からないときだけ断片から推測する（短い断片だと取り違えうる）。どれでも読めなければ None。
+    """
+    if encoding:
+        try:
+            text = data.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            return None
+        enc = encoding
+    else:
+        enc = sniff_encoding(data, final=True)
+        if enc is None:
+            return None
+        text = data.decode(enc)
+    _, rows = _parse(csv.reader(io.StringIO(text, newline="")), None, list(columns))
+    return CsvTable(list(columns), rows, enc)
+
+
+def write_stream(path: Path, columns: list[str], rows, compressed: bool | None = None) -> int:
+    """rows（イテラブル）を流しながら書く。どちらのエンジンの出力とも同じ形式。書いた行数を返す"""
+    n = 0
+    with _open_binary(path, "wb", compressed) as raw:
+        f = io.TextIOWrapper(raw, encoding=WRITE_ENCODING, newline="")
+        w = csv.writer(f, lineterminator=os.linesep)
+        w.writerow(columns)
+        for r in rows:
+            w.writerow(["" if v is None else v for v in r])
+            n += 1
+        f.flush()
+        f.detach()
+    return n
+
+
+class PandasEngine:
+    name = "pandas"
+
+    def read(self, path: Path) -> CsvTable:
+        import pandas as pd
+
+        # 全列を文字列で読み、空欄だけを欠損扱いにする（stdlib と同じ結果になるように）
+        opts = {"dtype": str, "keep_default_na": False, "na_values": [""]}
+        df = None
+        for enc in ENCODINGS:
+            try:
+                df = pd.read_csv(path, encoding=enc, **opts)
+                break
+            except pd.errors.EmptyDataError:
+                return CsvTable([], [], enc)
+            except Exception:
+                pass
+        if df is None:
+            enc = None
+            df = pd.read_csv(path, encoding="utf-8", encoding_errors="ignore", **opts)
+        return _to_table(df, enc)
+
+    def iter_chunks(self, path: Path, chunk_rows: int = CHUNK_ROWS):
+        import pandas as pd
+
+        opts = {"dtype": str, "keep_default_na": False, "na_values": [""], "chunksize": chunk_rows}
+        # 文字コードの判定と .gz の展開は open_text() で1回だけ（pandas にはテキストで渡す）
+        with open_text(path) as f:
+            enc = _stream_encoding(f)
+            try:
+                reader = pd.read_csv(f, **opts)
+            except pd.errors.EmptyDataError:
+                return
+            with reader:
+                for df in reader:
+                    # ヘッダ行だけのファイルでも空のチャンクは返さない（stdlib と同じ）
+                    if len(df):
+                        yield _to_table(df, enc)
+
+    def write(self, path: Path, table: CsvTable, compressed: bool | None = None) -> None:
+        import pandas as pd
+
+        if compressed is None:
+            compressed = is_gzip(path)
+        df = pd.DataFrame(table.rows, columns=table.columns)
+        df.to_csv(
+            path, index=False, encoding=WRITE_ENCODING, lineterminator=os.linesep, compression="gzip" if compressed else None
+        )
+
+
+def _to_table(df, encoding: str | None = None) -> CsvTable:
+    df = df.astype(object).where(df.notna(), None)
+    return CsvTable([str(c) for c in df.columns], df.values.tolist(), encoding)
+
+
+ENGINES = {"stdlib": StdlibEngine, "pandas": PandasEngine}
+
+
+def has_pandas() -> bool:
+    return importlib.util.find_spec("pandas") is not None
+
+
+def get_engine(name: str | None = None):
+    name = (name or getattr(settings, "ORDERS_CSV_ENGINE", "auto") or "auto").lower()
+    if name == "auto":
+        name = "pandas" if has_pandas() else "stdlib"
+    if name == "pandas" and not has_pandas():
+        name = "stdlib"
+    return ENGINES[name]()
@@ -0,0 +1,97 @@
+"""末尾に行が足されるだけのCSVの差分取込
+
+取込のたびに「先頭から offset バイト（行の区切りまで）」の blake2b を CsvIngestState に残す。
+次の取込でファイルが伸びていて、先頭 offset バイトのハッシュが前回と同じなら
+（= 既存の行はそのままで末尾に追記されただけなら）offset 以降の行だけを読めばよい。
+
+先頭部分は mmap してハッシュする（ファイル全体を Python のバッファに読み込まない）。
+書きかけの最終行は取り込まず、次回に回す。gzip は対象外（常に全件取込）。
+
+区切りは最後の改行で決めるので、改行を含むクォート付きの値（"のり弁\n（二段）"）の途中で
+切れることがある。ダブルクォートの数が奇数（閉じていない）なら差分取込はせず全件取込に回す
+（値の中の " は "" と書かれるので、閉じていれば数は偶数。cp932 の2バイト目にも 0x22 は出てこない）。
+"""
+from __future__ import annotations
+
+import hashlib
+import mmap
+from dataclasses import dataclass
+from pathlib import Path
+
+from .csv_engine import is_gzip
+
+_BLOCK = 1 << 20
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    offset: int
+    prefix_hash: str
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _feed(h, mv, start: int, end: int, quotes: bool = False) -> int:
+    """mv[start:end] をハッシュに足す。quotes=True ならその中のダブルクォートの数を返す"""
+    n = 0
+    for i in range(start, end, _BLOCK):
+        block = mv[i:min(i + _BLOCK, end)]
+        h.update(block)
+        if quotes:
+            n += bytes(block).count(b'"')
+    return n
+
+
+def snapshot(path: Path) -> Snapshot | None:
+    """全件取込した直後のファイルの状態。最終行が改行で終わっていない/クォートが閉じていない/gzip/空なら None（次回も全件取込）"""
+    if is_gzip(path):
+        return None
+    try:
+        with path.open("rb") as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return None
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+                if m[size - 1:size] != b"\n":
+                    return None
+                h = _hasher()
+                with memoryview(m) as mv:
+                    quotes = _feed(h, mv, 0, size, quotes=True)
+    except (OSError, ValueError):
+        return None
+    if quotes % 2:
+        return None
+    return Snapshot(size, h.hexdigest())
+
+
+def appended(path: Path, offset: int, prefix_hash: str) -> tuple[bytes, Snapshot] | None:
+    """先頭 offset バイトが前回と同じで、後ろに完結した行が足されていれば (追記分のバイト列, 新しい状態)
+
+    それ以外（書き換え・切り詰め・変化なし・追記分のクォートが閉じていない）は None
+    """
+    if is_gzip(path) or offset <= 0:
+        return None
+    try:
+        with path.open("rb") as f:
+            size = f.seek(0, 2)
+            if size <= offset:
+                return None
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+                h = _hasher()
+                with memoryview(m) as mv:
+                    _feed(h, mv, 0, offset)
+                    if h.hexdigest() != prefix_hash:
+                        return None
+                    # 書きかけの行は次回に回す
+                    end = m.rfind(b"\n", offset) + 1
+                    if end <= offset:
+                        return b"", Snapshot(offset, prefix_hash)
+                    if _feed(h, mv, offset, end, quotes=True) % 2:
+                        # 改行を含む値の途中で切れている
+                        return None
+                    tail = m[offset:end]
+    except (OSError, ValueError):
+        return None
+    return tail, Snapshot(end, h.hexdigest())
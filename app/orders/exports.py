@@ -0,0 +1,150 @@
+"""data/exports の出力ファイル管理
+
+- 内容（sha256）が前回と同じなら新しいファイルを作らず前回のファイルを返す
+- exports/manifest.json に prefix ごとの最新ファイルを記録（最新の検索はディレクトリ走査不要）
+- 新しく書いたときに古いファイルを掃除（直近 ORDERS_EXPORT_KEEP 件・ORDERS_EXPORT_MAX_AGE_DAYS 日以内だけ残す）
+  期限内の完了済み ExportJob がダウンロード用に指しているファイルは件数を超えても残す
+- manifest の読み→書き→置き換えと掃除は locks.resource_lock（exports/manifest.lock）の中で行う
+  （同じ exports ディレクトリに書く別プロセス/別ホストのワーカーが互いの記録を消さない）
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .locks import resource_lock
+
+MANIFEST = "manifest.json"
+
+
+def render_csv(header: list[str], rows) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(header)
+    for r in rows:
+        w.writerow(r)
+    return buf.getvalue().encode("utf-8-sig")
+
+
+def read_manifest(exports_dir: Path) -> dict:
+    try:
+        return json.loads((exports_dir / MANIFEST).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _write_manifest(exports_dir: Path, manifest: dict) -> None:
+    tmp = exports_dir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, exports_dir / MANIFEST)
+
+
+def _manifest_lock(exports_dir: Path):
+    key = hashlib.sha256(str(Path(exports_dir).resolve()).encode("utf-8")).hexdigest()[:16]
+    return resource_lock(f"exports:{key}", file=exports_dir / "manifest")
+
+
+def write_export(exports_dir: Path, prefix: str, data: bytes) -> Path:
+    """data を prefix_YYYYmmdd_HHMMSS.csv として保存。前回と同じ内容なら前回のファイルを返す"""
+    digest = hashlib.sha256(data).hexdigest()
+    entry = read_manifest(exports_dir).get(prefix)
+    if entry and entry.get("sha256") == digest:
+        p = exports_dir / entry["file"]
+        if p.exists():
+            return p
+
+    exports_dir.mkdir(parents=True, exist_ok=True)
+    with _manifest_lock(exports_dir):
+        manifest = read_manifest(exports_dir)
+        entry = manifest.get(prefix)
+        if entry and entry.get("sha256") == digest and (exports_dir / entry["file"]).exists():
+            return exports_dir / entry["file"]
+
+        ts = timezone.now().strftime("%Y%m%d_%H%M%S")
+        path = exports_dir / f"{prefix}_{ts}.csv"
+        n = 1
+        while path.exists():
+            n += 1
+            path = exports_dir / f"{prefix}_{ts}_{n}.csv"
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        manifest[prefix] = {"file": path.name, "sha256": digest, "created_at": timezone.now().isoformat(), "bytes": len(data)}
+        _write_manifest(exports_dir, manifest)
+        sweep_exports(exports_dir, prefix, keep_names={path.name})
+    return path
+
+
+def latest_export(exports_dir: Path, prefix: str) -> Path | None:
+    entry = read_manifest(exports_dir).get(prefix)
+    if entry:
+        p = exports_dir / entry["file"]
+        if p.exists():
+            return p
+    # manifest 導入前のファイル
+    if not exports_dir.exists():
+        return None
+    files = sorted(exports_dir.glob(f"{prefix}_*.csv"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return files[0] if files else None
+
+
+def _job_files(names: list[str], max_age: float) -> set[str]:
+    """names のうち、完了から max_age 秒以内の ExportJob がダウンロード用に指しているファイル名"""
+    from .models import ExportJob
+
+    if not names:
+        return set()
+    since = timezone.now() - timedelta(seconds=max_age)
+    return set(
+        ExportJob.objects.filter(status=ExportJob.DONE, file__in=names, finished_at__gte=since).values_list("file", flat=True)
+    )
+
+
+def sweep_exports(exports_dir: Path, prefix: str, keep_names: set[str] | None = None) -> int:
+    """prefix の古い出力を削除。新しい順に ORDERS_EXPORT_KEEP 件まで、かつ ORDERS_EXPORT_MAX_AGE_DAYS 日以内のものだけ残す
+
+    manifest に載っている最新ファイルと、期限内の完了済みジョブが指すファイル（max_age 以内）は残す。
+    write_export から manifest のロックを持ったまま呼ぶ。
+    """
+    keep = int(getattr(settings, "ORDERS_EXPORT_KEEP", 20))
+    max_age = float(getattr(settings, "ORDERS_EXPORT_MAX_AGE_DAYS", 30)) * 86400
+    keep_names = set(keep_names or ())
+    entry = read_manifest(exports_dir).get(prefix)
+    if entry:
+        keep_names.add(entry["file"])
+
+    files = []
+    for p in exports_dir.glob(f"{prefix}_*.csv"):
+        try:
+            files.append((p.stat().st_mtime, p))
+        except OSError:
+            pass
+    files.sort(reverse=True)
+
+    now = time.time()
+    doomed = [
+        (mtime, p) for i, (mtime, p) in enumerate(files)
+        if p.name not in keep_names and not (i < keep and now - mtime < max_age)
+    ]
+    # 件数で押し出されるだけのファイルは、まだジョブから落とせるなら残す
+    referenced = _job_files([p.name for mtime, p in doomed if now - mtime < max_age], max_age)
+    removed = 0
+    for mtime, p in doomed:
+        if p.name in referenced:
+            continue
+        try:
+            p.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,218 @@
+"""CSV出力ジョブ（ExportJob）
+
+enqueue_export() でジョブを登録し、プロセス内スレッドプール
+（settings.ORDERS_EXPORT_WORKERS、0 なら使わない）か
+`python manage.py run_export_worker` が queued のジョブを処理する。
+
+同じ拠点/種類/条件で、データ版（services.data_version）も同じ完了済み・実行中のジョブが
+あれば新しく作らずそれを返す。ただし queued/running のまま ORDERS_EXPORT_STALE_SECONDS 秒
+更新（updated_at）が無いジョブはワーカーが落ちたとみなして failed にし、新しく登録する。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import exports, services
+from .locations import DEFAULT_LOCATION, get_location
+from .models import ExportJob
+
+# 種類 → 出力ファイル名の prefix
+KINDS = {
+    "history": "order_history",
+    "ranking": "ranking",
+    "expiry": "expiry",
+    "purchase_candidates": "purchase_candidates",
+}
+# 在庫由来の出力は残日数が日付で変わるので当日を条件に含める
+_DATED_KINDS = {"expiry", "purchase_candidates"}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+class UnknownExportKind(ValueError):
+    pass
+
+
+class InvalidExportParams(ValueError):
+    """params の値が読めない（日付・日数・モード）"""
+
+
+def _params_key(kind: str, params: dict) -> str:
+    raw = json.dumps([kind, params], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _clean_params(kind: str, params: dict) -> dict:
+    if kind == "history":
+        keys = ("name", "start", "end", "q", "archive")
+    elif kind == "ranking":
+        keys = ("start", "end", "archive")
+    elif kind == "expiry":
+        keys = ("mode", "days")
+    else:
+        keys = ()
+    out = {k: str(params.get(k) or "") for k in keys}
+    if "archive" in out:
+        # 期間を指定しないときにアーカイブ済みの月も含めるか（"1" / ""）
+        out["archive"] = "1" if out["archive"] in ("1", "true", "True") else ""
+    for k in ("start", "end"):
+        if out.get(k):
+            try:
+                ok = parse_date(out[k]) is not None
+            except ValueError:
+                ok = False
+            if not ok:
+                raise InvalidExportParams(f"invalid {k}")
+    if kind == "expiry":
+        out["mode"] = (out["mode"] or "near").lower()
+        if out["mode"] not in ("near", "expired"):
+            raise InvalidExportParams("invalid mode")
+        try:
+            out["days"] = str(int(out["days"] or 3))
+        except ValueError:
+            raise InvalidExportParams("invalid days") from None
+    if kind in _DATED_KINDS:
+        out["today"] = date.today().isoformat()
+    return out
+
+
+def enqueue_export(kind: str, params: dict | None = None, location: str = DEFAULT_LOCATION) -> ExportJob:
+    if kind not in KINDS:
+        raise UnknownExportKind(kind)
+    loc = get_location(location)
+    params = _clean_params(kind, params or {})
+    key = _params_key(kind, params)
+    version = services.data_version(loc.code)
+
+    reusable = (
+        ExportJob.objects.filter(location=loc.code, kind=kind, params_key=key, data_version=version)
+        .exclude(status=ExportJob.FAILED)
+        .order_by("-created_at")
+        .first()
+    )
+    if reusable and reusable.status != ExportJob.DONE and _is_stale(reusable):
+        # ワーカーが落ちて queued/running のまま残ったジョブ（既に他で更新されていたら触らない）
+        ExportJob.objects.filter(id=reusable.id, status=reusable.status, updated_at=reusable.updated_at).update(
+            status=ExportJob.FAILED, error="stale", finished_at=timezone.now(), updated_at=timezone.now()
+        )
+        reusable = None
+    if reusable and (reusable.status != ExportJob.DONE or (loc.exports_dir / reusable.file).exists()):
+        return reusable
+
+    job = ExportJob.objects.create(location=loc.code, kind=kind, params=params, params_key=key, data_version=version)
+    if int(getattr(settings, "ORDERS_EXPORT_WORKERS", 2)) > 0:
+        _pool().submit(_run_in_thread, job.id)
+    return job
+
+
+def _is_stale(job: ExportJob) -> bool:
+    timeout = float(getattr(settings, "ORDERS_EXPORT_STALE_SECONDS", 600))
+    return job.updated_at < timezone.now() - timedelta(seconds=timeout)
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getattr(settings, "ORDERS_EXPORT_WORKERS", 2)),
+                thread_name_prefix="export",
+            )
+        return _executor
+
+
+def _run_in_thread(job_id: int) -> None:
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_next() -> ExportJob | None:
+    """queued の一番古いジョブを running にして返す（他ワーカーと取り合っても1つだけが取れる）"""
+    for job_id in ExportJob.objects.filter(status=ExportJob.QUEUED).order_by("created_at").values_list("id", flat=True)[:10]:
+        if _claim(job_id):
+            return ExportJob.objects.get(id=job_id)
+    return None
+
+
+def _claim(job_id: int) -> bool:
+    now = timezone.now()
+    n = ExportJob.objects.filter(id=job_id, status=ExportJob.QUEUED).update(
+        status=ExportJob.RUNNING, started_at=now, progress=0, updated_at=now
+    )
+    return n == 1
+
+
+def run_job(job_id: int, claimed: bool = False) -> None:
+    if not claimed and not _claim(job_id):
+        return
+    job = ExportJob.objects.get(id=job_id)
+
+    last = [0]
+
+    def progress(done: int, total: int):
+        pct = min(99, int(done * 100 / total)) if total else 0
+        if pct >= last[0] + 5:
+            last[0] = pct
+            ExportJob.objects.filter(id=job_id).update(progress=pct, updated_at=timezone.now())
+
+    # stale として failed にされた後に終わった場合は上書きしない（新しいジョブが作られている）
+    running = ExportJob.objects.filter(id=job_id, status=ExportJob.RUNNING)
+    try:
+        path = _produce(job, progress)
+    except Exception as e:
+        now = timezone.now()
+        running.update(status=ExportJob.FAILED, error=str(e), finished_at=now, updated_at=now)
+        return
+    now = timezone.now()
+    running.update(status=ExportJob.DONE, progress=100, file=path.name, finished_at=now, updated_at=now)
+
+
+def _produce(job: ExportJob, progress):
+    loc = get_location(job.location)
+    p = job.params
+    if job.kind == "purchase_candidates":
+        return services.export_purchase_candidates_csv(loc.code)
+    if job.kind == "history":
+        header = services.HISTORY_HEADER
+        rows = services.history_rows(
+            loc.code, p.get("name", ""), p.get("start", ""), p.get("end", ""), progress=progress, q=p.get("q", ""),
+            with_archive=p.get("archive") == "1",
+        )
+    elif job.kind == "ranking":
+        header = services.RANKING_HEADER
+        rows = services.ranking_rows(loc.code, p.get("start", ""), p.get("end", ""), with_archive=p.get("archive") == "1")
+    elif job.kind == "expiry":
+        header = services.EXPIRY_HEADER
+        rows = services.expiry_rows(p.get("mode", "near"), int(p.get("days") or 3), location=loc.code)
+    else:
+        raise UnknownExportKind(job.kind)
+    prefix = KINDS[job.kind]
+    if job.kind == "expiry":
+        prefix = f"expiry_{p.get('mode', 'near')}"
+    return exports.write_export(loc.exports_dir, prefix, exports.render_csv(header, rows))
+
+
+def job_dict(job: ExportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "progress": job.progress,
+        "file": job.file,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,21 @@
+"""検索用の文字列正規化
+
+- NFKC（半角カナ → 全角、全角英数 → 半角）
+- カタカナ → ひらがな、英字は小文字
+- 空白（全角含む）を除く
+
+    normalize("ナカムラ 太郎") == normalize("なかむら太郎") == "なかむら太郎"
+"""
+from __future__ import annotations
+
+import unicodedata
+
+# ァ(U+30A1)〜ヶ(U+30F6) → ぁ〜ゖ
+_KATA_TO_HIRA = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}
+
+
+def normalize(s: str | None) -> str:
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKC", s).translate(_KATA_TO_HIRA).casefold()
+    return "".join(s.split())
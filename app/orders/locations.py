@@ -0,0 +1,104 @@
+"""拠点（店舗/倉庫）ごとのCSV配置とロック/キャッシュ
+
+settings.ORDERS_LOCATIONS に拠点コード → データディレクトリを登録する。
+
+    ORDERS_LOCATIONS = {
+        "default": {"name": "本店", "data_dir": BASE_DIR / "data"},
+        "kita": {"name": "北倉庫", "data_dir": "D:/zaiko/kita",
+                 "zaiko_csv": "D:/zaiko/kita/zaikokanri.csv"},
+    }
+
+zaiko_csv / meibo_csv を省略した場合は data_dir 直下の zaikokanri.csv / meibo.csv。
+zaikokanri.csv が無く zaikokanri.csv.gz がある場合はそちらを使う（gzip のまま読み書きする）。
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULT_LOCATION = "default"
+
+
+class UnknownLocation(KeyError):
+    """登録されていない拠点コード"""
+
+
+@dataclass(frozen=True)
+class Location:
+    code: str
+    name: str
+    data_dir: Path
+    zaiko_csv: Path
+    meibo_csv: Path
+
+    @property
+    def exports_dir(self) -> Path:
+        return self.data_dir / "exports"
+
+
+@dataclass
+class LocationState:
+    """拠点ごとのプロセス内状態（拠点間で互いにブロックしない）"""
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    cache: dict = field(default_factory=dict)
+
+
+_states: dict[str, LocationState] = {}
+_states_lock = threading.Lock()
+
+
+def _default_data_dir() -> Path:
+    try:
+        return Path(settings.BASE_DIR) / "data"
+    except Exception:
+        # settings 未初期化時の保険
+        return Path(__file__).resolve().parent.parent / "data"
+
+
+def _registry() -> dict[str, dict]:
+    conf = getattr(settings, "ORDERS_LOCATIONS", None)
+    if not conf:
+        conf = {DEFAULT_LOCATION: {"name": DEFAULT_LOCATION, "data_dir": _default_data_dir()}}
+    return conf
+
+
+def _zaiko_path(data_dir: Path) -> Path:
+    path = data_dir / "zaikokanri.csv"
+    gz = data_dir / "zaikokanri.csv.gz"
+    if not path.exists() and gz.exists():
+        return gz
+    return path
+
+
+def _build(code: str, conf: dict) -> Location:
+    data_dir = Path(conf.get("data_dir") or _default_data_dir() / code)
+    return Location(
+        code=code,
+        name=str(conf.get("name") or code),
+        data_dir=data_dir,
+        zaiko_csv=Path(conf.get("zaiko_csv") or _zaiko_path(data_dir)),
+        meibo_csv=Path(conf.get("meibo_csv") or data_dir / "meibo.csv"),
+    )
+
+
+def get_location(code: str | None = None) -> Location:
+    code = (code or DEFAULT_LOCATION).strip()
+    conf = _registry().get(code)
+    if conf is None:
+        raise UnknownLocation(code)
+    return _build(code, conf)
+
+
+def all_locations() -> list[Location]:
+    return [_build(code, conf) for code, conf in _registry().items()]
+
+
+def state_for(code: str) -> LocationState:
+    st = _states.get(code)
+    if st is None:
+        with _states_lock:
+            st = _states.setdefault(code, LocationState())
+    return st
@@ -0,0 +1,224 @@
+"""CSV/DBリソースのロック（複数ワーカー対応）
+
+resource_lock() は次の3段でロックを取る。
+  1. プロセス内ロック（threading.RLock）
+  2. ファイルロック（<CSV>.lock を flock / msvcrt.locking）… 同一ホストの別プロセス
+  3. DBアドバイザリ行（ResourceLock）… DBを共有する別ホスト
+
+同一スレッド内の再取得は素通し（confirm → reload → write-back の入れ子用）。
+DB行はトランザクション外（autocommit）で取る前提。
+
+DB行は ORDERS_LOCK_TTL 秒で期限切れになり、他のワーカーが奪える（持ち主のプロセスが落ちた場合の回復用）。
+TTL より長くかかりうる処理はチャンクごとなどに heartbeat() を呼んで期限を延ばす。
+延ばす前に奪われていたら LockLost で処理を止める。
+"""
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_POLL = 0.05
+
+
+class LockTimeout(Exception):
+    """ロック待ちがタイムアウトした"""
+
+    def __init__(self, name: str, waited: float):
+        super().__init__(f"lock timeout: {name} ({waited:.1f}s)")
+        self.name = name
+        self.waited = waited
+
+
+class LockLost(Exception):
+    """TTL が切れて他のワーカーにロックを奪われていた"""
+
+    def __init__(self, name: str):
+        super().__init__(f"lock lost: {name}")
+        self.name = name
+
+
+_stats: dict[str, dict] = {}
+_stats_lock = threading.Lock()
+_local_locks: dict[str, threading.RLock] = {}
+# スレッドが持っているロック名 → [DB行の owner, 最後に期限を延ばした time.monotonic()]
+_held = threading.local()
+
+
+def _record(name: str, waited: float, ok: bool) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(name, {"acquired": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0})
+        s["acquired" if ok else "timeouts"] += 1
+        s["wait_total"] += waited
+        s["wait_max"] = max(s["wait_max"], waited)
+
+
+def lock_stats() -> dict[str, dict]:
+    """ロック名ごとの取得回数/タイムアウト回数/待ち時間(秒)"""
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+def _local_lock(name: str) -> threading.RLock:
+    with _stats_lock:
+        return _local_locks.setdefault(name, threading.RLock())
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+
+
+def _try_file_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _file_unlock(fd: int) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+def _try_db_lock(name: str, owner: str, ttl: int) -> bool:
+    from .models import ResourceLock
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            ResourceLock.objects.create(name=name, owner=owner, acquired_at=now, expires_at=now + timedelta(seconds=ttl))
+        return True
+    except IntegrityError:
+        # 期限切れ（プロセスが落ちた等）の行は奪ってよい
+        ResourceLock.objects.filter(name=name, expires_at__lt=now).delete()
+        return False
+
+
+def _renew_db_lock(name: str, owner: str, ttl: int) -> bool:
+    from .models import ResourceLock
+
+    n = ResourceLock.objects.filter(name=name, owner=owner).update(expires_at=timezone.now() + timedelta(seconds=ttl))
+    return n == 1
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "ORDERS_LOCK_TTL", 300))
+
+
+def heartbeat() -> None:
+    """このスレッドが持っているロックの DB 行の期限（expires_at）を延ばす
+
+    前回延ばしてから TTL の 1/3 が過ぎていなければ何もしない（チャンクごとに呼んでもクエリは増えない）。
+    期限切れで他のワーカーに奪われていたら LockLost。
+    """
+    held = getattr(_held, "names", None)
+    if not held:
+        return
+    ttl = _ttl()
+    now = time.monotonic()
+    for name, entry in held.items():
+        owner, renewed = entry
+        if now - renewed < ttl / 3:
+            continue
+        if not _renew_db_lock(name, owner, ttl):
+            raise LockLost(name)
+        entry[1] = now
+
+
+def _db_unlock(name: str, owner: str) -> None:
+    from .models import ResourceLock
+
+    ResourceLock.objects.filter(name=name, owner=owner).delete()
+
+
+@contextmanager
+def resource_lock(name: str, file: Path | None = None, timeout: float | None = None, local: threading.RLock | None = None):
+    """name のロックを取得する。timeout 秒で取れなければ LockTimeout"""
+    if timeout is None:
+        timeout = float(getattr(settings, "ORDERS_LOCK_TIMEOUT", 30))
+    ttl = _ttl()
+    held = getattr(_held, "names", None)
+    if held is None:
+        held = _held.names = {}
+    if name in held:
+        yield
+        return
+
+    started = time.monotonic()
+    deadline = started + timeout
+    local = local or _local_lock(name)
+    if not local.acquire(timeout=max(timeout, 0)):
+        waited = time.monotonic() - started
+        _record(name, waited, False)
+        raise LockTimeout(name, waited)
+
+    fd = None
+    owner = None
+    try:
+        if file is not None:
+            lock_path = Path(file).with_name(Path(file).name + ".lock")
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            while not _try_file_lock(fd):
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(name, time.monotonic() - started)
+                time.sleep(_POLL)
+
+        candidate = _owner()
+        while not _try_db_lock(name, candidate, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name, time.monotonic() - started)
+            time.sleep(_POLL)
+        owner = candidate
+    except LockTimeout as e:
+        _record(name, e.waited, False)
+        if fd is not None:
+            _file_unlock(fd)
+            os.close(fd)
+        local.release()
+        raise
+    except BaseException:
+        if fd is not None:
+            _file_unlock(fd)
+            os.close(fd)
+        local.release()
+        raise
+
+    _record(name, time.monotonic() - started, True)
+    held[name] = [owner, time.monotonic()]
+    try:
+        yield
+    finally:
+        held.pop(name, None)
+        try:
+            _db_unlock(name, owner)
+        finally:
+            if fd is not None:
+                _file_unlock(fd)
+                os.close(fd)
+            local.release()
@@ -0,0 +1,74 @@
+"""読み取り用の在庫ロット（モデルを作らない）
+
+在庫画面・options・繰越・期限一覧などはロットの5項目を読むだけなので、
+Inventory インスタンスの代わりに values_list（またはスナップショット）の行から
+__slots__ だけの LotRecord を作る。
+
+    lots = query_lots(location)
+    lots.by_item()["唐揚げ"]            # その品目のロット（賞味期限順）
+    lots.by_key()[("唐揚げ", "2026-03-07")]
+
+書き換える処理（確定時の引当など）は従来どおり Inventory を使う。
+"""
+from __future__ import annotations
+
+from .models import Inventory
+
+FIELDS = ("item", "expiry", "qty", "refill_line", "alert")
+
+
+class LotRecord:
+    __slots__ = FIELDS
+
+    def __init__(self, item: str, expiry: str, qty: int, refill_line: int, alert: str | None):
+        self.item = item
+        self.expiry = expiry
+        self.qty = qty
+        self.refill_line = refill_line
+        self.alert = alert
+
+    def __repr__(self):
+        return f"LotRecord({self.item!r}, {self.expiry!r}, qty={self.qty})"
+
+    def __eq__(self, other):
+        return isinstance(other, LotRecord) and all(getattr(self, f) == getattr(other, f) for f in FIELDS)
+
+
+class Lots:
+    """LotRecord の並び（item, expiry 順）と、必要になったときに作る索引"""
+
+    __slots__ = ("records", "_by_item", "_by_key")
+
+    def __init__(self, records: list[LotRecord]):
+        self.records = records
+        self._by_item: dict[str, list[LotRecord]] | None = None
+        self._by_key: dict[tuple[str, str], LotRecord] | None = None
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def by_item(self) -> dict[str, list[LotRecord]]:
+        if self._by_item is None:
+            d: dict[str, list[LotRecord]] = {}
+            for r in self.records:
+                d.setdefault(r.item, []).append(r)
+            self._by_item = d
+        return self._by_item
+
+    def by_key(self) -> dict[tuple[str, str], LotRecord]:
+        if self._by_key is None:
+            self._by_key = {(r.item, r.expiry): r for r in self.records}
+        return self._by_key
+
+
+def from_rows(rows) -> Lots:
+    """(item, expiry, qty, refill_line, alert) のイテラブルから"""
+    return Lots([LotRecord(*r) for r in rows])
+
+
+def query_lots(location: str, **filters) -> Lots:
+    qs = Inventory.objects.filter(location=location, **filters).order_by("item", "expiry")
+    return from_rows(qs.values_list(*FIELDS))
@@ -0,0 +1,40 @@
+"""古い確定済み/取消済みの注文を data/archive/orders_YYYY-MM.csv.gz に移す（cron 等で月1回）"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders import archive
+from orders.locations import UnknownLocation, all_locations, get_location
+
+
+class Command(BaseCommand):
+    help = "ORDERS_ARCHIVE_AFTER_MONTHS か月より前の確定済み/取消済みの注文を月別ファイルへアーカイブする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=None, help="何か月前の月初より前を対象にするか（既定 ORDERS_ARCHIVE_AFTER_MONTHS）")
+        parser.add_argument("--before", default="", help="この日(YYYY-MM-DD)より前を対象にする（--months より優先）")
+        parser.add_argument("--location", default="", help="拠点コード（省略時は全拠点）")
+        parser.add_argument("--dry-run", action="store_true", help="件数を表示するだけ")
+
+    def handle(self, *args, **opts):
+        if opts["before"]:
+            before = parse_date(opts["before"])
+            if before is None:
+                raise CommandError("--before は YYYY-MM-DD")
+        else:
+            months = opts["months"]
+            if months is None:
+                months = int(getattr(settings, "ORDERS_ARCHIVE_AFTER_MONTHS", 12))
+            before = archive.cutoff_for(months)
+
+        try:
+            locations = [get_location(opts["location"])] if opts["location"] else all_locations()
+        except UnknownLocation:
+            raise CommandError(f"unknown location: {opts['location']}")
+
+        for loc in locations:
+            done = archive.archive_orders(loc, before, dry_run=opts["dry_run"])
+            for month, n in done.items():
+                self.stdout.write(f"{loc.code} {month}: {n}")
+            verb = "対象" if opts["dry_run"] else "アーカイブ"
+            self.stdout.write(f"{loc.code}: {before.isoformat()} より前 {sum(done.values())} 件を{verb}")
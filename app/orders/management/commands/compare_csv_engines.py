@@ -0,0 +1,53 @@
+"""CSVエンジン（pandas / stdlib）の読込結果の一致と、処理時間・ピークメモリの比較"""
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.csv_engine import ENGINES, has_pandas
+from orders.locations import all_locations
+
+
+class Command(BaseCommand):
+    help = "各CSVを pandas / stdlib エンジンで読み、結果が一致するかと処理時間・ピークメモリを表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="CSVファイル（省略時は各拠点の zaikokanri.csv / meibo.csv）")
+        parser.add_argument("--repeat", type=int, default=5, help="時間計測の繰り返し回数")
+
+    def handle(self, *args, **opts):
+        paths = [Path(p) for p in opts["paths"]]
+        if not paths:
+            for loc in all_locations():
+                paths += [loc.zaiko_csv, loc.meibo_csv]
+        paths = [p for p in paths if p.exists()]
+        if not paths:
+            raise CommandError("CSVファイルがありません")
+
+        names = ["stdlib"] + (["pandas"] if has_pandas() else [])
+        mismatch = 0
+        for path in paths:
+            self.stdout.write(str(path))
+            tables = {}
+            for name in names:
+                engine = ENGINES[name]()
+                tracemalloc.start()
+                tables[name] = engine.read(path)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                started = time.perf_counter()
+                for _ in range(opts["repeat"]):
+                    engine.read(path)
+                ms = (time.perf_counter() - started) * 1000 / opts["repeat"]
+                self.stdout.write(f"  {name:7s} rows={len(tables[name])} {ms:.2f}ms peak={peak / 1024:.0f}KiB")
+
+            if len(tables) > 1:
+                if tables["stdlib"] == tables["pandas"]:
+                    self.stdout.write("  一致")
+                else:
+                    mismatch += 1
+                    self.stdout.write(self.style.ERROR("  不一致"))
+        if mismatch:
+            raise CommandError(f"{mismatch} ファイルで結果が一致しません")
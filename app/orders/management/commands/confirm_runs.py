@@ -0,0 +1,36 @@
+"""再開待ちのチャンク確定を表示/中止する（CSVの取込が止まっているときの確認用）"""
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import services
+from orders.locations import UnknownLocation, all_locations, get_location
+from orders.models import ConfirmRun
+
+
+class Command(BaseCommand):
+    help = "CSVの取込を止めている（running/failed の）チャンク確定を表示する。--abandon で中止する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--location", default="", help="拠点コード（省略時は全拠点）")
+        parser.add_argument("--abandon", type=int, default=None, help="中止する run id（--location 必須）")
+
+    def handle(self, *args, **opts):
+        try:
+            locations = [get_location(opts["location"])] if opts["location"] else all_locations()
+        except UnknownLocation:
+            raise CommandError(f"unknown location: {opts['location']}")
+
+        if opts["abandon"] is not None:
+            if not opts["location"]:
+                raise CommandError("--abandon には --location が必要")
+            run = services.abandon_confirm_run(locations[0].code, opts["abandon"])
+            if run is None:
+                raise CommandError(f"再開待ちの run {opts['abandon']} はありません")
+            self.stdout.write(f"{run.location}: run {run.id} を中止 ({run.processed}/{run.total}) {run.error}")
+            return
+
+        for loc in locations:
+            runs = ConfirmRun.objects.filter(location=loc.code, status__in=[ConfirmRun.RUNNING, ConfirmRun.FAILED])
+            for run in runs.order_by("-created_at"):
+                self.stdout.write(
+                    f"{loc.code}: run {run.id} {run.status} {run.processed}/{run.total} 再開{run.attempts}回 {run.error}"
+                )
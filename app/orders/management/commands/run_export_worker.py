@@ -0,0 +1,25 @@
+"""CSV出力ジョブのワーカー（ORDERS_EXPORT_WORKERS = 0 の構成や、Webと別プロセスで回す場合）"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.jobs import claim_next, run_job
+
+
+class Command(BaseCommand):
+    help = "queued の ExportJob を順に処理する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="待ちが無くなったら終了")
+        parser.add_argument("--interval", type=float, default=1.0, help="待ちが無いときのポーリング間隔(秒)")
+
+    def handle(self, *args, **opts):
+        while True:
+            job = claim_next()
+            if job is None:
+                if opts["once"]:
+                    return
+                time.sleep(opts["interval"])
+                continue
+            self.stdout.write(f"export job {job.id} {job.kind}")
+            run_job(job.id, claimed=True)
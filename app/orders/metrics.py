@@ -0,0 +1,214 @@
+"""処理時間の計測（構造化ログ + メモリ内ヒストグラム → /api/metrics/）
+
+    with timer("reload.parse") as t:
+        df = ...
+        t.rows = len(df)
+
+    @timed("confirm_all")
+    def confirm_all(...): ...
+
+settings.ORDERS_METRICS_ENABLED = False（既定）の間は何も記録しない（共有の空スパンを返すだけ。
+QueryProfilingMiddleware が計測中のリクエストだけはスパンを集計する）。
+1件ごとの JSON ログはリクエストのたびに何行も出るので DEBUG（orders.metrics ロガーを DEBUG にしたときだけ）。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+
+logger = logging.getLogger("orders.metrics")
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_ops: dict[str, dict] = {}
+_counters: dict[str, int] = {}
+_tls = threading.local()
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "ORDERS_METRICS_ENABLED", False))
+
+
+def _active() -> bool:
+    return enabled() or getattr(_tls, "acc", None) is not None
+
+
+def begin_request() -> None:
+    """このスレッドで以降に計測した時間を操作名ごとに集計する（プロファイリング用）"""
+    _tls.acc = {}
+
+
+def end_request() -> dict[str, float]:
+    acc = getattr(_tls, "acc", None) or {}
+    _tls.acc = None
+    return acc
+
+
+class _Span:
+    __slots__ = ("name", "rows", "bytes", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started, rows=self.rows, nbytes=self.bytes, error=exc_type is not None)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+    name = rows = bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, key, value):
+        # 無効時は rows/bytes の代入も捨てる
+        pass
+
+
+_NULL = _NullSpan()
+
+
+def timer(name: str):
+    return _Span(name) if _active() else _NULL
+
+
+def timed(name: str):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active():
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def observe(name: str, seconds: float, rows: int | None = None, nbytes: int | None = None, error: bool = False) -> None:
+    acc = getattr(_tls, "acc", None)
+    if acc is not None:
+        acc[name] = acc.get(name, 0.0) + seconds
+    if not enabled():
+        return
+    with _lock:
+        op = _ops.get(name)
+        if op is None:
+            op = _ops[name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS), "rows": 0, "bytes": 0, "errors": 0}
+        op["count"] += 1
+        op["sum"] += seconds
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                op["buckets"][i] += 1
+        if rows:
+            op["rows"] += int(rows)
+        if nbytes:
+            op["bytes"] += int(nbytes)
+        if error:
+            op["errors"] += 1
+    if logger.isEnabledFor(logging.DEBUG):
+        rec = {"op": name, "ms": round(seconds * 1000, 3)}
+        if rows is not None:
+            rec["rows"] = rows
+        if nbytes is not None:
+            rec["bytes"] = nbytes
+        if error:
+            rec["error"] = True
+        logger.debug(json.dumps(rec, ensure_ascii=False))
+
+
+def incr(name: str, n: int = 1) -> None:
+    """単純なイベントカウンタ（orders_events_total{event=...}）"""
+    if not enabled():
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def counters() -> dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def snapshot() -> dict[str, dict]:
+    with _lock:
+        return {k: {**v, "buckets": list(v["buckets"])} for k, v in _ops.items()}
+
+
+def reset() -> None:
+    with _lock:
+        _ops.clear()
+        _counters.clear()
+
+
+def _esc(s: str) -> str:
+    return s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """Prometheus テキスト形式 (version 0.0.4)"""
+    from .locks import lock_stats
+
+    ops = snapshot()
+    out = [
+        "# HELP orders_op_duration_seconds Duration of instrumented operations.",
+        "# TYPE orders_op_duration_seconds histogram",
+    ]
+    for name, op in sorted(ops.items()):
+        lbl = f'op="{_esc(name)}"'
+        for b, n in zip(BUCKETS, op["buckets"]):
+            out.append(f'orders_op_duration_seconds_bucket{{{lbl},le="{b}"}} {n}')
+        out.append(f'orders_op_duration_seconds_bucket{{{lbl},le="+Inf"}} {op["count"]}')
+        out.append(f"orders_op_duration_seconds_sum{{{lbl}}} {op['sum']:.6f}")
+        out.append(f"orders_op_duration_seconds_count{{{lbl}}} {op['count']}")
+
+    for metric, key, help_ in (
+        ("orders_op_rows_total", "rows", "Rows processed by instrumented operations."),
+        ("orders_op_bytes_total", "bytes", "Bytes read or written by instrumented operations."),
+        ("orders_op_errors_total", "errors", "Instrumented operations that raised."),
+    ):
+        out.append(f"# HELP {metric} {help_}")
+        out.append(f"# TYPE {metric} counter")
+        for name, op in sorted(ops.items()):
+            out.append(f'{metric}{{op="{_esc(name)}"}} {op[key]}')
+
+    out.append("# HELP orders_events_total Event counters (coalesced reloads etc.).")
+    out.append("# TYPE orders_events_total counter")
+    for name, n in sorted(counters().items()):
+        out.append(f'orders_events_total{{event="{_esc(name)}"}} {n}')
+
+    locks = lock_stats()
+    out.append("# HELP orders_lock_acquired_total Resource lock acquisitions.")
+    out.append("# TYPE orders_lock_acquired_total counter")
+    for name, s in sorted(locks.items()):
+        out.append(f'orders_lock_acquired_total{{lock="{_esc(name)}"}} {s["acquired"]}')
+    out.append("# HELP orders_lock_timeouts_total Resource lock timeouts.")
+    out.append("# TYPE orders_lock_timeouts_total counter")
+    for name, s in sorted(locks.items()):
+        out.append(f'orders_lock_timeouts_total{{lock="{_esc(name)}"}} {s["timeouts"]}')
+    out.append("# HELP orders_lock_wait_seconds_total Total time spent waiting for resource locks.")
+    out.append("# TYPE orders_lock_wait_seconds_total counter")
+    for name, s in sorted(locks.items()):
+        out.append(f'orders_lock_wait_seconds_total{{lock="{_esc(name)}"}} {s["wait_total"]:.6f}')
+    out.append("# HELP orders_lock_wait_max_seconds Longest observed wait for resource locks.")
+    out.append("# TYPE orders_lock_wait_max_seconds gauge")
+    for name, s in sorted(locks.items()):
+        out.append(f'orders_lock_wait_max_seconds{{lock="{_esc(name)}"}} {s["wait_max"]:.6f}')
+    return "\n".join(out) + "\n"
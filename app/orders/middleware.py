@@ -0,0 +1,108 @@
+"""ミドルウェア"""
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+from . import metrics
+from .locks import LockTimeout
+
+logger = logging.getLogger("orders.profiling")
+
+_IN_LIST = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class LockTimeoutMiddleware:
+    """ロック待ちタイムアウトは 503 で返す（クライアントは再試行する）"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, LockTimeout):
+            return JsonResponse(
+                {"error": "busy", "lock": exception.name},
+                status=503,
+                headers={"Retry-After": "1"},
+                json_dumps_params={"ensure_ascii": False},
+            )
+        return None
+
+
+def query_shape(sql: str) -> str:
+    """パラメータ/リテラルを潰した SQL（同じ形のクエリの繰り返し = N+1 の検出用）"""
+    sql = _IN_LIST.sub("(...)", sql)
+    return _LITERAL.sub("?", sql)
+
+
+class _QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+
+class QueryProfilingMiddleware:
+    """リクエストごとのSQL件数/DB時間/CSV時間を計測（settings.ORDERS_QUERY_PROFILING で有効化）
+
+    - Server-Timing: db / csv / render（それ以外のアプリ処理）を付与
+    - ORDERS_SLOW_REQUEST_MS / ORDERS_SLOW_REQUEST_QUERIES を超えたら
+      繰り返しの多いクエリ形と一緒に orders.profiling へ WARNING
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "ORDERS_QUERY_PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = float(getattr(settings, "ORDERS_SLOW_REQUEST_MS", 500))
+        self.slow_queries = int(getattr(settings, "ORDERS_SLOW_REQUEST_QUERIES", 50))
+
+    def __call__(self, request):
+        rec = _QueryRecorder()
+        metrics.begin_request()
+        started = time.perf_counter()
+        wrappers = [c.execute_wrapper(rec) for c in connections.all()]
+        for w in wrappers:
+            w.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for w in reversed(wrappers):
+                w.__exit__(None, None, None)
+            spans = metrics.end_request()
+        total = time.perf_counter() - started
+
+        csv_s = sum(v for k, v in spans.items() if k.startswith("csv."))
+        render_s = max(0.0, total - rec.seconds - csv_s)
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={rec.seconds * 1000:.1f};desc="{rec.count} queries"',
+            f"csv;dur={csv_s * 1000:.1f}",
+            f"render;dur={render_s * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+        if total * 1000 >= self.slow_ms or rec.count >= self.slow_queries:
+            top = [{"count": n, "sql": shape[:300]} for shape, n in rec.shapes.most_common(5) if n > 1]
+            logger.warning(
+                "slow request %s %s: %.1fms, %d queries (db %.1fms, csv %.1fms) repeated=%s",
+                request.method, request.path, total * 1000, rec.count, rec.seconds * 1000, csv_s * 1000, top,
+            )
+        return response
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0002_carryoversnapshot"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="carryoversnapshot",
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="inventory",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="carryoversnapshot",
+            name="location",
+            field=models.CharField(db_index=True, default="default", max_length=50),
+        ),
+        migrations.AddField(
+            model_name="inventory",
+            name="location",
+            field=models.CharField(db_index=True, default="default", max_length=50),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="location",
+            field=models.CharField(db_index=True, default="default", max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="gohan",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="gohan_expiry",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="okazu",
+            field=models.CharField(blank=True, default="", max_length=200),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="okazu_expiry",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name="carryoversnapshot",
+            unique_together={("location", "month", "item", "expiry")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="inventory",
+            unique_together={("location", "item", "expiry")},
+        ),
+    ]
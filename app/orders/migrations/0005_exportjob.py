@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_resourcelock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(default="default", max_length=50)),
+                ("kind", models.CharField(max_length=50)),
+                ("params", models.JSONField(blank=True, default=dict)),
+                ("params_key", models.CharField(max_length=64)),
+                ("data_version", models.CharField(blank=True, default="", max_length=200)),
+                ("status", models.CharField(choices=[("queued", "待ち"), ("running", "実行中"), ("done", "完了"), ("failed", "失敗")], default="queued", max_length=10)),
+                ("progress", models.IntegerField(default=0)),
+                ("file", models.CharField(blank=True, default="", max_length=200)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["location", "kind", "params_key", "data_version"], name="orders_expo_locatio_dd4cf4_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_exportjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CsvIngestState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(max_length=50, unique=True)),
+                ("path", models.CharField(max_length=500)),
+                ("offset", models.BigIntegerField(default=0)),
+                ("prefix_hash", models.CharField(max_length=64)),
+                ("columns", models.JSONField(default=list)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
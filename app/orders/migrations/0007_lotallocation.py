@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_csvingeststate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LotAllocation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(db_index=True, default="default", max_length=50)),
+                ("part", models.CharField(max_length=10)),
+                ("item", models.CharField(max_length=200)),
+                ("expiry", models.CharField(max_length=50)),
+                ("qty", models.IntegerField(default=1)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="allocations", to="orders.order"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_lotallocation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConfirmRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(db_index=True, default="default", max_length=50)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("running", "実行中"), ("done", "完了"), ("failed", "失敗")],
+                        default="running",
+                        max_length=10,
+                    ),
+                ),
+                ("last_order_id", models.BigIntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("processed", models.IntegerField(default=0)),
+                ("shortages", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_confirmrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="confirmrun",
+            name="filters",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
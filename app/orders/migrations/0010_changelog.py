@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0009_confirmrun_filters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(default="default", max_length=50)),
+                ("kind", models.CharField(max_length=10)),
+                ("key", models.CharField(max_length=300)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["location", "kind", "id"], name="orders_chan_locatio_6c3c55_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0010_changelog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Member",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("location", models.CharField(default="default", max_length=50)),
+                ("name", models.CharField(max_length=100)),
+                ("kana", models.CharField(blank=True, default="", max_length=100)),
+                ("key", models.CharField(blank=True, default="", max_length=100)),
+                ("kana_key", models.CharField(blank=True, default="", max_length=100)),
+                ("position", models.IntegerField(default=0)),
+                ("active", models.BooleanField(default=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["location", "key"], name="orders_memb_locatio_860c7c_idx"),
+                    models.Index(fields=["location", "kana_key"], name="orders_memb_locatio_82101b_idx"),
+                ],
+                "unique_together": {("location", "name")},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _ref():
+    return models.ForeignKey(
+        blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name="+", to="orders.item"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0011_member"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Item",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=200, unique=True)),
+                (
+                    "category",
+                    models.CharField(choices=[("okazu", "おかず"), ("gohan", "ご飯")], default="okazu", max_length=10),
+                ),
+                ("key", models.CharField(db_index=True, max_length=200)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(model_name="carryoversnapshot", name="item_ref", field=_ref()),
+        migrations.AddField(model_name="inventory", name="item_ref", field=_ref()),
+        migrations.AddField(model_name="order", name="gohan_ref", field=_ref()),
+        migrations.AddField(model_name="order", name="okazu_ref", field=_ref()),
+    ]
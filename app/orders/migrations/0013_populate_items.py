@@ -0,0 +1,41 @@
+from django.db import migrations
+
+from orders.kana import normalize
+
+
+def _category(name):
+    return "gohan" if name.startswith("ご飯") else "okazu"
+
+
+def forwards(apps, schema_editor):
+    Item = apps.get_model("orders", "Item")
+    Inventory = apps.get_model("orders", "Inventory")
+    CarryoverSnapshot = apps.get_model("orders", "CarryoverSnapshot")
+    Order = apps.get_model("orders", "Order")
+
+    names = set(Inventory.objects.values_list("item", flat=True))
+    names |= set(CarryoverSnapshot.objects.values_list("item", flat=True))
+    names |= set(Order.objects.values_list("okazu", flat=True))
+    names |= set(Order.objects.values_list("gohan", flat=True))
+    names.discard("")
+    Item.objects.bulk_create(
+        [Item(name=n, category=_category(n), key=normalize(n)) for n in sorted(names)], ignore_conflicts=True
+    )
+
+    # 品目ごとに1回の UPDATE（行ごとに保存しない）
+    for item_id, name in Item.objects.values_list("id", "name"):
+        Inventory.objects.filter(item=name).update(item_ref_id=item_id)
+        CarryoverSnapshot.objects.filter(item=name).update(item_ref_id=item_id)
+        Order.objects.filter(okazu=name).update(okazu_ref_id=item_id)
+        Order.objects.filter(gohan=name).update(gohan_ref_id=item_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0012_item"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
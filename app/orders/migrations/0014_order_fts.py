@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from orders import search
+
+
+def forwards(apps, schema_editor):
+    # FTS5（trigram）が使えない SQLite・他のDBでは何もしない（検索は LIKE になる）
+    search.create_index(schema_editor.connection)
+
+
+def backwards(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0013_populate_items"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
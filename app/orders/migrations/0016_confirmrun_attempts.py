@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0015_exportjob_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="confirmrun",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="confirmrun",
+            name="status",
+            field=models.CharField(
+                choices=[("running", "実行中"), ("done", "完了"), ("failed", "失敗"), ("abandoned", "中止")],
+                default="running",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0016_confirmrun_attempts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="csvingeststate",
+            name="encoding",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from orders import search
+
+
+def forwards(apps, schema_editor):
+    # 2文字以下の語の検索用。FTS5 が使えない SQLite・他のDBでは何もしない（LIKE になる）
+    search.create_grams(schema_editor.connection)
+
+
+def backwards(apps, schema_editor):
+    search.drop_grams(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0017_csvingeststate_encoding"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
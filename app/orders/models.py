@@ -1,33 +1,76 @@
 """DBモデル"""
 from django.db import models
 
+from .locations import DEFAULT_LOCATION
+
+
+class Item(models.Model):
+    """品目カタログ（CSV取込・注文登録で出てきた品目名を自動で登録）"""
+    OKAZU = "okazu"
+    GOHAN = "gohan"
+    CATEGORY_CHOICES = [(OKAZU, "おかず"), (GOHAN, "ご飯")]
+
+    name = models.CharField(max_length=200, unique=True)
+    category = models.CharField(max_length=10, choices=CATEGORY_CHOICES, default=OKAZU)
+    key = models.CharField(max_length=200, db_index=True)  # kana.normalize(name)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.category})"
+
 
 class Inventory(models.Model):
     """在庫（CSV由来）"""
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION, db_index=True)
     item = models.CharField(max_length=200)
     expiry = models.CharField(max_length=50)
     qty = models.IntegerField(default=0)
     refill_line = models.IntegerField(default=0)
     alert = models.CharField(max_length=200, blank=True, null=True)
+    item_ref = models.ForeignKey(Item, on_delete=models.PROTECT, null=True, blank=True, related_name="+")
 
     class Meta:
-        unique_together = ('item', 'expiry')
+        unique_together = ('location', 'item', 'expiry')
 
     def __str__(self):
         return f"{self.item} ({self.expiry}) qty={self.qty}"
 
 
 
+class Member(models.Model):
+    """名簿（meibo.csv 由来。CSV から消えた人は削除せず active=False）"""
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION)
+    name = models.CharField(max_length=100)
+    kana = models.CharField(max_length=100, blank=True, default="")  # ふりがな列があれば
+    key = models.CharField(max_length=100, blank=True, default="")  # kana.normalize(name)
+    kana_key = models.CharField(max_length=100, blank=True, default="")  # kana.normalize(kana)
+    position = models.IntegerField(default=0)  # meibo.csv の並び順
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('location', 'name')
+        indexes = [
+            models.Index(fields=["location", "key"]),
+            models.Index(fields=["location", "kana_key"]),
+        ]
+
+    def __str__(self):
+        return f"{self.name} active={self.active}"
+
+
 class CarryoverSnapshot(models.Model):
     """前月繰越スナップショット（月末時点の在庫）"""
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION, db_index=True)
     month = models.CharField(max_length=7)  # YYYY-MM
     item = models.CharField(max_length=200)
     expiry = models.CharField(max_length=50)
     qty = models.IntegerField(default=0)
+    item_ref = models.ForeignKey(Item, on_delete=models.PROTECT, null=True, blank=True, related_name="+")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('month', 'item', 'expiry')
+        unique_together = ('location', 'month', 'item', 'expiry')
 
     def __str__(self):
         return f"{self.month} {self.item} {self.expiry} qty={self.qty}"
@@ -35,11 +78,15 @@ class CarryoverSnapshot(models.Model):
 
 class Order(models.Model):
     """注文（仮送信 → 一括確定）"""
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION, db_index=True)
     name = models.CharField(max_length=100)
     okazu = models.CharField(max_length=200, blank=True, default="")
     okazu_expiry = models.CharField(max_length=50, blank=True, default="")
     gohan = models.CharField(max_length=50, blank=True, default="")
     gohan_expiry = models.CharField(max_length=50, blank=True, default="")
+    # 集計は品目名ではなくこちらの整数idでまとめる
+    okazu_ref = models.ForeignKey(Item, on_delete=models.PROTECT, null=True, blank=True, related_name="+")
+    gohan_ref = models.ForeignKey(Item, on_delete=models.PROTECT, null=True, blank=True, related_name="+")
 
     created_at = models.DateTimeField(auto_now_add=True)
     confirmed = models.BooleanField(default=False)
@@ -48,3 +95,116 @@ class Order(models.Model):
 
     def __str__(self):
         return f"{self.name} {self.okazu}/{self.gohan} confirmed={self.confirmed} cancelled={self.cancelled}"
+
+
+class LotAllocation(models.Model):
+    """確定時にどのロットから何個引いたか（注文1件のおかず/ごはんごと）"""
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION, db_index=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="allocations")
+    part = models.CharField(max_length=10)  # okazu / gohan
+    item = models.CharField(max_length=200)
+    expiry = models.CharField(max_length=50)
+    qty = models.IntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"order={self.order_id} {self.item} ({self.expiry}) x{self.qty}"
+
+
+class ConfirmRun(models.Model):
+    """チャンク分けした一括確定の進捗（途中で止まったら次の確定で続きから再開する）
+
+    再開が ORDERS_CONFIRM_MAX_RESUMES 回続けて失敗したら abandoned（中止）にして、CSVの取込を再開する。
+    """
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    ABANDONED = "abandoned"
+    STATUS_CHOICES = [(RUNNING, "実行中"), (DONE, "完了"), (FAILED, "失敗"), (ABANDONED, "中止")]
+
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    filters = models.JSONField(default=dict, blank=True)  # confirm_all の ids/name/start/end
+    last_order_id = models.BigIntegerField(default=0)  # 開始時点の未確定注文の最大id（これより後の注文は対象外）
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    shortages = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    attempts = models.IntegerField(default=0)  # 再開した回数
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.location} {self.status} {self.processed}/{self.total}"
+
+
+class ChangeLog(models.Model):
+    """在庫ロット/注文の変更履歴（id がそのままデータの版。/api/changes/ の差分同期用）"""
+    LOT = "lot"
+    ORDER = "order"
+
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION)
+    kind = models.CharField(max_length=10)  # lot / order
+    key = models.CharField(max_length=300)  # lot: "お弁当\t賞味期限"（"*" は全件入れ替え）/ order: id
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["location", "kind", "id"])]
+
+    def __str__(self):
+        return f"v{self.id} {self.location} {self.kind} {self.key}"
+
+
+class ResourceLock(models.Model):
+    """複数ワーカー/ホスト間のアドバイザリロック（行がある間は保持中）"""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=200)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} owner={self.owner}"
+
+
+class CsvIngestState(models.Model):
+    """拠点の zaikokanri.csv をどこまで取り込んだか（追記だけなら続きから読むため）"""
+    location = models.CharField(max_length=50, unique=True)
+    path = models.CharField(max_length=500)
+    offset = models.BigIntegerField(default=0)
+    prefix_hash = models.CharField(max_length=64)
+    columns = models.JSONField(default=list)
+    encoding = models.CharField(max_length=20, blank=True, default="")  # 全件取込/書き戻しのときの文字コード（追記分もこれで読む）
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.location} {self.offset}B"
+
+
+class ExportJob(models.Model):
+    """バックグラウンドで作るCSV出力（同じ種類/条件/データ版の完了済みジョブは再利用）"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "待ち"), (RUNNING, "実行中"), (DONE, "完了"), (FAILED, "失敗")]
+
+    location = models.CharField(max_length=50, default=DEFAULT_LOCATION)
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    params_key = models.CharField(max_length=64)
+    data_version = models.CharField(max_length=200, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.IntegerField(default=0)  # 0-100
+    file = models.CharField(max_length=200, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # 状態/進捗を最後に更新した時刻（queued/running のまま止まったジョブの検出用。update() では明示的に入れる）
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["location", "kind", "params_key", "data_version"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.status} {self.progress}%"
@@ -0,0 +1,85 @@
+"""APIのJSON応答
+
+    return json_response(request, {"ok": True})
+    return table_response(request, "lots", LOT_COLUMNS, rows)
+
+- orjson がインストールされていれば orjson、無ければ標準 json（どちらも同じ出力: UTF-8・空白なし・日時は isoformat）
+- table_response: 既定は [{列名: 値}, ...]。?format=columns なら {"columns": [...], "rows": [[...], ...]}
+  （values_list() のタプルをそのまま書くので dict を作らずに済み、応答も数分の1になる）
+- Accept-Encoding に gzip があり、本文が ORDERS_JSON_GZIP_MIN_BYTES 以上なら gzip で返す
+"""
+from __future__ import annotations
+
+import json
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from .metrics import timer
+
+_gzip_re = re.compile(r"\bgzip\b")
+_orjson = None
+
+
+def _default(o):
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _encoder():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+
+def dumps(data) -> bytes:
+    orjson = _encoder()
+    if orjson:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def wants_columns(request) -> bool:
+    return (request.GET.get("format") or "").lower() == "columns"
+
+
+def json_response(request, data, status: int = 200) -> HttpResponse:
+    with timer("view.json_render") as t:
+        body = dumps(data)
+        t.bytes = len(body)
+    resp = HttpResponse(body, content_type="application/json", status=status)
+    min_bytes = getattr(settings, "ORDERS_JSON_GZIP_MIN_BYTES", 4096)
+    if min_bytes is not None and len(body) >= int(min_bytes):
+        patch_vary_headers(resp, ("Accept-Encoding",))
+        if _gzip_re.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            resp.content = compress_string(body)
+            resp["Content-Encoding"] = "gzip"
+            resp["Content-Length"] = str(len(resp.content))
+    return resp
+
+
+def table(request, columns, rows):
+    """rows（タプルのイテラブル）を ?format= に合わせた形にする"""
+    if wants_columns(request):
+        return {"columns": list(columns), "rows": rows if isinstance(rows, list) else list(rows)}
+    return [dict(zip(columns, r)) for r in rows]
+
+
+def table_response(request, key: str, columns, rows, extra: dict | None = None) -> HttpResponse:
+    data = dict(extra or {})
+    data[key] = table(request, columns, rows)
+    return json_response(request, data)
@@ -0,0 +1,249 @@
+"""注文の全文検索（SQLite FTS5 + trigram トークナイザ）
+
+orders_order_fts は orders_order を外部コンテンツにした FTS5 テーブルで、name / okazu / gohan を
+3文字単位（trigram）で索引する。分かち書きの要らない部分一致なので日本語の品目名・名前に向く。
+注文の追加/更新/削除はトリガーで追従する（bulk_create や update() も含む）。
+
+    qs = filter_orders(qs, "唐揚げ 中村")   # 空白区切りの語をすべて含む注文（AND）
+
+- 3文字以上の語は FTS5 の MATCH で絞る
+- 2文字以下の語（「中村」など）は trigram で引けないので、2文字単位の索引 orders_order_grams で絞る
+- どちらも、絞った後の行に LIKE で当てる（結果は LIKE だけの場合と同じ）
+- FTS5 が使えないDBでは全部 LIKE（遅いが結果は同じ）
+
+orders_order_grams は各列の2文字ずつ（と末尾の1文字）を空白区切りにした文字列を unicode61 で索引する。
+2文字の語はその語のトークン、1文字の語はその文字で始まるトークン（前方一致）で引ける。
+2文字ずつに分けるのは SQL ではできないので、トリガーは変わった注文の id を orders_order_grams_queue に
+積むだけにして、2文字以下の語で検索する直前に sync_grams() が索引へ反映する。
+
+SQLite はテーブルを作り直すマイグレーション（列の変更など）でトリガーを消すので、
+migrate の後（post_migrate）に ensure_index() で作り直す。
+"""
+from __future__ import annotations
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABLE = "orders_order_fts"
+# trigram で引ける最短の語
+MIN_TERM = 3
+
+_CREATE_TABLE = f"""CREATE VIRTUAL TABLE {TABLE} USING fts5(
+    name, okazu, gohan, content='orders_order', content_rowid='id', tokenize='trigram'
+)"""
+_TRIGGERS = {
+    f"{TABLE}_ai": f"""CREATE TRIGGER {TABLE}_ai AFTER INSERT ON orders_order BEGIN
+        INSERT INTO {TABLE}(rowid, name, okazu, gohan) VALUES (new.id, new.name, new.okazu, new.gohan);
+    END""",
+    f"{TABLE}_ad": f"""CREATE TRIGGER {TABLE}_ad AFTER DELETE ON orders_order BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, name, okazu, gohan) VALUES ('delete', old.id, old.name, old.okazu, old.gohan);
+    END""",
+    f"{TABLE}_au": f"""CREATE TRIGGER {TABLE}_au AFTER UPDATE OF name, okazu, gohan ON orders_order BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, name, okazu, gohan) VALUES ('delete', old.id, old.name, old.okazu, old.gohan);
+        INSERT INTO {TABLE}(rowid, name, okazu, gohan) VALUES (new.id, new.name, new.okazu, new.gohan);
+    END""",
+}
+_REBUILD = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"
+
+GRAMS = "orders_order_grams"
+QUEUE = f"{GRAMS}_queue"
+_CREATE_GRAMS = f"CREATE VIRTUAL TABLE {GRAMS} USING fts5(grams, tokenize='unicode61 remove_diacritics 0', prefix='1')"
+_CREATE_QUEUE = f"CREATE TABLE {QUEUE} (seq INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER NOT NULL)"
+_GRAM_TRIGGERS = {
+    f"{GRAMS}_ai": f"""CREATE TRIGGER {GRAMS}_ai AFTER INSERT ON orders_order BEGIN
+        INSERT INTO {QUEUE}(order_id) VALUES (new.id);
+    END""",
+    f"{GRAMS}_ad": f"""CREATE TRIGGER {GRAMS}_ad AFTER DELETE ON orders_order BEGIN
+        INSERT INTO {QUEUE}(order_id) VALUES (old.id);
+    END""",
+    f"{GRAMS}_au": f"""CREATE TRIGGER {GRAMS}_au AFTER UPDATE OF name, okazu, gohan ON orders_order BEGIN
+        INSERT INTO {QUEUE}(order_id) VALUES (new.id);
+    END""",
+}
+# sync_grams() で1回に読み書きする注文数
+_SYNC_BATCH = 500
+
+# DB エイリアス → 索引テーブル（TABLE / GRAMS）のうちあるもの
+_available: dict[str, frozenset] = {}
+
+
+def supported(connection) -> bool:
+    """この SQLite で FTS5 の trigram トークナイザが使えるか"""
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cur:
+        try:
+            cur.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='trigram')")
+            cur.execute("DROP TABLE temp._fts_probe")
+        except Exception:
+            return False
+    return True
+
+
+def _existing(cur) -> set[str]:
+    cur.execute("SELECT name FROM sqlite_master WHERE name LIKE %s OR name LIKE %s", [f"{TABLE}%", f"{GRAMS}%"])
+    return {r[0] for r in cur.fetchall()}
+
+
+def create_index(connection) -> None:
+    if not supported(connection):
+        return
+    with connection.cursor() as cur:
+        if TABLE not in _existing(cur):
+            cur.execute(_CREATE_TABLE)
+    ensure_index(using=connection.alias)
+
+
+def drop_index(connection) -> None:
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cur:
+        for name in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    _available.pop(connection.alias, None)
+
+
+def create_grams(connection) -> None:
+    """2文字以下の語用の索引を作り、既存の注文をすべて入れる"""
+    if not supported(connection):
+        return
+    with connection.cursor() as cur:
+        existing = _existing(cur)
+        if GRAMS not in existing:
+            cur.execute(_CREATE_GRAMS)
+        if QUEUE not in existing:
+            cur.execute(_CREATE_QUEUE)
+            cur.execute(f"INSERT INTO {QUEUE}(order_id) SELECT id FROM orders_order")
+    ensure_index(using=connection.alias)
+    sync_grams(using=connection.alias)
+
+
+def drop_grams(connection) -> None:
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cur:
+        for name in _GRAM_TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {GRAMS}")
+        cur.execute(f"DROP TABLE IF EXISTS {QUEUE}")
+    _available.pop(connection.alias, None)
+
+
+def grams(*values: str) -> str:
+    """各値の2文字ずつと末尾の1文字を空白区切りで（orders_order_grams に入れる文字列）"""
+    out = []
+    for v in values:
+        if v:
+            out.extend(v[i:i + 2] for i in range(len(v) - 1))
+            out.append(v[-1])
+    return " ".join(out)
+
+
+def sync_grams(using: str = "default") -> int:
+    """orders_order_grams_queue に積まれた注文を索引へ反映する。反映した注文数"""
+    connection = connections[using]
+    # 1トランザクションにまとめる（バッチごとにコミットすると FTS の書き込みが遅い）
+    with transaction.atomic(using=using), connection.cursor() as cur:
+        cur.execute(f"SELECT MAX(seq) FROM {QUEUE}")
+        top = cur.fetchone()[0]
+        if top is None:
+            return 0
+        cur.execute(f"SELECT DISTINCT order_id FROM {QUEUE} WHERE seq <= %s", [top])
+        ids = [r[0] for r in cur.fetchall()]
+        for i in range(0, len(ids), _SYNC_BATCH):
+            batch = ids[i:i + _SYNC_BATCH]
+            marks = ", ".join(["%s"] * len(batch))
+            cur.execute(f"SELECT id, name, okazu, gohan FROM orders_order WHERE id IN ({marks})", batch)
+            rows = cur.fetchall()
+            # 同じ id を他のリクエストが同時に反映しても結果は同じ（REPLACE / DELETE だけ）
+            cur.executemany(
+                f"INSERT OR REPLACE INTO {GRAMS}(rowid, grams) VALUES (%s, %s)", [(r[0], grams(*r[1:])) for r in rows]
+            )
+            gone = sorted(set(batch) - {r[0] for r in rows})
+            if gone:
+                cur.execute(f"DELETE FROM {GRAMS} WHERE rowid IN ({', '.join(['%s'] * len(gone))})", gone)
+        # 読んだ後に積まれた分（seq が大きい）は次回に回す
+        cur.execute(f"DELETE FROM {QUEUE} WHERE seq <= %s", [top])
+    return len(ids)
+
+
+def ensure_index(using: str = "default", **kwargs) -> None:
+    """FTS テーブルがあるのにトリガーが消えていたら作り直して索引を再構築する（post_migrate から）"""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cur:
+        existing = _existing(cur)
+        if TABLE in existing:
+            missing = [sql for name, sql in _TRIGGERS.items() if name not in existing]
+            for sql in missing:
+                cur.execute(sql)
+            if missing:
+                cur.execute(_REBUILD)
+        if GRAMS in existing and QUEUE in existing:
+            missing = [sql for name, sql in _GRAM_TRIGGERS.items() if name not in existing]
+            for sql in missing:
+                cur.execute(sql)
+            if missing:
+                # トリガーが無かった間の変更は分からないので全件を積み直す
+                cur.execute(f"INSERT INTO {QUEUE}(order_id) SELECT id FROM orders_order")
+                cur.execute(f"INSERT INTO {QUEUE}(order_id) SELECT rowid FROM {GRAMS}")
+    _available.pop(using, None)
+
+
+def available(using: str = "default", table: str = TABLE) -> bool:
+    hit = _available.get(using)
+    if hit is None:
+        connection = connections[using]
+        hit = frozenset()
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cur:
+                hit = frozenset(_existing(cur) & {TABLE, GRAMS, QUEUE})
+        _available[using] = hit
+    return table in hit and (table != GRAMS or QUEUE in hit)
+
+
+def terms(q: str) -> list[str]:
+    return [t for t in (q or "").split() if t]
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _gram_query(term: str) -> str:
+    # 2文字はそのトークン、1文字はその文字で始まるトークン
+    return _phrase(term) if len(term) == 2 else _phrase(term) + " *"
+
+
+def filter_orders(qs, q: str):
+    """qs（Order）を q の語をすべて name / okazu / gohan のどれかに含む注文に絞る"""
+    words = terms(q)
+    if not words:
+        return qs
+    long = [t for t in words if len(t) >= MIN_TERM]
+    if long and available(qs.db):
+        expr = " AND ".join(_phrase(t) for t in long)
+        qs = qs.filter(id__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expr]))
+        words = [t for t in words if len(t) < MIN_TERM]
+    else:
+        # 記号を含む語は unicode61 のトークンにならないので索引で絞らない（LIKE だけ）
+        short = [t for t in words if len(t) < MIN_TERM and all(c.isalnum() for c in t)]
+        if short and available(qs.db, GRAMS):
+            sync_grams(qs.db)
+            expr = " AND ".join(_gram_query(t) for t in short)
+            qs = qs.filter(id__in=RawSQL(f"SELECT rowid FROM {GRAMS} WHERE {GRAMS} MATCH %s", [expr]))
+    for t in words:
+        qs = qs.filter(Q(name__contains=t) | Q(okazu__contains=t) | Q(gohan__contains=t))
+    return qs
+
+
+def matches(q: str, *values: str) -> bool:
+    """filter_orders と同じ条件を Python 側で（アーカイブの行用。英字の大文字小文字は区別しない）"""
+    words = [t.casefold() for t in terms(q)]
+    if not words:
+        return True
+    hay = [v.casefold() for v in values if v]
+    return all(any(t in v for v in hay) for t in words)
@@ -1,58 +1,85 @@
 from __future__ import annotations
 
 from pathlib import Path
-import csv
-from datetime import date
+import itertools
+import os
+from datetime import date, datetime, timedelta
 import shutil
-import pandas as pd
+from collections import OrderedDict
 from django.conf import settings
-from django.db import transaction
+from django.db import connections, transaction
 from django.utils import timezone
-
-from .models import Inventory, Order
-
-
-def _pick_path(candidates: list[str]) -> Path:
-    for c in candidates:
-        p = Path(c)
-        if p.exists():
-            return p
-    return Path(candidates[0])
+from django.db.models import Count, DateField, F, Max, Q
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_date
+
+from . import archive, catalog, changes, csv_cache, csv_tail, exports, kana, search, snapshot
+from .changes import LOT_COLUMNS
+from .csv_engine import WRITE_ENCODING, CsvTable, get_engine, is_gzip, read_rows, write_stream
+from .locations import DEFAULT_LOCATION, Location, get_location, state_for
+from .locks import heartbeat, resource_lock
+from .lots import FIELDS as LOT_FIELDS, Lots, from_rows, query_lots
+from .metrics import timed, timer
+from .singleflight import SingleFlight
+from .allocation import LotAllocator
+from .models import ChangeLog, ConfirmRun, CsvIngestState, Inventory, Item, LotAllocation, Member, Order
+
+def _read_csv_safely(path: Path) -> CsvTable:
+    if csv_cache.enabled():
+        with timer("csv.cache_load") as t:
+            table = csv_cache.load(path)
+            if table is not None:
+                t.rows = len(table)
+        if table is not None:
+            return table
+
+    sig = csv_cache.signature(path)
+    with timer("csv.parse") as t:
+        table = get_engine().read(path)
+        t.rows = len(table)
+        t.bytes = _size(path)
+    if csv_cache.enabled():
+        with timer("csv.cache_store"):
+            csv_cache.store(path, table, sig)
+    return table
+
+
+def _cell(row: list, idx: int | None) -> str:
+    if idx is None:
+        return ""
+    v = row[idx]
+    return "" if v is None else str(v).strip()
 
 
-def _default_data_dir() -> Path:
-    # app/data を最優先（ZIP内の同梱CSV）
-    try:
-        return Path(settings.BASE_DIR) / "data"
-    except Exception:
-        # settings 未初期化時の保険
-        return Path(__file__).resolve().parent.parent / "data"
+def _streaming(path: Path) -> bool:
+    """チャンク読み（全体をメモリに載せない）で扱うか。gzip と ORDERS_CSV_STREAM_THRESHOLD 以上のCSV"""
+    if is_gzip(path):
+        return True
+    threshold = getattr(settings, "ORDERS_CSV_STREAM_THRESHOLD", 32 * 1024 * 1024)
+    return threshold is not None and _size(path) >= int(threshold)
 
 
-DATA_DIR = _default_data_dir()
+def _chunk_rows() -> int:
+    return int(getattr(settings, "ORDERS_CSV_CHUNK_ROWS", 5000))
 
-ZAIKO_CSV = _pick_path([
-    str(DATA_DIR / "zaikokanri.csv"),
-    str(Path.home() / "Downloads" / "zaikokanri.csv"),
-    r"C:\Users\spenc\Downloads\zaikokanri.csv",
-    r"C:\Users\FUJITSU\Downloads\zaikokanri.csv",
-])
 
-MEIBO_CSV = _pick_path([
-    str(DATA_DIR / "meibo.csv"),
-    str(Path.home() / "Downloads" / "meibo.csv"),
-    r"C:\Users\spenc\Downloads\meibo.csv",
-    r"C:\Users\FUJITSU\Downloads\meibo.csv",
-])
+def _zaiko_columns(table: CsvTable) -> tuple[int, int, int, int | None, int | None]:
+    """zaikokanri.csv の (お弁当, 賞味期限, 在庫数, 補填ライン, アラート) の列位置"""
+    n = len(table.columns)
+    return (
+        table.index("お弁当", 0),
+        table.index("賞味期限", 1 if n > 1 else 0),
+        table.index("在庫数", n - 1),
+        table.index("補填ライン"),
+        table.index("アラート"),
+    )
 
 
-def _read_csv_safely(path: Path) -> pd.DataFrame:
-    for enc in ("utf-8-sig", "cp932", "utf-8"):
-        try:
-            return pd.read_csv(path, encoding=enc)
-        except Exception:
-            pass
-    return pd.read_csv(path, encoding="utf-8", errors="ignore")
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
 
 
 def _normalize_date_str(s: str) -> str:
@@ -78,156 +105,717 @@ def _backup_csv(path: Path, prefix: str):
         backup_dir = path.parent / "backup"
         backup_dir.mkdir(parents=True, exist_ok=True)
         ts = timezone.now().strftime("%Y%m%d_%H%M%S")
-        dst = backup_dir / f"{prefix}_{ts}{path.suffix}"
-        shutil.copy2(path, dst)
+        # zaikokanri.csv.gz は .csv.gz のまま残す
+        ext = ".csv.gz" if is_gzip(path) else path.suffix
+        dst = backup_dir / f"{prefix}_{ts}{ext}"
+        with timer("csv.backup") as t:
+            shutil.copy2(path, dst)
+            t.bytes = _size(dst)
         return dst
     except Exception:
         return None
 
 
-def load_names() -> list[str]:
-    df = _read_csv_safely(MEIBO_CSV)
-    if df.empty:
+def csv_lock(loc: Location):
+    """拠点の zaikokanri.csv を読み書きする処理を直列化する（プロセス/ワーカー間）"""
+    return resource_lock(f"zaiko:{loc.code}", file=loc.zaiko_csv, local=state_for(loc.code).lock)
+
+
+def load_names(location: str = DEFAULT_LOCATION) -> list[str]:
+    """有効な名簿の名前（meibo.csv の並び順）"""
+    loc = get_location(location)
+    # meibo.csv は更新頻度が低いので size/mtime が同じ間は拠点キャッシュを使う
+    cache = state_for(loc.code).cache
+    sig = csv_cache.signature(loc.meibo_csv)
+    hit = cache.get("names")
+    if hit and hit[0] == sig:
+        return list(hit[1])
+
+    snap = snapshot.load(loc.data_dir, loc.code)
+    if snap is not None and sig is not None and snap.meibo_sig == sig:
+        # 書き出したワーカーが Member も同期済み
+        names = snap.names()
+    else:
+        sync_members(loc.code)
+        names = _member_names(loc)
+    cache["names"] = (sig, names, frozenset(names))
+    return list(names)
+
+
+def is_member(location: str, name: str) -> bool:
+    """name が有効な名簿にあるか（名簿が空なら誰でも可）"""
+    load_names(location)
+    names = state_for(get_location(location).code).cache["names"][2]
+    return not names or name in names
+
+
+def _member_names(loc: Location) -> list[str]:
+    qs = Member.objects.filter(location=loc.code, active=True).order_by("position", "id")
+    return list(qs.values_list("name", flat=True))
+
+
+# 読み（ふりがな）として使う列名
+KANA_COLUMNS = ("ふりがな", "フリガナ", "よみ", "読み", "カナ")
+
+
+def _read_roster(loc: Location) -> list[tuple[str, str]]:
+    """meibo.csv の (名前, 読み)。空行と重複は除く"""
+    table = _read_csv_safely(loc.meibo_csv)
+    if table.empty:
         return []
-    col = "名前" if "名前" in df.columns else df.columns[0]
-    return [str(x).strip() for x in df[col].dropna() if str(x).strip()]
+    col = table.index("名前", 0)
+    kana_col = next((table.index(c) for c in KANA_COLUMNS if c in table.columns), None)
+    roster = {}
+    for r in table.rows:
+        name = _cell(r, col)
+        if name and name not in roster:
+            roster[name] = _cell(r, kana_col)
+    return list(roster.items())
 
 
-@transaction.atomic
-def reload_from_csv() -> None:
+def sync_members(location: str = DEFAULT_LOCATION, force: bool = False) -> bool:
+    """meibo.csv → Member を差分で反映（追加/更新/無効化。削除はしない）。CSVを読んだら True
+
+    前回同期した size/mtime と同じなら何もしない。
+    """
+    loc = get_location(location)
+    cache = state_for(loc.code).cache
+    sig = csv_cache.signature(loc.meibo_csv)
+    if not force and cache.get("meibo_sig") == sig:
+        return False
+
+    with timer("members.sync") as t:
+        roster = _read_roster(loc)
+        t.rows = len(roster)
+        with transaction.atomic():
+            existing = {m.name: m for m in Member.objects.filter(location=loc.code)}
+            now = timezone.now()
+            added, updated = [], []
+            for pos, (name, kana_text) in enumerate(roster):
+                fields = {
+                    "kana": kana_text,
+                    "key": kana.normalize(name),
+                    "kana_key": kana.normalize(kana_text),
+                    "position": pos,
+                    "active": True,
+                }
+                m = existing.pop(name, None)
+                if m is None:
+                    added.append(Member(location=loc.code, name=name, **fields))
+                elif any(getattr(m, k) != v for k, v in fields.items()):
+                    for k, v in fields.items():
+                        setattr(m, k, v)
+                    m.updated_at = now
+                    updated.append(m)
+            # 同時に同期した他ワーカーと重なっても一意制約で弾くだけ
+            Member.objects.bulk_create(added, ignore_conflicts=True)
+            Member.objects.bulk_update(updated, ["kana", "key", "kana_key", "position", "active", "updated_at"])
+            gone = [m.id for m in existing.values() if m.active]
+            if gone:
+                Member.objects.filter(id__in=gone).update(active=False, updated_at=now)
+    cache["meibo_sig"] = sig
+    return True
+
+
+def search_members(location: str, q: str = "", limit: int = 20) -> list[str]:
+    """名前か読みが q で始まる有効な名簿（q は kana.normalize で正規化して比べる）"""
+    sync_members(location)
+    qs = Member.objects.filter(location=get_location(location).code, active=True)
+    key = kana.normalize(q)
+    if key:
+        # LIKE 'x%' は SQLite では索引を使わないので範囲で
+        end = key + "\U0010ffff"
+        qs = qs.filter(Q(key__gte=key, key__lt=end) | Q(kana_key__gte=key, kana_key__lt=end))
+    return list(qs.order_by("position", "id").values_list("name", flat=True)[:limit])
+
+
+def reload_from_csv(location: str = DEFAULT_LOCATION, force: bool = False) -> int | None:
     """zaikokanri.csv → Inventory(SQLite) に反映
 
     - お弁当, 在庫数, 賞味期限, 補填ライン, アラート を優先的に使用
-    - CSVが更新されたら次回API呼び出し時に自動で反映（この関数が呼ばれるたびに読み直す）
+    - CSVが更新されたら次回API呼び出し時に自動で反映（前回取込時から size/mtime が変わった時だけ読み直す）
+    - 拠点ごとのロックで直列化（他拠点の取込/確定はブロックしない）
+    - 同時に来た取込は1回にまとめ、後から来た呼び出しは先行の完了を待つ
+    - 途中で止まったチャンク確定があれば取り込まず、その run id を返す（通常は None）
+    """
+    loc = get_location(location)
+    if not force and not _csv_changed(loc):
+        return None
+
+    def run():
+        with csv_lock(loc):
+            return _sync_csv(loc, force=force)
+
+    return _reload_flight.do(loc.code, run)
+
+
+_reload_flight = SingleFlight("reload")
+
+
+def _csv_changed(loc: Location) -> bool:
+    sig = csv_cache.signature(loc.zaiko_csv)
+    cache = state_for(loc.code).cache
+    if cache.get("zaiko_sig") == sig:
+        return False
+    snap = snapshot.load(loc.data_dir, loc.code)
+    if snap is not None and sig is not None and snap.zaiko_sig == sig:
+        # 他のワーカーがこのCSVを取込済み
+        cache["zaiko_sig"] = sig
+        return False
+    return True
+
+
+def _mark_imported(loc: Location, sig=None) -> None:
+    # ロールバックされたら取込済みにしない
+    sig = sig or csv_cache.signature(loc.zaiko_csv)
+    cache = state_for(loc.code).cache
+
+    def done():
+        cache["zaiko_sig"] = sig
+        _publish_snapshot(loc, sig)
+
+    transaction.on_commit(done)
+
+
+def _publish_snapshot(loc: Location, zaiko_sig) -> None:
+    """コミット済みのロットと名簿を共有スナップショットに書き出す（他ワーカーは取込/DB読込を省ける）"""
+    if not snapshot.enabled():
+        return
+    # 版を先に読む（ロットを読んだ後に変更が入っても、古い版のスナップショットとして無視されるだけ）
+    version = changes.current_version(loc.code, ChangeLog.LOT)
+    try:
+        with timer("snapshot.publish") as t:
+            lots = list(
+                Inventory.objects.filter(location=loc.code).order_by("item", "expiry").values_list(*LOT_FIELDS)
+            )
+            sync_members(loc.code)
+            names = _member_names(loc)
+            path = snapshot.publish(
+                loc.data_dir, loc.code, version, zaiko_sig, state_for(loc.code).cache.get("meibo_sig"), lots, names
+            )
+            t.rows = len(lots)
+            t.bytes = _size(path)
+    except OSError:
+        # Windows では mmap 中のファイルを置き換えられないことがある。古いスナップショットは版違いで使われない
+        pass
+
+
+def _sync_csv(loc: Location, force: bool = False) -> int | None:
+    """csv_lock 取得済みで呼ぶ。CSVが前回取込から変わっていれば Inventory を入れ替える
+
+    途中で止まったチャンク確定があるときは取り込まずに、その run の id を返す（import_blocked_by）。
     """
-    df = _read_csv_safely(ZAIKO_CSV)
-    if df.empty:
+    if not force and not _csv_changed(loc):
+        return None
+    run = _unfinished_run(loc)
+    if run is not None:
+        # 途中で止まったチャンク確定の分だけ DB の在庫が CSV より新しい。再開して書き戻すまで取り込まない
+        return run.id
+    sig = csv_cache.signature(loc.zaiko_csv)
+    _reload(loc, full=force)
+    _mark_imported(loc, sig)
+    return None
+
+
+@timed("reload_from_csv")
+@transaction.atomic
+def _reload(loc: Location, full: bool = False) -> None:
+    state = None if full else CsvIngestState.objects.filter(location=loc.code, path=str(loc.zaiko_csv)).first()
+    if state and _reload_tail(loc, state):
         return
 
-    item_col = "お弁当" if "お弁当" in df.columns else df.columns[0]
-    expiry_col = "賞味期限" if "賞味期限" in df.columns else (df.columns[1] if len(df.columns) > 1 else df.columns[0])
-    qty_col = "在庫数" if "在庫数" in df.columns else df.columns[-1]
-    refill_col = "補填ライン" if "補填ライン" in df.columns else None
-    alert_col = "アラート" if "アラート" in df.columns else None
+    # 追記だけかどうかの判定用に、読む前の状態を取っておく（読んでいる間に足された行は次回の差分で拾う）
+    snap = csv_tail.snapshot(loc.zaiko_csv)
+    if _streaming(loc.zaiko_csv):
+        header = _reload_chunked(loc)
+    else:
+        header = _reload_full(loc)
+    if header is not None:
+        _save_ingest_state(loc, snap, header.columns, header.encoding)
 
-    Inventory.objects.all().delete()
 
+def _reload_full(loc: Location) -> CsvTable | None:
+    """全件読んで Inventory を入れ替える。読んだ表（列名/文字コード用）を返す。1行も無ければ None"""
+    table = _read_csv_safely(loc.zaiko_csv)
+    if table.empty:
+        return None
+
+    cols = _zaiko_columns(table)
+    fields = ("item", "expiry", "qty", "refill_line", "alert")
+    before = {(r[0], r[1]): r for r in Inventory.objects.filter(location=loc.code).values_list(*fields)}
+
+    with timer("reload.delete") as t:
+        t.rows = Inventory.objects.filter(location=loc.code).delete()[0]
+
+    rows = _inventory_rows(loc, table, cols)
+    if rows:
+        with timer("reload.insert") as t:
+            Inventory.objects.bulk_create(rows, ignore_conflicts=True, batch_size=_chunk_rows())
+            t.rows = len(rows)
+
+    # 差分同期用に、中身が変わった/増えた/消えたロットだけ記録（同じキーは先の行が入る）
+    after = {}
+    for x in rows:
+        after.setdefault((x.item, x.expiry), (x.item, x.expiry, x.qty, x.refill_line, x.alert))
+    changes.record_lots(loc.code, [k for k in before.keys() | after.keys() if before.get(k) != after.get(k)])
+    return table
+
+
+def _reload_chunked(loc: Location) -> CsvTable | None:
+    """ORDERS_CSV_CHUNK_ROWS 行ずつ読んでは bulk_create（_reload の transaction 内で呼ぶ）。最初のチャンクを返す"""
+    first = None
+    for chunk in get_engine().iter_chunks(loc.zaiko_csv, _chunk_rows()):
+        if first is None:
+            # 1行も読めないCSVなら今の在庫を消さない（_reload_full と同じ）
+            with timer("reload.delete") as t:
+                t.rows = Inventory.objects.filter(location=loc.code).delete()[0]
+            # 前後の比較はメモリを使うので、差分同期のクライアントには全件取り直してもらう
+            changes.record_lot_reset(loc.code)
+            first = chunk
+        with timer("reload.chunk") as t:
+            rows = _inventory_rows(loc, chunk, _zaiko_columns(chunk))
+            Inventory.objects.bulk_create(rows, ignore_conflicts=True)
+            t.rows = len(rows)
+        heartbeat()
+    return first
+
+
+def _reload_tail(loc: Location, state: CsvIngestState) -> bool:
+    """前回取込後に行が追記されただけなら追記分だけ取り込んで True"""
+    with timer("reload.tail") as t:
+        hit = csv_tail.appended(loc.zaiko_csv, state.offset, state.prefix_hash)
+        if hit is None:
+            return False
+        data, snap = hit
+        # 追記分だけから文字コードを推測すると取り違えうるので、全件取込のときの文字コードで読む
+        table = read_rows(data, state.columns, state.encoding or None)
+        if table is None:
+            return False
+        # 全件取込と同じく、同じ (お弁当, 賞味期限) は先に出てきた行を優先（既にあるロットは入れない）
+        fresh = {}
+        for x in _inventory_rows(loc, table, _zaiko_columns(table)):
+            fresh.setdefault((x.item, x.expiry), x)
+        existing = Inventory.objects.filter(location=loc.code, item__in={k[0] for k in fresh}).values_list("item", "expiry")
+        for key in existing:
+            fresh.pop(key, None)
+        rows = list(fresh.values())
+        Inventory.objects.bulk_create(rows, ignore_conflicts=True, batch_size=_chunk_rows())
+        # 実際に入ったロットだけ記録する（捨てた重複行を変更として配らない）
+        changes.record_lots(loc.code, rows)
+        t.rows = len(rows)
+        t.bytes = len(data)
+    _save_ingest_state(loc, snap, state.columns, state.encoding)
+    return True
+
+
+def _save_ingest_state(
+    loc: Location, snap: csv_tail.Snapshot | None, columns: list[str], encoding: str | None
+) -> None:
+    if snap is None:
+        CsvIngestState.objects.filter(location=loc.code).delete()
+        return
+    CsvIngestState.objects.update_or_create(
+        location=loc.code,
+        defaults={
+            "path": str(loc.zaiko_csv), "offset": snap.offset, "prefix_hash": snap.prefix_hash,
+            "columns": columns, "encoding": encoding or "",
+        },
+    )
+
+
+def _inventory_rows(loc: Location, table: CsvTable, cols) -> list[Inventory]:
+    item_col, expiry_col, qty_col, refill_col, alert_col = cols
     rows: list[Inventory] = []
-    for _, r in df.iterrows():
-        item = str(r.get(item_col, "")).strip()
-        expiry_raw = str(r.get(expiry_col, "")).strip()
-        expiry = _normalize_date_str(expiry_raw)
+    for r in table.rows:
+        item = _cell(r, item_col)
+        expiry = _normalize_date_str(_cell(r, expiry_col))
         try:
-            qty = int(float(r.get(qty_col, 0) or 0))
+            qty = int(float(_cell(r, qty_col) or 0))
         except Exception:
             qty = 0
         try:
-            refill_line = int(float(r.get(refill_col, 0) or 0)) if refill_col else 0
+            refill_line = int(float(_cell(r, refill_col) or 0))
         except Exception:
             refill_line = 0
-        alert = str(r.get(alert_col, "")).strip() if alert_col else ""
-        if alert.lower() == "nan":
-            alert = ""
+        alert = _cell(r, alert_col)
         if item:
-            rows.append(Inventory(item=item, expiry=expiry, qty=qty, refill_line=refill_line, alert=alert))
+            rows.append(Inventory(location=loc.code, item=item, expiry=expiry, qty=qty, refill_line=refill_line, alert=alert))
+    ids = catalog.ids_for({x.item for x in rows})
+    for x in rows:
+        x.item_ref_id = ids.get(x.item)
+    return rows
 
-    if rows:
-        Inventory.objects.bulk_create(rows, ignore_conflicts=True)
+
+def _write_inventory_back(loc: Location) -> None:
+    with csv_lock(loc):
+        _write_back(loc)
 
 
-def _write_inventory_back() -> None:
-    df = _read_csv_safely(ZAIKO_CSV)
-    if df.empty:
+@timed("write_inventory_back")
+def _write_back(loc: Location) -> None:
+    if _streaming(loc.zaiko_csv):
+        _write_back_chunked(loc)
         return
 
-    item_col = "お弁当" if "お弁当" in df.columns else df.columns[0]
-    expiry_col = "賞味期限" if "賞味期限" in df.columns else (df.columns[1] if len(df.columns) > 1 else df.columns[0])
-    qty_col = "在庫数" if "在庫数" in df.columns else df.columns[-1]
+    table = _read_csv_safely(loc.zaiko_csv)
+    if table.empty:
+        return
 
-    lookup = {(i.item.strip(), i.expiry.strip()): int(i.qty) for i in Inventory.objects.all()}
+    item_col, expiry_col, qty_col, _, _ = _zaiko_columns(table)
 
-    def norm(x):
-        return str(x).strip()
+    lookup = {(r.item.strip(), r.expiry.strip()): int(r.qty) for r in query_lots(loc.code)}
 
-    new_qty = []
-    for _, r in df.iterrows():
-        key = (norm(r.get(item_col, "")), norm(r.get(expiry_col, "")))
-        q = lookup.get(key)
-        if q is None:
-            q = r.get(qty_col, 0)
-        new_qty.append(q)
+    for r in table.rows:
+        # Inventory.expiry は取込時に正規化済みなので CSV 側も揃えて突き合わせる
+        q = lookup.get((_cell(r, item_col), _normalize_date_str(_cell(r, expiry_col))))
+        if q is not None:
+            r[qty_col] = str(q)
 
-    df[qty_col] = new_qty
-    df.to_csv(ZAIKO_CSV, index=False, encoding="utf-8-sig")
+    # 途中まで書かれたCSVを他ワーカーが読まないよう一時ファイル → 置き換え
+    tmp = loc.zaiko_csv.with_name(loc.zaiko_csv.name + ".tmp")
+    with timer("csv.write") as t:
+        get_engine().write(tmp, table, compressed=is_gzip(loc.zaiko_csv))
+        os.replace(tmp, loc.zaiko_csv)
+        t.rows = len(table)
+        t.bytes = _size(loc.zaiko_csv)
+    # 書き戻したCSVは Inventory と一致しているので、ここから先の追記は差分で取り込める
+    _save_ingest_state(loc, csv_tail.snapshot(loc.zaiko_csv), table.columns, WRITE_ENCODING)
 
 
-def options() -> dict:
-    reload_from_csv()
-    inv = list(Inventory.objects.all())
+def _write_back_chunked(loc: Location) -> None:
+    """チャンクごとに該当ロットの在庫数だけDBから引いて書き出す（全ロットの辞書を作らない）"""
+    chunks = get_engine().iter_chunks(loc.zaiko_csv, _chunk_rows())
+    first = next(chunks, None)
+    if first is None:
+        return
 
-    names = load_names()
-    okazu = sorted({i.item for i in inv if not str(i.item).startswith("ご飯")})
-    gohan = sorted({i.item for i in inv if str(i.item).startswith("ご飯")})
+    def rows():
+        for chunk in itertools.chain([first], chunks):
+            item_col, expiry_col, qty_col, _, _ = _zaiko_columns(chunk)
+            keys = [(_cell(r, item_col), _normalize_date_str(_cell(r, expiry_col))) for r in chunk.rows]
+            lookup = {
+                (item, expiry): qty
+                for item, expiry, qty in Inventory.objects.filter(
+                    location=loc.code, item__in={k[0] for k in keys}, expiry__in={k[1] for k in keys}
+                ).values_list("item", "expiry", "qty")
+            }
+            for r, key in zip(chunk.rows, keys):
+                q = lookup.get(key)
+                if q is not None:
+                    r[qty_col] = str(q)
+            yield from chunk.rows
+            heartbeat()
+
+    tmp = loc.zaiko_csv.with_name(loc.zaiko_csv.name + ".tmp")
+    with timer("csv.write") as t:
+        t.rows = write_stream(tmp, first.columns, rows(), compressed=is_gzip(loc.zaiko_csv))
+        os.replace(tmp, loc.zaiko_csv)
+        t.bytes = _size(loc.zaiko_csv)
+    _save_ingest_state(loc, csv_tail.snapshot(loc.zaiko_csv), first.columns, WRITE_ENCODING)
+
+
+@timed("options")
+def options(location: str = DEFAULT_LOCATION, names: bool = True) -> dict:
+    """注文画面の選択肢。names=False なら名簿を含めない（/api/members/ で検索する画面用）"""
+    reload_from_csv(location)
+    by_item = _load_lots(location).by_item()
+
+    cats = catalog.categories(by_item)
+    okazu = sorted(i for i, c in cats.items() if c == Item.OKAZU)
+    gohan = sorted(i for i, c in cats.items() if c == Item.GOHAN)
 
     item_to_expiry: dict[str, list[str]] = {}
     qty_map: dict[str, dict[str, int]] = {}
 
-    for i in inv:
-        item_to_expiry.setdefault(i.item, [])
-        if i.expiry and i.expiry not in item_to_expiry[i.item]:
-            item_to_expiry[i.item].append(i.expiry)
-
-        qty_map.setdefault(i.item, {})
-        qty_map[i.item][i.expiry] = int(i.qty)
-
-    for k in item_to_expiry:
-        item_to_expiry[k] = sorted(item_to_expiry[k])
+    for item, recs in by_item.items():
+        item_to_expiry[item] = sorted({r.expiry for r in recs if r.expiry})
+        qty_map[item] = {r.expiry: int(r.qty) for r in recs}
 
-    return {
-        "names": names,
+    out = {
         "okazu_items": okazu,
         "gohan_items": gohan,
         "item_to_expiry": item_to_expiry,
         "qty_map": qty_map,
     }
+    if names:
+        out = {"names": load_names(location), **out}
+    return out
+
+
+@timed("confirm_all")
+def confirm_all(
+    location: str = DEFAULT_LOCATION, ids: list[int] | None = None, name: str = "", start: str = "", end: str = ""
+) -> dict:
+    """未確定の注文を確定して在庫を引き、CSVへ書き戻す
+
+    ids / name / start,end（作成日 YYYY-MM-DD、当日を含む）を指定するとその注文だけを確定する（省略時は全件）。
+    対象が ORDERS_CONFIRM_CHUNK_ORDERS 件を超える場合はチャンクごとにコミットする _confirm_chunked で処理する。
+    途中で止まった確定があれば、先にそれを再開して終わらせる（応答の resumed にその run id）。
+    """
+    loc = get_location(location)
+    if ids is not None and not ids:
+        # 空の ids を「全件」と取り違えない
+        raise InvalidFilter("ids required")
+    _parse_day(start, "start")
+    _parse_day(end, "end")
+    filters = {k: v for k, v in (("ids", sorted(set(ids or ()))), ("name", name), ("start", start), ("end", end)) if v}
+    with csv_lock(loc):
+        resumed = None
+        run = _unfinished_run(loc)
+        if run is not None:
+            try:
+                resumed = _confirm_chunked(loc, run)["run"]
+            except Exception as e:
+                raise ConfirmBlocked(run.id, str(e)) from e
+        if _pending(loc, filters).count() <= _confirm_chunk():
+            result = _confirm_all(loc, filters)
+        else:
+            result = _confirm_chunked(loc, None, filters)
+    if resumed:
+        result["resumed"] = resumed
+    return result
+
+
+def cancel_orders(location: str = DEFAULT_LOCATION, ids: list[int] | None = None) -> int:
+    """未確定の注文をまとめて取消（1回の UPDATE）。取り消した件数を返す
+
+    確定済み・取消済み・他拠点・存在しない id は無視する。ChangeLog には UPDATE が実際に変えた注文だけ記録する。
+    """
+    if not ids:
+        return 0
+    loc = get_location(location)
+    ids = sorted({int(i) for i in ids})
+    batch = _chunk_rows()
+    cancelled: list[int] = []
+    with transaction.atomic():
+        for i in range(0, len(ids), batch):
+            cancelled += _cancel_pending(loc, ids[i:i + batch])
+        changes.record_orders(loc.code, cancelled)
+    return len(cancelled)
+
+
+def _cancel_pending(loc: Location, ids: list[int]) -> list[int]:
+    """ids のうち未確定の注文を取消にして、取り消した id を返す"""
+    qs = Order.objects.filter(location=loc.code, id__in=ids, confirmed=False, cancelled=False)
+    conn = connections[qs.db]
+    if conn.vendor in ("sqlite", "postgresql") and conn.features.can_return_columns_from_insert:
+        # UPDATE ... RETURNING（SQLite 3.35+ / PostgreSQL）。変えた行の id を同じ文で受け取る
+        q = conn.ops.quote_name
+        sql = (
+            f"UPDATE {q(Order._meta.db_table)} SET {q('cancelled')} = %s"
+            f" WHERE {q('location')} = %s AND {q('confirmed')} = %s AND {q('cancelled')} = %s"
+            f" AND {q('id')} IN ({', '.join(['%s'] * len(ids))}) RETURNING {q('id')}"
+        )
+        with conn.cursor() as cur:
+            cur.execute(sql, [True, loc.code, False, False, *ids])
+            return [r[0] for r in cur.fetchall()]
+    # RETURNING が無いDB: 行をロックしてから同じ条件で UPDATE
+    targets = list(qs.select_for_update().values_list("id", flat=True))
+    Order.objects.filter(id__in=targets).update(cancelled=True)
+    return targets
+
+
+def _pending(loc: Location, filters: dict | None = None):
+    qs = Order.objects.filter(location=loc.code, confirmed=False, cancelled=False)
+    return _filter_orders(qs, **filters) if filters else qs
+
+
+def _confirm_chunk() -> int:
+    return max(1, int(getattr(settings, "ORDERS_CONFIRM_CHUNK_ORDERS", 500)))
+
+
+def _confirm_max_resumes() -> int:
+    return max(1, int(getattr(settings, "ORDERS_CONFIRM_MAX_RESUMES", 3)))
+
+
+class ConfirmBlocked(Exception):
+    """途中で止まったチャンク確定の再開に失敗した（その run が終わるか中止されるまで CSV の取込は止まる）"""
+
+    def __init__(self, run_id: int, error: str):
+        super().__init__(f"import blocked by confirm run {run_id}: {error}")
+        self.run_id = run_id
+        self.error = error
+
+
+def import_blocked_by(location: str = DEFAULT_LOCATION) -> int | None:
+    """CSVの取込を止めている（再開待ちの）チャンク確定の run id。無ければ None"""
+    run = _unfinished_run(get_location(location))
+    return run.id if run else None
+
+
+def abandon_confirm_run(location: str, run_id: int) -> ConfirmRun | None:
+    """再開待ちのチャンク確定を中止して CSV の取込を再開できるようにする。対象が無ければ None
+
+    確定済みのチャンクの在庫はまだ CSV に書き戻されていないので、先に書き戻しを試みる。
+    書き戻せなかった場合はその分を CSV の値で上書きすることになる（error に残す）。
+    """
+    loc = get_location(location)
+    with csv_lock(loc):
+        run = _unfinished_run(loc)
+        if run is None or run.id != run_id:
+            return None
+        _abandon(loc, run, "abandoned")
+    run.refresh_from_db()
+    return run
+
+
+def _abandon(loc: Location, run: ConfirmRun, error: str) -> None:
+    try:
+        _write_back(loc)
+        _mark_imported(loc)
+    except Exception as e:
+        error = f"{error}; write-back failed: {e}"
+    ConfirmRun.objects.filter(id=run.id).update(status=ConfirmRun.ABANDONED, error=error, finished_at=timezone.now())
+
+
+def _unfinished_run(loc: Location) -> ConfirmRun | None:
+    return (
+        ConfirmRun.objects.filter(location=loc.code, status__in=[ConfirmRun.RUNNING, ConfirmRun.FAILED])
+        .order_by("-created_at")
+        .first()
+    )
 
 
 @transaction.atomic
-def confirm_all() -> dict:
-    orders = Order.objects.filter(confirmed=False, cancelled=False).order_by("created_at")
+def _confirm_all(loc: Location, filters: dict | None = None) -> dict:
+    orders = _pending(loc, filters).order_by("created_at")
     if not orders.exists():
         return {"confirmed": 0}
 
-    reload_from_csv()
-    _backup_csv(ZAIKO_CSV, "zaikokanri")
-
-    def dec(item: str, expiry: str):
-        if not item:
-            return
-        obj = Inventory.objects.filter(item=item, expiry=expiry).first()
-        if not obj:
-            obj = Inventory.objects.filter(item=item).first()
-        if obj:
-            obj.qty = max(0, int(obj.qty) - 1)
-            obj.save(update_fields=["qty"])
-
-    now = timezone.now()
-    n = 0
-    for o in orders:
-        dec(o.okazu, o.okazu_expiry)
-        dec(o.gohan, o.gohan_expiry)
-        o.confirmed = True
-        o.confirmed_at = now
-        o.save(update_fields=["confirmed", "confirmed_at"])
-        n += 1
-
-    _write_inventory_back()
-    return {"confirmed": n}
-
-
-def inventory_csv_lots() -> list[dict]:
-    reload_from_csv()
-    inv = Inventory.objects.all().order_by("item", "expiry")
+    _sync_csv(loc)
+    _backup_csv(loc.zaiko_csv, "zaikokanri")
+
+    # 品目ごとに賞味期限順のロットを1回だけ組み立て、全注文をメモリ上で引き当てる
+    alloc = LotAllocator(list(Inventory.objects.filter(location=loc.code)), date.today())
+    confirmed, shortages = _confirm_orders(loc, alloc, list(orders), timezone.now())
+
+    _write_back(loc)
+    # 書き戻したCSVは Inventory と一致しているので再取込は不要
+    _mark_imported(loc)
+    return {"confirmed": confirmed, "shortages": shortages}
+
+
+def _confirm_orders(loc: Location, alloc: LotAllocator, orders: list[Order], now) -> tuple[int, int]:
+    """orders を確定済みにして在庫を引き当て、DBへまとめて保存する。(確定した数, 足りなかった数) を返す
+
+    トランザクションの中で呼ぶ。先に UPDATE で確定済みにして（この時点で行の書き込みロックを持つ）、
+    その UPDATE が実際に変えた注文（confirmed_at == now）だけを引き当てる。
+    orders を選んでから UPDATE までに取り消された注文は在庫を引かない。
+    """
+    batch = _chunk_rows()
+    ids = [o.id for o in orders]
+    for i in range(0, len(ids), batch):
+        Order.objects.filter(id__in=ids[i:i + batch], confirmed=False, cancelled=False).update(
+            confirmed=True, confirmed_at=now
+        )
+    claimed: set[int] = set()
+    for i in range(0, len(ids), batch):
+        claimed.update(
+            Order.objects.filter(id__in=ids[i:i + batch], confirmed=True, confirmed_at=now).values_list("id", flat=True)
+        )
+    orders = [o for o in orders if o.id in claimed]
+    if not orders:
+        return 0, 0
+
+    allocations: list[LotAllocation] = []
+    shortages = 0
+    with timer("confirm.allocate") as t:
+        for o in orders:
+            for part, item, expiry in (("okazu", o.okazu, o.okazu_expiry), ("gohan", o.gohan, o.gohan_expiry)):
+                if not item:
+                    continue
+                taken, short = alloc.allocate(item, expiry)
+                shortages += short
+                allocations += [
+                    LotAllocation(location=loc.code, order=o, part=part, item=lot.item, expiry=lot.expiry, qty=k)
+                    for lot, k in taken
+                ]
+        t.rows = len(orders)
+
+    lots = alloc.changed()
+    Inventory.objects.bulk_update(lots, ["qty"], batch_size=batch)
+    changes.record_lots(loc.code, lots)
+    changes.record_orders(loc.code, [o.id for o in orders])
+    LotAllocation.objects.bulk_create(allocations, batch_size=batch)
+    return len(orders), shortages
+
+
+@timed("confirm_chunked")
+def _confirm_chunked(loc: Location, run: ConfirmRun | None, filters: dict | None = None) -> dict:
+    """ORDERS_CONFIRM_CHUNK_ORDERS 件ずつ別トランザクションで確定し、最後に1回だけCSVへ書き戻す
+
+    チャンクの合間は DB の書き込みロックを手放すので、その間も注文の受付は続けられる。
+    途中で失敗/プロセスが落ちた場合は ConfirmRun が running/failed のまま残り、
+    次の confirm_all() が同じ run の続き（まだ未確定の注文）から再開する。
+    それまでは DB の在庫が CSV より新しいので、CSVの再取込は止めておく（_sync_csv）。
+    再開が ORDERS_CONFIRM_MAX_RESUMES 回失敗したら abandoned にして取込を止めるのをやめる。
+    """
+    if run is None:
+        _sync_csv(loc)
+        _backup_csv(loc.zaiko_csv, "zaikokanri")
+        pending = _pending(loc, filters)
+        run = ConfirmRun.objects.create(
+            location=loc.code,
+            filters=filters or {},
+            last_order_id=pending.aggregate(m=Max("id"))["m"] or 0,
+            total=pending.count(),
+        )
+    else:
+        run.attempts += 1
+        ConfirmRun.objects.filter(id=run.id).update(status=ConfirmRun.RUNNING, error="", attempts=run.attempts)
+
+    size = _confirm_chunk()
+    try:
+        alloc = LotAllocator(list(Inventory.objects.filter(location=loc.code)), date.today())
+        while True:
+            with transaction.atomic():
+                chunk = list(_pending(loc, run.filters).filter(id__lte=run.last_order_id).order_by("created_at", "id")[:size])
+                if not chunk:
+                    break
+                confirmed, shortages = _confirm_orders(loc, alloc, chunk, timezone.now())
+                ConfirmRun.objects.filter(id=run.id).update(
+                    processed=F("processed") + confirmed, shortages=F("shortages") + shortages
+                )
+            # チャンクの合間に CSV ロックの期限を延ばす（TTL を超える確定でも他のワーカーに奪われない）
+            heartbeat()
+        _write_back(loc)
+        _mark_imported(loc)
+    except Exception as e:
+        if run.attempts >= _confirm_max_resumes():
+            _abandon(loc, run, str(e))
+        else:
+            ConfirmRun.objects.filter(id=run.id).update(status=ConfirmRun.FAILED, error=str(e))
+        raise
+    ConfirmRun.objects.filter(id=run.id).update(status=ConfirmRun.DONE, finished_at=timezone.now())
+    run.refresh_from_db()
+    return {"confirmed": run.processed, "shortages": run.shortages, "run": run.id}
+
+
+def confirm_run_dict(run: ConfirmRun) -> dict:
+    return {
+        "id": run.id,
+        "status": run.status,
+        "total": run.total,
+        "processed": run.processed,
+        "progress": min(100, int(run.processed * 100 / run.total)) if run.total else 100,
+        "shortages": run.shortages,
+        "attempts": run.attempts,
+        "error": run.error,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+def _load_lots(location: str) -> Lots:
+    loc = get_location(location)
+    snap = snapshot.load(loc.data_dir, loc.code)
+    if snap is not None and snap.version == changes.current_version(location, ChangeLog.LOT):
+        # 取込/確定したワーカーが書いたスナップショット（DB と同じ内容、item, expiry 順）
+        return from_rows(snap.lots())
+    return query_lots(location)
+
+
+def _lot_rows(lots) -> list[dict]:
     return [
         {
             "item": i.item,
@@ -236,17 +824,23 @@ def inventory_csv_lots() -> list[dict]:
             "refill_line": i.refill_line,
             "alert": i.alert or "",
         }
-        for i in inv
+        for i in lots
     ]
 
 
-def inventory_csv_summary(today: date | None = None) -> list[dict]:
+def inventory_csv_lot_rows(location: str = DEFAULT_LOCATION) -> list[tuple]:
+    """在庫ロットを LOT_COLUMNS 順のタプルで（スナップショットが新しければ DB を読まない）"""
+    reload_from_csv(location)
+    return [(l.item, l.expiry, l.qty, l.refill_line, l.alert or "") for l in _load_lots(location)]
+
+
+def inventory_csv_summary(today: date | None = None, location: str = DEFAULT_LOCATION) -> list[dict]:
     """お弁当ごと（ロット合算）の在庫/閾値/アラート計算"""
-    reload_from_csv()
-    if today is None:
-        today = date.today()
+    reload_from_csv(location)
+    return _summarize(_load_lots(location), today or date.today())
+
 
-    lots = list(Inventory.objects.all())
+def _summarize(lots, today: date) -> list[dict]:
     by_item: dict[str, dict] = {}
     for l in lots:
         d = by_item.setdefault(l.item, {"item": l.item, "total_qty": 0, "threshold": 0, "earliest_expiry": "", "lots": 0})
@@ -298,9 +892,12 @@ def inventory_csv_summary(today: date | None = None) -> list[dict]:
     return out
 
 
-def generate_purchase_candidates() -> list[dict]:
+def generate_purchase_candidates(location: str = DEFAULT_LOCATION) -> list[dict]:
     """在庫が閾値を下回ったお弁当を発注候補として返す"""
-    summary = inventory_csv_summary()
+    return _candidates(inventory_csv_summary(location=location))
+
+
+def _candidates(summary: list[dict]) -> list[dict]:
     cands = []
     for s in summary:
         th = int(s.get("threshold") or 0)
@@ -317,59 +914,93 @@ def generate_purchase_candidates() -> list[dict]:
     return cands
 
 
-def export_purchase_candidates_csv() -> Path:
-    """発注候補CSVを data/exports に書き出し（最新ファイルを返す）"""
-    exports_dir = DATA_DIR / "exports"
-    exports_dir.mkdir(parents=True, exist_ok=True)
-    ts = timezone.now().strftime("%Y%m%d_%H%M%S")
-    path = exports_dir / f"purchase_candidates_{ts}.csv"
+DASHBOARD_SECTIONS = ("summary", "lots", "alerts", "carryover")
+
+
+@timed("inventory_dashboard")
+def inventory_dashboard(sections=None, today: date | None = None, location: str = DEFAULT_LOCATION) -> dict:
+    """在庫画面の summary / lots / alerts / carryover を1回の取込・1回の全件読込でまとめて返す"""
+    wanted = [x for x in (sections or DASHBOARD_SECTIONS) if x in DASHBOARD_SECTIONS]
+    today = today or date.today()
+    reload_from_csv(location)
+    lots = _load_lots(location)
+
+    out: dict = {}
+    summary = None
+    if "summary" in wanted or "alerts" in wanted:
+        summary = _summarize(lots, today)
+    if "summary" in wanted:
+        out["summary"] = summary
+    if "lots" in wanted:
+        out["lots"] = _lot_rows(lots)
+    if "alerts" in wanted:
+        cands = _candidates(summary)
+        out["alerts"] = cands
+        out["exported"] = export_purchase_candidates_csv(location, cands).name
+    if "carryover" in wanted:
+        out["carryover"] = _carryover(lots, today, location)
+    return out
 
-    cands = generate_purchase_candidates()
-    with path.open("w", encoding="utf-8-sig", newline="") as f:
-        w = csv.writer(f)
-        w.writerow(["品目", "現在在庫", "補填ライン", "必要数", "最短賞味期限", "レベル"])
-        for c in cands:
-            w.writerow([c["item"], c["current_qty"], c["threshold"], c["need"], c["earliest_expiry"], c["alert_level"]])
-    return path
 
+def export_purchase_candidates_csv(location: str = DEFAULT_LOCATION, cands: list[dict] | None = None) -> Path:
+    """発注候補CSVを data/exports に書き出し（最新ファイルを返す）
 
-def get_latest_export(prefix: str) -> Path | None:
-    exports_dir = DATA_DIR / "exports"
-    if not exports_dir.exists():
-        return None
-    files = sorted(exports_dir.glob(f"{prefix}_*.csv"), key=lambda p: p.stat().st_mtime, reverse=True)
-    return files[0] if files else None
+    cands を渡した場合はそれを書き出す（計算済みの候補を再計算しない）。
+    前回の出力と内容が同じなら新しいファイルは作らず前回のファイルを返す
+    """
+    if cands is None:
+        cands = generate_purchase_candidates(location)
+    data = exports.render_csv(
+        ["品目", "現在在庫", "補填ライン", "必要数", "最短賞味期限", "レベル"],
+        ([c["item"], c["current_qty"], c["threshold"], c["need"], c["earliest_expiry"], c["alert_level"]] for c in cands),
+    )
+    return exports.write_export(get_location(location).exports_dir, "purchase_candidates", data)
 
 
-def create_carryover_snapshot(month: str) -> int:
+def get_latest_export(prefix: str, location: str = DEFAULT_LOCATION) -> Path | None:
+    return exports.latest_export(get_location(location).exports_dir, prefix)
+
+
+def create_carryover_snapshot(month: str, location: str = DEFAULT_LOCATION) -> int:
     """指定月(YYYY-MM)の繰越スナップショットを作成（同月分は上書き）"""
     from .models import CarryoverSnapshot
 
-    reload_from_csv()
-    CarryoverSnapshot.objects.filter(month=month).delete()
-
-    rows = []
-    for i in Inventory.objects.all():
-        rows.append(CarryoverSnapshot(month=month, item=i.item, expiry=i.expiry, qty=i.qty))
-    if rows:
-        CarryoverSnapshot.objects.bulk_create(rows, ignore_conflicts=True)
+    loc = get_location(location)
+    with csv_lock(loc):
+        _sync_csv(loc)
+        with transaction.atomic():
+            CarryoverSnapshot.objects.filter(location=loc.code, month=month).delete()
+
+            lots = query_lots(loc.code)
+            ids = catalog.ids_for(lots.by_item())
+            rows = []
+            for i in lots:
+                rows.append(
+                    CarryoverSnapshot(
+                        location=loc.code, month=month, item=i.item, expiry=i.expiry, qty=i.qty, item_ref_id=ids.get(i.item)
+                    )
+                )
+            if rows:
+                CarryoverSnapshot.objects.bulk_create(rows, ignore_conflicts=True)
     return len(rows)
 
 
-def carryover_report(today: date | None = None) -> dict:
+def carryover_report(today: date | None = None, location: str = DEFAULT_LOCATION) -> dict:
     """前月繰越の差分/賞味期限/ロスをまとめる"""
+    reload_from_csv(location)
+    return _carryover(_load_lots(location), today or date.today(), location)
+
+
+def _carryover(lots, today: date, location: str) -> dict:
     from .models import CarryoverSnapshot
 
-    if today is None:
-        today = date.today()
     # 前月
     first = today.replace(day=1)
     prev_last = first - __import__("datetime").timedelta(days=1)
     month = prev_last.strftime("%Y-%m")
 
-    reload_from_csv()
-    current = {(i.item, i.expiry): int(i.qty or 0) for i in Inventory.objects.all()}
-    snaps = list(CarryoverSnapshot.objects.filter(month=month))
+    current = {key: int(r.qty or 0) for key, r in lots.by_key().items()}
+    snaps = list(CarryoverSnapshot.objects.filter(location=location, month=month))
     rows = []
     for s in snaps:
         key = (s.item, s.expiry)
@@ -398,3 +1029,240 @@ def carryover_report(today: date | None = None) -> dict:
             "loss_qty": loss_qty,
         })
     return {"month": month, "has_snapshot": bool(snaps), "rows": rows}
+
+
+HISTORY_HEADER = ["日時", "名前", "おかず", "おかず賞味期限", "ご飯", "ご飯賞味期限"]
+RANKING_HEADER = ["区分", "品目", "件数"]
+EXPIRY_HEADER = ["品目", "賞味期限", "在庫数", "残日数"]
+
+
+def confirmed_orders(location: str = DEFAULT_LOCATION, name: str = "", start: str = "", end: str = "", q: str = ""):
+    """確定済み（取消除く）注文。name 完全一致 / start,end は YYYY-MM-DD（当日を含む）/ q は全文検索（search.filter_orders）"""
+    qs = Order.objects.filter(location=location, confirmed=True, cancelled=False)
+    return search.filter_orders(_filter_orders(qs, name=name, start=start, end=end), q)
+
+
+class InvalidFilter(ValueError):
+    """注文の絞り込み条件（ids / start,end）が不正"""
+
+
+def _parse_day(value: str, field: str) -> date | None:
+    """YYYY-MM-DD を date に（空なら None）。読めない/存在しない日付は InvalidFilter"""
+    if not value:
+        return None
+    try:
+        d = parse_date(value)
+    except (TypeError, ValueError):
+        d = None
+    if d is None:
+        raise InvalidFilter(f"invalid {field}")
+    return d
+
+
+def _filter_orders(qs, ids=None, name: str = "", start: str = "", end: str = ""):
+    if ids:
+        qs = qs.filter(id__in=ids)
+    if name:
+        qs = qs.filter(name=name)
+    d = _parse_day(start, "start")
+    if d:
+        qs = qs.filter(created_at__date__gte=d)
+    d = _parse_day(end, "end")
+    if d:
+        qs = qs.filter(created_at__date__lte=d)
+    return qs
+
+
+HISTORY_COLUMNS = ("id", "name", "okazu", "okazu_expiry", "gohan", "gohan_expiry", "created_at")
+
+
+def _archived_months(loc: Location, start: str, end: str, with_archive: bool = False) -> list[str]:
+    """start〜end にかかるアーカイブ済みの月。期間を指定しないときは with_archive=True の場合だけ（全月を読むので）"""
+    if not (start or end or with_archive):
+        return []
+    return archive.months_for(loc, _parse_day(start, "start"), _parse_day(end, "end"))
+
+
+def history_values(
+    location: str = DEFAULT_LOCATION, name: str = "", start: str = "", end: str = "", q: str = "",
+    with_archive: bool = False,
+) -> list[tuple]:
+    """確定済み注文を HISTORY_COLUMNS のタプルで新しい順に
+
+    期間がアーカイブ済みの月にかかればその分も含める（期間の指定が無ければ with_archive=True のときだけ）。
+    """
+    loc = get_location(location)
+    rows = list(confirmed_orders(loc.code, name, start, end, q).order_by("-created_at").values_list(*HISTORY_COLUMNS))
+    if _archived_months(loc, start, end, with_archive):
+        hot = {r[0] for r in rows}
+        d0 = _parse_day(start, "start")
+        d1 = _parse_day(end, "end")
+        old = [r for r in archive.confirmed_rows(loc, name, d0, d1, q) if r[0] not in hot]
+        if old:
+            rows.extend(old)
+            rows.sort(key=lambda r: r[6], reverse=True)
+    return rows
+
+
+def history_rows(
+    location: str = DEFAULT_LOCATION, name: str = "", start: str = "", end: str = "", progress=None, q: str = "",
+    with_archive: bool = False,
+):
+    values = history_values(location, name, start, end, q, with_archive)
+    total = len(values)
+    rows = []
+    for _, name_, okazu, okazu_expiry, gohan, gohan_expiry, created_at in values:
+        rows.append([created_at.strftime("%Y-%m-%d %H:%M:%S"), name_, okazu, okazu_expiry, gohan, gohan_expiry])
+        if progress and len(rows) % 2000 == 0:
+            progress(len(rows), total)
+    return rows
+
+
+def ranking_rows(
+    location: str = DEFAULT_LOCATION, start: str = "", end: str = "", limit: int = 200, with_archive: bool = False
+):
+    rows = []
+    for label, part in (("おかず", "okazu"), ("ご飯", "gohan")):
+        rows.extend([label, name, cnt] for name, cnt in item_counts(location, part, start, end, limit, with_archive))
+    return rows
+
+
+def item_counts(
+    location: str, part: str, start: str = "", end: str = "", limit: int = 50, with_archive: bool = False
+) -> list[tuple[str, int]]:
+    """確定済み注文の part（okazu / gohan）を品目ごとに数えて多い順に [(品目名, 件数)]
+
+    Item の整数id でまとめてから名前に戻す（品目名の文字列で GROUP BY しない）。
+    期間がアーカイブ済みの月にかかればアーカイブの件数も足す（期間の指定が無ければ with_archive=True のときだけ）。
+    """
+    loc = get_location(location)
+    ref = f"{part}_ref"
+    qs = confirmed_orders(loc.code, start=start, end=end).filter(**{f"{ref}__isnull": False})
+    qs = qs.values_list(ref).annotate(cnt=Count("id")).order_by("-cnt")
+    months = _archived_months(loc, start, end, with_archive)
+    # アーカイブと合わせる場合は DB 側を全品目数える（上位だけだと合算後の順位が変わりうる）
+    counts = list(qs if months else qs[:limit])
+    names = catalog.names_for(i for i, _ in counts)
+    if not months:
+        return [(names.get(i, ""), cnt) for i, cnt in counts]
+    total = archive.item_counts(loc, part, _parse_day(start, "start"), _parse_day(end, "end"))
+    for i, cnt in counts:
+        total[names.get(i, "")] += cnt
+    return total.most_common(limit)
+
+
+TIMESERIES_BUCKETS = ("day", "week", "month")
+# 拠点ごとに覚えておく timeseries の結果の数（条件の組み合わせごとに最新の版だけ。超えたら古く使ったものから捨てる）
+_TIMESERIES_CACHE_SIZE = 64
+
+
+def _bucket_start(d: date, bucket: str) -> date:
+    if bucket == "week":
+        return d - timedelta(days=d.weekday())
+    if bucket == "month":
+        return d.replace(day=1)
+    return d
+
+
+def consumption_timeseries(
+    location: str = DEFAULT_LOCATION, bucket: str = "day", category: str = "okazu", start: str = "", end: str = "",
+    with_archive: bool = False,
+) -> dict:
+    """確定済み注文の品目別件数を日/週(月曜始まり)/月ごとに（グラフ用）
+
+    期間の切り方は settings.TIME_ZONE（Asia/Tokyo）の日付。DB 側は1回の GROUP BY（期間, Item id）。
+    アーカイブ済みの月は history_values と同じく期間にかかるときだけ（期間の指定が無ければ with_archive=True のとき）足す。
+    結果は注文の版（ChangeLog）が変わるまで拠点キャッシュから返す。
+    """
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"unknown bucket: {bucket}")
+    if category not in (Item.OKAZU, Item.GOHAN):
+        raise ValueError(f"unknown category: {category}")
+    loc = get_location(location)
+    months = _archived_months(loc, start, end, with_archive)
+    version = (changes.current_version(loc.code, ChangeLog.ORDER), tuple(months))
+    key = (bucket, category, start, end, with_archive)
+    cache: OrderedDict = state_for(loc.code).cache.setdefault("timeseries", OrderedDict())
+    hit = cache.get(key)
+    if hit and hit[0] == version:
+        try:
+            cache.move_to_end(key)
+        except KeyError:
+            pass  # 他のスレッドが同時に捨てた
+        return hit[1]
+
+    ref = f"{category}_ref"
+    period = Trunc("created_at", bucket, output_field=DateField(), tzinfo=timezone.get_current_timezone())
+    counts: dict[tuple[date, str], int] = {}
+    with timer("summary.timeseries") as t:
+        qs = confirmed_orders(loc.code, start=start, end=end).filter(**{f"{ref}__isnull": False})
+        rows = list(qs.annotate(period=period).values_list("period", ref).annotate(cnt=Count("id")))
+        names = catalog.names_for(r[1] for r in rows)
+        for p, item_id, cnt in rows:
+            k = (p, names.get(item_id, ""))
+            counts[k] = counts.get(k, 0) + cnt
+        if months:
+            col = 2 if category == Item.OKAZU else 4
+            d0 = _parse_day(start, "start")
+            d1 = _parse_day(end, "end")
+            for r in archive.confirmed_rows(loc, start=d0, end=d1):
+                if r[col]:
+                    k = (_bucket_start(timezone.localtime(r[6]).date(), bucket), r[col])
+                    counts[k] = counts.get(k, 0) + 1
+        t.rows = len(rows)
+
+    periods = sorted({p for p, _ in counts})
+    pos = {p: i for i, p in enumerate(periods)}
+    series: dict[str, list[int]] = {}
+    for (p, label), cnt in counts.items():
+        series.setdefault(label, [0] * len(periods))[pos[p]] += cnt
+    totals = [0] * len(periods)
+    for values in series.values():
+        for i, v in enumerate(values):
+            totals[i] += v
+    result = {
+        "bucket": bucket,
+        "category": category,
+        "periods": [p.isoformat() for p in periods],
+        "totals": totals,
+        "items": [
+            {"label": label, "counts": values}
+            for label, values in sorted(series.items(), key=lambda x: (-sum(x[1]), x[0]))
+        ],
+    }
+    cache.pop(key, None)
+    cache[key] = (version, result)
+    while len(cache) > _TIMESERIES_CACHE_SIZE:
+        try:
+            cache.popitem(last=False)
+        except KeyError:
+            break
+    return result
+
+
+def expiry_rows(mode: str = "near", days: int = 3, location: str = DEFAULT_LOCATION):
+    """mode=near: 残り0〜days日 / mode=expired: 期限切れ"""
+    items = []
+    for inv in query_lots(location):
+        exp = (inv.expiry or "").strip().replace("/", "-")
+        try:
+            d = datetime.fromisoformat(exp).date()
+        except Exception:
+            continue
+        diff = (d - date.today()).days
+        if mode == "expired":
+            if diff < 0:
+                items.append([inv.item, inv.expiry, str(inv.qty), str(diff)])
+        else:
+            if 0 <= diff <= days:
+                items.append([inv.item, inv.expiry, str(inv.qty), str(diff)])
+    return items
+
+
+def data_version(location: str = DEFAULT_LOCATION) -> str:
+    """注文と在庫CSVの状態を表す文字列（変われば出力結果も変わりうる）
+
+    DB側は変更履歴の版（changes.current_version）、CSV側はまだ取り込んでいない変更も拾えるよう size/mtime。
+    """
+    sig = csv_cache.signature(get_location(location).zaiko_csv) or (0, 0)
+    return f"v{changes.current_version(location)}|z{sig[0]}.{sig[1]}"
@@ -0,0 +1,179 @@
+"""在庫ロットと名簿の共有スナップショット（data/.inventory.<拠点コード>.snapshot）
+
+取込/確定がコミットされたら、そのワーカーが拠点の全ロットと名簿を1つのバイナリファイルに書き出す
+（一時ファイル → os.replace なので、読む側には古いか新しいかのどちらかが丸ごと見える）。
+各ワーカーはファイルを読み取り専用で mmap し、中身はアクセスしたときにだけデコードする。
+ページキャッシュは全ワーカーで共有されるので、ワーカー数が増えてもメモリはほぼ増えない。
+
+ヘッダには
+- location: 拠点コード（複数の拠点が同じ data_dir を使っても他拠点のファイルを読まない）
+- version: スナップショット作成時の ChangeLog のロットの版（DB の版と違えば古いので使わない）
+- zaiko / meibo の size, mtime_ns: 取り込んだCSVの状態（他ワーカーが取込済みかの判定に使う）
+を持つ。
+
+レイアウト（リトルエンディアン）:
+    header  _HEADER（location は strings の番号）
+    strings n_strings × (offset u32, length u32)   blob 内の UTF-8
+    lots    n_lots × (item u32, expiry u32, alert u32, qty i32, refill_line i32)   文字列は strings の番号
+    names   n_names × u32
+    blob
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+MAGIC = b"ZSNP"
+FORMAT = 2
+
+_HEADER = struct.Struct("<4sHHqqqqqIIII")
+_STR = struct.Struct("<II")
+_LOT = struct.Struct("<IIIii")
+_NAME = struct.Struct("<I")
+
+_lock = threading.Lock()
+_open: dict[str, tuple[tuple[int, int, int], "Snapshot"]] = {}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "ORDERS_SHARED_SNAPSHOT", True))
+
+
+class Snapshot:
+    __slots__ = (
+        "_buf", "location", "version", "zaiko_sig", "meibo_sig", "n_lots", "n_names",
+        "_strings_off", "_lots_off", "_names_off", "_blob_off", "_strs",
+    )
+
+    def __init__(self, buf):
+        (magic, fmt, _, version, zsize, zmtime, msize, mmtime,
+         n_strings, n_lots, n_names, location) = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError("not an inventory snapshot")
+        self._buf = buf
+        self.version = version
+        self.zaiko_sig = (zsize, zmtime) if zsize >= 0 else None
+        self.meibo_sig = (msize, mmtime) if msize >= 0 else None
+        self.n_lots = n_lots
+        self.n_names = n_names
+        self._strings_off = _HEADER.size
+        self._lots_off = self._strings_off + n_strings * _STR.size
+        self._names_off = self._lots_off + n_lots * _LOT.size
+        self._blob_off = self._names_off + n_names * _NAME.size
+        self._strs: list[str | None] = [None] * n_strings
+        self.location = self._str(location)
+
+    def _str(self, i: int) -> str:
+        s = self._strs[i]
+        if s is None:
+            off, n = _STR.unpack_from(self._buf, self._strings_off + i * _STR.size)
+            start = self._blob_off + off
+            s = self._strs[i] = bytes(self._buf[start:start + n]).decode("utf-8")
+        return s
+
+    def lot(self, i: int) -> tuple[str, str, int, int, str]:
+        """(item, expiry, qty, refill_line, alert)"""
+        item, expiry, alert, qty, refill = _LOT.unpack_from(self._buf, self._lots_off + i * _LOT.size)
+        return self._str(item), self._str(expiry), qty, refill, self._str(alert)
+
+    def lots(self):
+        for i in range(self.n_lots):
+            yield self.lot(i)
+
+    def names(self) -> list[str]:
+        return [self._str(_NAME.unpack_from(self._buf, self._names_off + i * _NAME.size)[0]) for i in range(self.n_names)]
+
+
+def path_for(data_dir: Path, location: str) -> Path:
+    return Path(data_dir) / f".inventory.{location}.snapshot"
+
+
+def load(data_dir: Path, location: str) -> Snapshot | None:
+    """location の最新のスナップショット（ファイルが置き換わっていたら mmap し直す）。無い/壊れている/他拠点のものなら None"""
+    if not enabled():
+        return None
+    path = path_for(data_dir, location)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+    key = str(path)
+    hit = _open.get(key)
+    if hit and hit[0] == ident:
+        return hit[1]
+    with _lock:
+        hit = _open.get(key)
+        if hit and hit[0] == ident:
+            return hit[1]
+        try:
+            with open(path, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            snap = Snapshot(buf)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+        if snap.location != location:
+            return None
+        # 古い mmap は参照が無くなった時点で閉じられる
+        _open[key] = (ident, snap)
+        return snap
+
+
+def publish(
+    data_dir: Path,
+    location: str,
+    version: int,
+    zaiko_sig: tuple[int, int] | None,
+    meibo_sig: tuple[int, int] | None,
+    lots,
+    names: list[str],
+) -> Path:
+    """lots: (item, expiry, qty, refill_line, alert) のイテラブル"""
+    index: dict[str, int] = {}
+    blob = bytearray()
+    strings = bytearray()
+
+    def sid(s) -> int:
+        s = s or ""
+        i = index.get(s)
+        if i is None:
+            data = s.encode("utf-8")
+            i = index[s] = len(index)
+            strings.extend(_STR.pack(len(blob), len(data)))
+            blob.extend(data)
+        return i
+
+    loc_id = sid(location)
+    lot_buf = bytearray()
+    n_lots = 0
+    for item, expiry, qty, refill, alert in lots:
+        lot_buf.extend(_LOT.pack(sid(item), sid(expiry), sid(alert), int(qty or 0), int(refill or 0)))
+        n_lots += 1
+    name_buf = b"".join(_NAME.pack(sid(n)) for n in names)
+
+    zsize, zmtime = zaiko_sig or (-1, -1)
+    msize, mmtime = meibo_sig or (-1, -1)
+    header = _HEADER.pack(
+        MAGIC, FORMAT, 0, version, zsize, zmtime, msize, mmtime, len(index), n_lots, len(names), loc_id
+    )
+
+    path = path_for(data_dir, location)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(strings)
+            f.write(lot_buf)
+            f.write(name_buf)
+            f.write(blob)
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path
@@ -0,0 +1,1180 @@
+"""orders のテスト（python manage.py test orders）"""
+from __future__ import annotations
+
+import csv
+import gzip
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import allocation, archive, catalog, changes, csv_cache, csv_engine, csv_tail, exports, jobs, locations, locks, metrics, search, services, snapshot
+from .csv_engine import PandasEngine, StdlibEngine, has_pandas
+from .singleflight import SingleFlight
+from .models import CarryoverSnapshot, ConfirmRun, CsvIngestState, ExportJob, Inventory, Item, LotAllocation, Member, Order, ResourceLock
+
+ZAIKO_CSV = "番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n1,唐揚げ,10,2099/12/1,5,\n2,ご飯150g,3,2099/12/31,5,\n"
+MEIBO_CSV = "番号,名前,,\n1,中村,,\n2,香月,,\n3,山田,,\n"
+
+
+class DataDirMixin:
+    """一時ディレクトリを default 拠点のデータディレクトリにし、プロセス内の拠点キャッシュを空にする"""
+
+    def setUp(self):
+        super().setUp()
+        self.data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        (self.data_dir / "zaikokanri.csv").write_text(ZAIKO_CSV, encoding="utf-8-sig")
+        (self.data_dir / "meibo.csv").write_text(MEIBO_CSV, encoding="utf-8-sig")
+        conf = override_settings(
+            ORDERS_LOCATIONS={"default": {"name": "本店", "data_dir": self.data_dir}},
+            ORDERS_EXPORT_WORKERS=0,
+        )
+        conf.enable()
+        self.addCleanup(conf.disable)
+        locations._states.clear()
+        catalog._known.clear()
+        search._available.clear()
+
+
+class ApiQueryCountTests(DataDirMixin, TestCase):
+    """/api/ の各エンドポイントのクエリ数（注文が増えてもクエリ数が増えないこと＝N+1 が無いこと）
+
+    CSV取込・名簿同期が済んだ後（2回目以降のリクエスト）の数を固定する。
+    on_commit の処理（取込済みの記録など）も本番と同じく実行して数える。
+    """
+
+    def setUp(self):
+        super().setUp()
+        for name in ("中村", "香月", "山田"):
+            self.post("/api/order/", {
+                "name": name, "okazu": "唐揚げ", "okazu_expiry": "2099-12-01",
+                "gohan": "ご飯150g", "gohan_expiry": "2099-12-31",
+            })
+
+    def request(self, method: str, url: str, payload=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            if method == "post":
+                return self.client.post(url, json.dumps(payload or {}), content_type="application/json")
+            return self.client.get(url)
+
+    def post(self, url: str, payload=None):
+        resp = self.request("post", url, payload)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp
+
+    def assertQueries(self, n: int, url: str, method: str = "get", payload=None, warm: bool = True):
+        if warm:
+            self.request(method, url, payload)
+        with self.assertNumQueries(n):
+            resp = self.request(method, url, payload)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+    def test_reads(self):
+        for n, url in (
+            (0, "/api/csrf/"),
+            (1, "/api/options/"),
+            (1, "/api/members/?q=な"),
+            (1, "/api/pending/"),
+            (2, "/api/bootstrap/"),
+            (1, "/api/history/"),
+            (2, "/api/summary/"),
+            (1, "/api/summary/timeseries/"),
+            (1, "/api/inventory/"),
+            (2, "/api/inventory_csv/dashboard/"),
+            (1, "/api/inventory_csv/lots/"),
+            (1, "/api/inventory_csv/summary/"),
+            (2, "/api/inventory_csv/alerts/"),
+            (0, "/api/inventory_csv/export/latest.csv"),
+            (2, "/api/carryover/report/"),
+            (1, "/api/sync/status/"),
+            (6, "/api/changes/?since=0"),
+            (0, "/api/locations/"),
+            (0, "/api/metrics/"),
+            (1, "/api/confirm/runs/"),
+            (1, "/api/exports/"),
+            (1, "/api/export/history.csv"),
+            (2, "/api/export/ranking.csv"),
+            (1, "/api/export/expiry.csv"),
+        ):
+            with self.subTest(url=url):
+                self.assertQueries(n, url)
+
+    def test_create_order(self):
+        self.assertQueries(5, "/api/order/", "post", {"name": "中村", "okazu": "唐揚げ", "okazu_expiry": "2099-12-01"})
+
+    def test_cancel(self):
+        ids = list(Order.objects.values_list("id", flat=True))
+        self.assertQueries(5, "/api/cancel/", "post", {"id": ids[0]}, warm=False)
+        self.assertQueries(5, "/api/cancel/bulk/", "post", {"ids": ids[1:]}, warm=False)
+
+    def test_confirm(self):
+        self.request("get", "/api/options/")
+        resp = self.assertQueries(27, "/api/confirm/", "post", {}, warm=False)
+        self.assertEqual(resp.json()["confirmed"], 3)
+        # 対象が無いとき
+        self.assertQueries(9, "/api/confirm/", "post", {}, warm=False)
+
+    def test_confirm_run(self):
+        run = ConfirmRun.objects.create(location="default", total=3)
+        self.assertQueries(1, f"/api/confirm/runs/{run.id}/")
+        kita = ConfirmRun.objects.create(location="kita", total=3)
+        self.assertEqual(self.request("get", f"/api/confirm/runs/{kita.id}/").status_code, 400)
+
+    def test_carryover_snapshot(self):
+        self.request("get", "/api/options/")
+        self.assertQueries(9, "/api/carryover/snapshot/", "post", {"month": "2026-09"}, warm=False)
+
+    def test_exports(self):
+        resp = self.assertQueries(3, "/api/exports/", "post", {"kind": "ranking"}, warm=False)
+        job_id = resp.json()["job"]["id"]
+        jobs.run_job(job_id)
+        self.assertQueries(1, f"/api/exports/{job_id}/")
+        self.assertQueries(1, f"/api/exports/{job_id}/download").close()
+
+
+class ImportTimeTests(SimpleTestCase):
+    """orders.views の import で pandas を読み込まない（ワーカー起動・管理コマンドを速くする）"""
+
+    def test_views_import_without_pandas(self):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "appsite.settings")}
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import django; django.setup(); import orders.views"],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        # "import time: self [us] | cumulative | imported package" の行
+        modules = [line.rsplit("|", 1)[-1].strip() for line in proc.stderr.splitlines() if line.startswith("import time:")]
+        self.assertIn("orders.views", modules)
+        self.assertEqual([m for m in modules if m.split(".")[0] == "pandas"], [])
+
+
+# エンジン比較用のCSV（ファイル名 → 内容）。.gz は gzip で書く
+ENGINE_FIXTURES = {
+    "quoted.csv": '番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n'
+                  '1,"唐揚げ,大盛",10,2025/12/31,5,"在庫""少"""\n'
+                  '2,"のり弁\n（二段）",3,2026/1/5,5,\n'.encode("utf-8-sig"),
+    "empty.csv": '番号,お弁当,在庫数,賞味期限,,お弁当\n'
+                 '1,唐揚げ,,2025/12/31,,\n'
+                 '\n'
+                 ',,,,,\n'
+                 '3,ご飯150g,2\n'.encode("utf-8"),
+    "bom.csv": "\ufeff番号,名前,,\n1,中村,,\n2,香月,かつき,\n".encode("utf-8"),
+    "cp932.csv": "番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n1,ﾃﾘﾏﾖチキン,50,2025/12/31,65,要発注\n".encode("cp932"),
+    "zaikokanri.csv.gz": "番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n1,唐揚げ,50,2025/12/31,45,\n2,ご飯180g,7,2026/3/7,45,\n".encode("utf-8-sig"),
+    "header_only.csv": "番号,お弁当,在庫数\n".encode("utf-8-sig"),
+}
+
+
+class CsvEngineParityTests(SimpleTestCase):
+    """StdlibEngine と PandasEngine が同じ CsvTable を返し、同じバイト列を書くこと
+
+    速度・メモリの比較は `python manage.py compare_csv_engines`。
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dir = Path(tempfile.mkdtemp())
+        for name, data in ENGINE_FIXTURES.items():
+            if name.endswith(".gz"):
+                data = gzip.compress(data)
+            (cls.dir / name).write_bytes(data)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        if not has_pandas():
+            self.skipTest("pandas is not installed")
+
+    def test_read(self):
+        for name in ENGINE_FIXTURES:
+            with self.subTest(name):
+                path = self.dir / name
+                expected = StdlibEngine().read(path)
+                self.assertEqual(PandasEngine().read(path), expected)
+                self.assertFalse(expected.empty and name != "header_only.csv")
+
+    def test_iter_chunks(self):
+        for name in ENGINE_FIXTURES:
+            with self.subTest(name):
+                path = self.dir / name
+                stdlib = [(t.columns, t.rows) for t in StdlibEngine().iter_chunks(path, 1)]
+                pandas = [(t.columns, t.rows) for t in PandasEngine().iter_chunks(path, 1)]
+                self.assertEqual(pandas, stdlib)
+
+    def test_write(self):
+        for name in ENGINE_FIXTURES:
+            with self.subTest(name):
+                table = StdlibEngine().read(self.dir / name)
+                out = {}
+                for engine in (StdlibEngine(), PandasEngine()):
+                    path = self.dir / f"out_{engine.name}_{name}"
+                    engine.write(path, table)
+                    out[engine.name] = gzip.decompress(path.read_bytes()) if name.endswith(".gz") else path.read_bytes()
+                    self.assertEqual(engine.read(path), table)
+                self.assertEqual(out["pandas"], out["stdlib"])
+
+
+class LockHeartbeatTests(TestCase):
+    def test_heartbeat_keeps_lock_past_ttl(self):
+        with override_settings(ORDERS_LOCK_TTL=1):
+            with locks.resource_lock("test:hb"):
+                # TTL を過ぎた（前回の延長から時間が経った）ことにする
+                ResourceLock.objects.filter(name="test:hb").update(expires_at=timezone.now())
+                locks._held.names["test:hb"][1] -= 1
+                locks.heartbeat()
+                self.assertGreater(ResourceLock.objects.get(name="test:hb").expires_at, timezone.now())
+                # 期限内なので他のワーカーは奪えない
+                self.assertFalse(locks._try_db_lock("test:hb", "other", 1))
+                self.assertTrue(ResourceLock.objects.filter(name="test:hb").exclude(owner="other").exists())
+
+    def test_heartbeat_raises_when_taken_over(self):
+        with self.assertRaises(locks.LockLost):
+            with locks.resource_lock("test:hb"):
+                ResourceLock.objects.filter(name="test:hb").update(owner="other")
+                locks._held.names["test:hb"][1] -= 1000
+                locks.heartbeat()
+        self.assertEqual(ResourceLock.objects.get(name="test:hb").owner, "other")
+
+
+class ExportSweepTests(DataDirMixin, TestCase):
+    @override_settings(ORDERS_EXPORT_KEEP=1)
+    def test_keeps_files_of_done_jobs(self):
+        exports_dir = self.data_dir / "exports"
+        first = exports.write_export(exports_dir, "ranking", b"a")
+        ExportJob.objects.create(kind="ranking", params_key="k", status=ExportJob.DONE, file=first.name, finished_at=timezone.now())
+        second = exports.write_export(exports_dir, "ranking", b"b")
+        third = exports.write_export(exports_dir, "ranking", b"c")
+        self.assertTrue(first.exists())
+        self.assertFalse(second.exists())
+        self.assertTrue(third.exists())
+        self.assertEqual(exports.read_manifest(exports_dir)["ranking"]["file"], third.name)
+
+
+class ExportJobTests(DataDirMixin, TestCase):
+    def test_stale_job_is_replaced(self):
+        job = jobs.enqueue_export("ranking")
+        self.assertEqual(jobs.enqueue_export("ranking").id, job.id)
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.RUNNING, updated_at=timezone.now() - timedelta(seconds=601)
+        )
+        fresh = jobs.enqueue_export("ranking")
+        self.assertNotEqual(fresh.id, job.id)
+        self.assertEqual(ExportJob.objects.get(id=job.id).status, ExportJob.FAILED)
+        # 落ちたと思われたワーカーが後で終わっても failed のまま
+        jobs.run_job(job.id, claimed=True)
+        self.assertEqual(ExportJob.objects.get(id=job.id).status, ExportJob.FAILED)
+
+    def test_job_is_scoped_to_location(self):
+        job = jobs.enqueue_export("ranking")
+        jobs.run_job(job.id)
+        other = self.data_dir / "kita"
+        with self.settings(ORDERS_LOCATIONS={
+            "default": {"name": "本店", "data_dir": self.data_dir},
+            "kita": {"name": "北倉庫", "data_dir": other},
+        }):
+            self.assertEqual(self.client.get(f"/api/exports/{job.id}/").status_code, 200)
+            self.assertEqual(self.client.get(f"/api/exports/{job.id}/?location=kita").status_code, 400)
+            self.assertEqual(self.client.get(f"/api/exports/{job.id}/download?location=kita").status_code, 400)
+
+    def test_invalid_params(self):
+        for params in ({"days": "x"}, {"mode": "soon"}, {"start": "2024-02-30"}):
+            with self.subTest(params=params):
+                kind = "ranking" if "start" in params else "expiry"
+                resp = self.client.post("/api/exports/", json.dumps({"kind": kind, "params": params}), content_type="application/json")
+                self.assertEqual(resp.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+
+class ArchiveTests(DataDirMixin, TestCase):
+    def test_archived_orders_are_recorded_as_deleted(self):
+        old = Order.objects.create(name="中村", okazu="唐揚げ", okazu_expiry="2020-01-10", confirmed=True)
+        Order.objects.filter(id=old.id).update(created_at=timezone.make_aware(datetime(2020, 1, 5, 12)))
+        keep = Order.objects.create(name="香月", okazu="唐揚げ", okazu_expiry="2099-12-01", confirmed=True)
+        since = changes.current_version("default")
+
+        done = archive.archive_orders(locations.get_location("default"), date(2020, 2, 1))
+
+        self.assertEqual(done, {"2020-01": 1})
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), [keep.id])
+        data = changes.changes_since("default", since)
+        self.assertFalse(data["resync"])
+        self.assertEqual(data["deleted_orders"], [old.id])
+
+    def archived_history(self):
+        for month, day in (("2020-01", 5), ("2020-02", 6)):
+            o = Order.objects.create(name="中村", okazu="唐揚げ", okazu_expiry="2099-12-01", confirmed=True)
+            Order.objects.filter(id=o.id).update(created_at=timezone.make_aware(datetime(int(month[:4]), int(month[5:]), day, 12)))
+        Order.objects.create(name="香月", okazu="唐揚げ", okazu_expiry="2099-12-01", confirmed=True)
+        Order.objects.update(okazu_ref=catalog.ids_for({"唐揚げ"})["唐揚げ"])
+        archive.archive_orders(locations.get_location("default"), date(2020, 3, 1))
+
+    def test_unbounded_queries_skip_archive_unless_asked(self):
+        self.archived_history()
+        def names(url):
+            return [r["name"] for r in self.client.get(url).json()["orders"]]
+
+        def count(url):
+            return self.client.get(url).json()["okazu"][0]["count"]
+
+        self.assertEqual(names("/api/history/"), ["香月"])
+        self.assertEqual(names("/api/history/?archive=1"), ["香月", "中村", "中村"])
+        self.assertEqual(names("/api/history/?start=2020-02-01"), ["香月", "中村"])
+        self.assertEqual((count("/api/summary/"), count("/api/summary/?archive=1")), (1, 3))
+
+    @override_settings(ORDERS_ARCHIVE_CACHE_ROWS=1)
+    def test_month_cache_is_bounded(self):
+        self.archived_history()
+        archive._months.clear()
+        self.addCleanup(archive._months.clear)
+        loc = locations.get_location("default")
+        self.assertEqual(len(archive.read_month(loc, "2020-01")), 1)
+        self.assertEqual(len(archive.read_month(loc, "2020-02")), 1)
+        self.assertEqual(archive._months.rows, 1)
+        first = archive._month_path(loc, "2020-01")
+        self.assertIsNone(archive._months.get(str(first), archive._mtime_ns(first)))
+
+
+class SnapshotTests(SimpleTestCase):
+    def test_location_is_checked_on_load(self):
+        data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        snapshot.publish(data_dir, "default", 3, (10, 1), None, [("唐揚げ", "2099-12-01", 5, 2, "")], ["中村"])
+        snapshot.publish(data_dir, "kita", 7, None, None, [], [])
+
+        snap = snapshot.load(data_dir, "default")
+        self.assertEqual((snap.location, snap.version, snap.zaiko_sig), ("default", 3, (10, 1)))
+        self.assertEqual(list(snap.lots()), [("唐揚げ", "2099-12-01", 5, 2, "")])
+        self.assertEqual(snap.names(), ["中村"])
+        self.assertEqual(snapshot.load(data_dir, "kita").version, 7)
+        # 他拠点のファイルが置かれていても使わない
+        shutil.copy(snapshot.path_for(data_dir, "kita"), snapshot.path_for(data_dir, "minami"))
+        self.assertIsNone(snapshot.load(data_dir, "minami"))
+
+
+class CsvTailTests(SimpleTestCase):
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / "zaikokanri.csv"
+        self.addCleanup(shutil.rmtree, self.path.parent, ignore_errors=True)
+        self.path.write_bytes(ZAIKO_CSV.encode("utf-8"))
+        self.base = csv_tail.snapshot(self.path)
+
+    def append(self, text: str) -> None:
+        with self.path.open("ab") as f:
+            f.write(text.encode("utf-8"))
+
+    def test_appended_rows(self):
+        self.append('3,"のり弁\n（二段）",4,2099/12/2,5,\n4,鮭,1,2099/12/3,5,')
+        tail, snap = csv_tail.appended(self.path, self.base.offset, self.base.prefix_hash)
+        # 書きかけの最終行は含めない
+        self.assertEqual(tail.decode("utf-8"), '3,"のり弁\n（二段）",4,2099/12/2,5,\n')
+        self.assertEqual(snap.offset, self.base.offset + len(tail))
+
+    def test_unbalanced_quotes_fall_back(self):
+        # 最後の改行がクォート付きの値の途中
+        self.append('3,"のり弁\n（二段')
+        self.assertIsNone(csv_tail.appended(self.path, self.base.offset, self.base.prefix_hash))
+        self.assertIsNone(csv_tail.snapshot(self.path))
+
+
+class CancelConfirmTests(DataDirMixin, TestCase):
+    def order(self, name="中村", location="default", **kwargs):
+        return Order.objects.create(location=location, name=name, okazu="唐揚げ", okazu_expiry="2099-12-01", **kwargs)
+
+    def test_bulk_cancel_skips_confirmed_cancelled_and_foreign(self):
+        pending = [self.order(), self.order(name="香月")]
+        confirmed = self.order(confirmed=True)
+        cancelled = self.order(cancelled=True)
+        foreign = self.order(location="kita")
+        since = changes.current_version("default")
+
+        ids = [o.id for o in (*pending, confirmed, cancelled, foreign)] + [999999]
+        resp = self.client.post("/api/cancel/bulk/", json.dumps({"ids": ids}), content_type="application/json")
+
+        self.assertEqual(resp.json(), {"cancelled": 2, "requested": 6})
+        self.assertEqual(
+            set(Order.objects.filter(cancelled=True).values_list("id", flat=True)), {pending[0].id, pending[1].id, cancelled.id}
+        )
+        self.assertFalse(Order.objects.get(id=confirmed.id).cancelled)
+        self.assertFalse(Order.objects.get(id=foreign.id).cancelled)
+        self.assertEqual(changes.changes_since("default", since)["orders"], [
+            tuple(Order.objects.filter(id=o.id).values_list(*changes.ORDER_COLUMNS)[0]) for o in pending
+        ])
+        self.assertEqual(services.cancel_orders("default", [pending[0].id]), 0)
+
+    def test_filtered_confirm(self):
+        a = self.order()
+        b = self.order(name="香月")
+        c = self.order(name="山田")
+        d = self.order(name="中村")
+        Order.objects.filter(id=c.id).update(created_at=timezone.make_aware(datetime(2024, 5, 1, 23, 30)))
+        Order.objects.filter(id=d.id).update(created_at=timezone.make_aware(datetime(2024, 5, 3, 0, 30)))
+
+        def confirm(payload):
+            resp = self.client.post("/api/confirm/", json.dumps(payload), content_type="application/json")
+            self.assertEqual(resp.status_code, 200)
+            return resp.json()["confirmed"]
+
+        self.assertEqual(confirm({"ids": [b.id, 999999]}), 1)
+        self.assertEqual(confirm({"start": "2024-05-01", "end": "2024-05-02"}), 1)
+        self.assertEqual(set(Order.objects.filter(confirmed=True).values_list("id", flat=True)), {b.id, c.id})
+        self.assertEqual(confirm({"name": "中村", "end": "2024-05-31"}), 1)
+        self.assertTrue(Order.objects.get(id=d.id).confirmed)
+        self.assertFalse(Order.objects.get(id=a.id).confirmed)
+        self.assertEqual(confirm({"name": "中村"}), 1)
+        self.assertFalse(Order.objects.filter(confirmed=False).exists())
+
+
+@override_settings(ORDERS_CONFIRM_CHUNK_ORDERS=2)
+class ConfirmResumeTests(DataDirMixin, TestCase):
+    """チャンク確定が途中で失敗したときの再開/中止と、その間の CSV 取込の保留"""
+
+    def setUp(self):
+        super().setUp()
+        for name in ("中村", "香月", "山田", "中村", "香月"):
+            Order.objects.create(name=name, okazu="唐揚げ", okazu_expiry="2099-12-01")
+
+    def fail_after(self, n):
+        # n チャンク目までは確定し、それ以降のチャンクで失敗させる
+        real = services._confirm_orders
+        calls = []
+
+        def confirm_orders(*args):
+            calls.append(1)
+            if len(calls) > n:
+                raise RuntimeError("boom")
+            return real(*args)
+
+        return mock.patch.object(services, "_confirm_orders", confirm_orders)
+
+    def stock(self):
+        return Inventory.objects.get(location="default", item="唐揚げ").qty
+
+    def csv_stock(self):
+        with open(self.data_dir / "zaikokanri.csv", encoding="utf-8-sig", newline="") as f:
+            return next(int(r[2]) for r in csv.reader(f) if r[1] == "唐揚げ")
+
+    def blocked_by(self):
+        return self.client.get("/api/sync/status/").json()["import_blocked_by"]
+
+    def test_resume_after_failed_chunk(self):
+        with self.captureOnCommitCallbacks(execute=True), self.fail_after(1), self.assertRaises(RuntimeError):
+            services.confirm_all()
+        run = ConfirmRun.objects.get()
+        self.assertEqual((run.status, run.processed, run.total), (ConfirmRun.FAILED, 2, 5))
+        self.assertEqual((self.stock(), self.csv_stock()), (8, 10))
+        self.assertEqual(self.blocked_by(), run.id)
+        self.assertEqual(services.reload_from_csv(force=True), run.id)
+        self.assertEqual(self.stock(), 8)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = services.confirm_all()
+        self.assertEqual(result["resumed"], run.id)
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.processed, run.attempts), (ConfirmRun.DONE, 5, 1))
+        self.assertEqual((self.stock(), self.csv_stock()), (5, 5))
+        self.assertEqual(LotAllocation.objects.count(), 5)
+        self.assertFalse(Order.objects.filter(confirmed=False).exists())
+        self.assertIsNone(self.blocked_by())
+
+    @override_settings(ORDERS_CONFIRM_MAX_RESUMES=2)
+    def test_abandoned_after_max_resumes(self):
+        with self.captureOnCommitCallbacks(execute=True), self.fail_after(1):
+            with self.assertRaises(RuntimeError):
+                services.confirm_all()
+            run = ConfirmRun.objects.get()
+            for _ in range(2):
+                resp = self.client.post("/api/confirm/", "{}", content_type="application/json")
+                self.assertEqual(resp.status_code, 409)
+                self.assertEqual(resp.json()["blocked_by"], run.id)
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.attempts), (ConfirmRun.ABANDONED, 2))
+        # 中止時に確定済みチャンクの在庫を書き戻すので、取込を再開しても引いた分は消えない
+        self.assertEqual((self.stock(), self.csv_stock()), (8, 8))
+        self.assertIsNone(self.blocked_by())
+
+    def test_abandon_api(self):
+        with self.captureOnCommitCallbacks(execute=True), self.fail_after(1), self.assertRaises(RuntimeError):
+            services.confirm_all()
+        run = ConfirmRun.objects.get()
+        self.assertEqual(self.client.post(f"/api/confirm/runs/{run.id}/abandon/?location=kita").status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(f"/api/confirm/runs/{run.id}/abandon/")
+        self.assertEqual(resp.json()["run"]["status"], ConfirmRun.ABANDONED)
+        self.assertEqual(self.csv_stock(), 8)
+        self.assertEqual(self.client.post(f"/api/confirm/runs/{run.id}/abandon/").status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = services.confirm_all()
+        self.assertEqual(result["confirmed"], 3)
+        self.assertEqual((self.stock(), self.csv_stock()), (5, 5))
+
+
+class LotsResponseTests(DataDirMixin, TestCase):
+    def get(self, url, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.get(url, **extra)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+    def test_columns_format_round_trips(self):
+        rows = self.get("/api/inventory_csv/lots/").json()["lots"]
+        self.assertEqual([r["item"] for r in rows], ["ご飯150g", "唐揚げ"])
+        cols = self.get("/api/inventory_csv/lots/?format=columns").json()["lots"]
+        self.assertEqual(cols["columns"], list(changes.LOT_COLUMNS))
+        self.assertEqual([dict(zip(cols["columns"], r)) for r in cols["rows"]], rows)
+
+    @override_settings(ORDERS_JSON_GZIP_MIN_BYTES=0)
+    def test_gzip_body(self):
+        plain = self.get("/api/inventory_csv/lots/").json()
+        resp = self.get("/api/inventory_csv/lots/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(resp.content)), plain)
+
+
+class LocationIsolationTests(DataDirMixin, TestCase):
+    """default と kita で在庫・注文・ロック・options のキャッシュが混ざらない"""
+
+    def setUp(self):
+        super().setUp()
+        self.kita_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.kita_dir, ignore_errors=True)
+        (self.kita_dir / "zaikokanri.csv").write_text(
+            "番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n1,鮭弁当,4,2099/11/1,2,\n", encoding="utf-8-sig"
+        )
+        (self.kita_dir / "meibo.csv").write_text("番号,名前,,\n1,佐藤,,\n", encoding="utf-8-sig")
+        conf = override_settings(ORDERS_LOCATIONS={
+            "default": {"name": "本店", "data_dir": self.data_dir},
+            "kita": {"name": "北倉庫", "data_dir": self.kita_dir},
+        })
+        conf.enable()
+        self.addCleanup(conf.disable)
+
+    def get(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_locations_do_not_leak(self):
+        default = self.get("/api/options/")
+        kita = self.get("/api/options/?location=kita")
+        self.assertEqual((default["okazu_items"], default["names"]), (["唐揚げ"], ["中村", "香月", "山田"]))
+        self.assertEqual((kita["okazu_items"], kita["names"]), (["鮭弁当"], ["佐藤"]))
+        self.assertEqual(self.get("/api/options/")["qty_map"], default["qty_map"])
+        self.assertEqual(set(Inventory.objects.filter(location="kita").values_list("item", flat=True)), {"鮭弁当"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post("/api/order/", json.dumps({
+                "location": "kita", "name": "佐藤", "okazu": "鮭弁当", "okazu_expiry": "2099-11-01",
+            }), content_type="application/json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(self.get("/api/pending/")["orders"], [])
+        self.assertEqual([o["name"] for o in self.get("/api/pending/?location=kita")["orders"]], ["佐藤"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.confirm_all("default"), {"confirmed": 0})
+        self.assertFalse(Order.objects.get().confirmed)
+
+        loc_default, loc_kita = locations.get_location("default"), locations.get_location("kita")
+        self.assertIsNot(locations.state_for("default").lock, locations.state_for("kita").lock)
+        with services.csv_lock(loc_default):
+            # default を持っていても、別のワーカーは kita のロックを取れる
+            self.assertFalse(locks._try_db_lock(f"zaiko:{loc_default.code}", "other", 60))
+            self.assertTrue(locks._try_db_lock(f"zaiko:{loc_kita.code}", "other", 60))
+
+
+class LotAllocatorTests(SimpleTestCase):
+    today = date(2026, 3, 10)
+
+    def allocator(self, *lots):
+        self.lots = [Inventory(item=item, expiry=expiry, qty=qty) for item, expiry, qty in lots]
+        return allocation.LotAllocator(self.lots, self.today)
+
+    def taken(self, result):
+        taken, short = result
+        return [(lot.expiry, n) for lot, n in taken], short
+
+    def test_exact_lot_first(self):
+        alloc = self.allocator(("唐揚げ", "2026-03-11", 5), ("唐揚げ", "2026-03-20", 5))
+        self.assertEqual(self.taken(alloc.allocate("唐揚げ", "2026-03-20")), ([("2026-03-20", 1)], 0))
+        self.assertEqual([l.qty for l in self.lots], [5, 4])
+
+    def test_spills_over_to_earliest_lot(self):
+        alloc = self.allocator(("唐揚げ", "2026-03-20", 1), ("唐揚げ", "2026-03-15", 2), ("唐揚げ", "2026-03-12", 1))
+        self.assertEqual(
+            self.taken(alloc.allocate("唐揚げ", "2026-03-20", qty=3)), ([("2026-03-20", 1), ("2026-03-12", 1), ("2026-03-15", 1)], 0)
+        )
+        self.assertEqual(self.taken(alloc.allocate("唐揚げ", "2026-03-20")), ([("2026-03-15", 1)], 0))
+        self.assertEqual({l.expiry for l in alloc.changed()}, {"2026-03-20", "2026-03-15", "2026-03-12"})
+        self.assertEqual(alloc.changed(), [])
+
+    def test_skips_expired_lots(self):
+        alloc = self.allocator(("唐揚げ", "2026-03-09", 5), ("唐揚げ", "2026-03-10", 1))
+        self.assertEqual(self.taken(alloc.allocate("唐揚げ", "2026-04-01", qty=2)), ([("2026-03-10", 1)], 1))
+        self.assertEqual(self.lots[0].qty, 5)
+
+    def test_shortfall(self):
+        alloc = self.allocator(("唐揚げ", "2026-03-20", 1))
+        self.assertEqual(self.taken(alloc.allocate("唐揚げ", "2026-03-20", qty=3)), ([("2026-03-20", 1)], 2))
+        self.assertEqual(self.taken(alloc.allocate("唐揚げ", "2026-03-20")), ([], 1))
+        self.assertEqual(self.taken(alloc.allocate("ハンバーグ")), ([], 1))
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        catalog._known.clear()
+        self.addCleanup(catalog._known.clear)
+
+    def test_ids_for_registers_new_names_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = catalog.ids_for({"唐揚げ", "ご飯(大)", ""})
+        self.assertEqual(set(ids), {"唐揚げ", "ご飯(大)"})
+        self.assertEqual(dict(Item.objects.values_list("name", "category")), {"唐揚げ": Item.OKAZU, "ご飯(大)": Item.GOHAN})
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.ids_for({"唐揚げ", "ご飯(大)"}), ids)
+
+        # 他のワーカーが登録済み（このプロセスは未知）の名前は DB から引く。新しい名前だけ登録する
+        catalog._known.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            more = catalog.ids_for({"唐揚げ", "ハンバーグ"})
+        self.assertEqual(more["唐揚げ"], ids["唐揚げ"])
+        self.assertEqual(Item.objects.count(), 3)
+        self.assertEqual(catalog.names_for(more.values()), {v: k for k, v in more.items()})
+
+    def test_populate_items_migration(self):
+        Inventory.objects.create(item="唐揚げ", expiry="2099/12/1", qty=1)
+        CarryoverSnapshot.objects.create(month="2026-03", item="鮭弁当", expiry="2099/11/1", qty=2)
+        Order.objects.create(name="中村", okazu="唐揚げ", gohan="ご飯150g")
+        Order.objects.create(name="香月", okazu="ハンバーグ")
+        Inventory.objects.update(item_ref=None)
+        CarryoverSnapshot.objects.update(item_ref=None)
+        Order.objects.update(okazu_ref=None, gohan_ref=None)
+        Item.objects.all().delete()
+
+        migration = importlib.import_module("orders.migrations.0013_populate_items")
+        migration.forwards(apps, None)
+        migration.forwards(apps, None)
+
+        items = dict(Item.objects.values_list("name", "id"))
+        self.assertEqual(set(items), {"唐揚げ", "鮭弁当", "ご飯150g", "ハンバーグ"})
+        self.assertEqual(Item.objects.get(name="ご飯150g").category, Item.GOHAN)
+        self.assertEqual(Inventory.objects.get().item_ref_id, items["唐揚げ"])
+        self.assertEqual(CarryoverSnapshot.objects.get().item_ref_id, items["鮭弁当"])
+        self.assertEqual(
+            set(Order.objects.values_list("okazu_ref_id", "gohan_ref_id")),
+            {(items["唐揚げ"], items["ご飯150g"]), (items["ハンバーグ"], None)},
+        )
+
+
+class CsvSidecarCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = self.dir / "zaikokanri.csv"
+
+    def write(self, text, mtime_ns):
+        self.path.write_text(text, encoding="utf-8-sig")
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def check_invalidation(self):
+        self.write(ZAIKO_CSV, 1_000_000_000_000)
+        parsed = StdlibEngine().read(self.path)
+        csv_cache.store(self.path, parsed, csv_cache.signature(self.path))
+        cached = csv_cache.load(self.path)
+        self.assertEqual((cached.columns, cached.rows), (parsed.columns, parsed.rows))
+
+        # 同じ内容の上書き保存（mtime だけ違う）は有効のまま
+        self.write(ZAIKO_CSV, 2_000_000_000_000)
+        self.assertEqual(csv_cache.load(self.path).rows, parsed.rows)
+        # 同じサイズで内容が違う / サイズが違う → 無効
+        self.write(ZAIKO_CSV.replace("10", "11"), 3_000_000_000_000)
+        self.assertIsNone(csv_cache.load(self.path))
+        self.write(ZAIKO_CSV + "3,鮭弁当,1,2099/1/1,0,\n", 3_000_000_000_000)
+        self.assertIsNone(csv_cache.load(self.path))
+
+    def test_json_sidecar(self):
+        with mock.patch.object(csv_cache, "_has_pyarrow", return_value=False):
+            self.check_invalidation()
+        self.assertTrue((self.dir / ".zaikokanri.csv.cache.rows.json").exists())
+        self.assertFalse(list(self.dir.glob("*.pkl")))
+
+    def test_parquet_sidecar(self):
+        if not csv_cache._has_pyarrow():
+            self.skipTest("pyarrow is not installed")
+        self.check_invalidation()
+        self.assertTrue((self.dir / ".zaikokanri.csv.cache.parquet").exists())
+
+
+@override_settings(ORDERS_METRICS_ENABLED=True)
+class SingleFlightTests(SimpleTestCase):
+    waiters = 8
+
+    def run_concurrently(self, name, fn):
+        """waiters 個のスレッドが同じキーで do() する。先行の loader は残り全員が待ちに入ってから fn() を返す"""
+        flight = SingleFlight(name)
+        calls = []
+        release = threading.Event()
+        results = [None] * self.waiters
+
+        def loader():
+            calls.append(1)
+            release.wait(timeout=5)
+            return fn()
+
+        def worker(i):
+            try:
+                results[i] = ("ok", flight.do("key", loader))
+            except Exception as e:
+                results[i] = ("error", e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.waiters)]
+        for t in threads:
+            t.start()
+        for _ in range(500):
+            # 先行以外の全員が待ちに入った（coalesced を数えた）
+            if metrics.counters().get(f"{name}.coalesced", 0) >= self.waiters - 1:
+                break
+            release.wait(0.01)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+        return calls, results
+
+    def test_loader_runs_once(self):
+        calls, results = self.run_concurrently("test_sf_ok", lambda: {"rows": 3})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("ok", {"rows": 3})] * self.waiters)
+
+    def test_error_reaches_every_waiter(self):
+        error = RuntimeError("boom")
+
+        def fail():
+            raise error
+
+        calls, results = self.run_concurrently("test_sf_error", fail)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("error", error)] * self.waiters)
+
+
+ZAIKO_ROWS = [("ご飯150g", "2099-12-31", 3), ("唐揚げ", "2099-12-01", 10), ("鮭弁当", "2099-11-01", 4)]
+
+
+@override_settings(ORDERS_CSV_STREAM_THRESHOLD=0, ORDERS_CSV_CHUNK_ROWS=1)
+class ChunkedReloadTests(DataDirMixin, TestCase):
+    """チャンク読み（しきい値以上 / .gz）の取込と書き戻し。ファイルは cp932"""
+
+    def setUp(self):
+        super().setUp()
+        self.text = ZAIKO_CSV + "3,鮭弁当,4,2099/11/1,2,\n"
+
+    def engines(self):
+        return ["stdlib", "pandas"] if has_pandas() else ["stdlib"]
+
+    def lots(self):
+        return list(Inventory.objects.order_by("item").values_list("item", "expiry", "qty"))
+
+    def confirm_one(self):
+        Order.objects.create(name="中村", okazu="唐揚げ", okazu_expiry="2099-12-01")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.confirm_all()["confirmed"], 1)
+
+    def check(self, path, opener):
+        for engine in self.engines():
+            with self.subTest(engine=engine), override_settings(ORDERS_CSV_ENGINE=engine):
+                Order.objects.all().delete()
+                with opener(path, "wb") as f:
+                    f.write(self.text.encode("cp932"))
+                with mock.patch.object(csv_engine, "_open_binary", wraps=csv_engine._open_binary) as opened:
+                    services.reload_from_csv(force=True)
+                # 文字コードの判定のために別に開き直さない（.gz を2回展開しない）
+                self.assertEqual(opened.call_count, 1)
+                self.assertEqual(self.lots(), ZAIKO_ROWS)
+
+                self.confirm_one()
+                with opener(path, "rb") as f:
+                    written = f.read().decode("utf-8-sig")
+                self.assertIn("唐揚げ,9,2099/12/1", written)
+                services.reload_from_csv(force=True)
+                self.assertEqual(self.lots()[1], ("唐揚げ", "2099-12-01", 9))
+
+    def test_chunked(self):
+        self.check(self.data_dir / "zaikokanri.csv", open)
+
+    def test_gzip(self):
+        (self.data_dir / "zaikokanri.csv").unlink()
+        self.check(self.data_dir / "zaikokanri.csv.gz", gzip.open)
+
+
+class TailEncodingTests(DataDirMixin, TestCase):
+    def reload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            services.reload_from_csv()
+
+    def test_tail_uses_encoding_of_full_import(self):
+        path = self.data_dir / "zaikokanri.csv"
+        path.write_bytes(ZAIKO_CSV.encode("cp932"))
+        self.reload()
+        self.assertEqual(CsvIngestState.objects.get().encoding, "cp932")
+
+        # cp932 の「繧ｫ繝ｬ繝ｼ」は UTF-8 としても読める（断片から推測すると「カレー」になる）
+        with path.open("ab") as f:
+            f.write("3,繧ｫ繝ｬ繝ｼ,2,2099/1/1,0,\n".encode("cp932"))
+        with mock.patch.object(services, "_reload_full", side_effect=AssertionError("full reload")):
+            self.reload()
+        self.assertTrue(Inventory.objects.filter(item="繧ｫ繝ｬ繝ｼ").exists())
+        self.assertFalse(Inventory.objects.filter(item="カレー").exists())
+
+        # 書き戻した後は書き出した文字コード
+        Order.objects.create(name="中村", okazu="唐揚げ", okazu_expiry="2099-12-01")
+        with self.captureOnCommitCallbacks(execute=True):
+            services.confirm_all()
+        self.assertEqual(CsvIngestState.objects.get().encoding, "utf-8-sig")
+        self.assertIn("繧ｫ繝ｬ繝ｼ", path.read_text(encoding="utf-8-sig"))
+
+
+class HistorySearchTests(DataDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = {}
+        for name, okazu, gohan in (
+            ("中村", "唐揚げ", "ご飯150g"), ("香月", "ハンバーグ", ""), ("山田", "唐揚げ弁当", ""), ("田中村子", "鮭", ""),
+        ):
+            self.ids[name] = Order.objects.create(name=name, okazu=okazu, gohan=gohan, confirmed=True).id
+
+    def names(self, q):
+        resp = self.client.get("/api/history/", {"q": q})
+        self.assertEqual(resp.status_code, 200)
+        return sorted(r["name"] for r in resp.json()["orders"])
+
+    def grams_hits(self, expr):
+        search.sync_grams()
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT rowid FROM {search.GRAMS} WHERE {search.GRAMS} MATCH %s", [expr])
+            return {r[0] for r in cur.fetchall()}
+
+    def test_fts_and_short_terms(self):
+        self.assertTrue(search.available() and search.available(table=search.GRAMS))
+        # (q, 結果, 絞り込みに使う索引)。3文字以上は trigram、記号を含まない2文字以下は2文字単位の索引
+        cases = [
+            ("唐揚げ", ["中村", "山田"], search.TABLE),
+            ("唐揚げ 中村", ["中村"], search.TABLE),
+            ("中村", ["中村", "田中村子"], search.GRAMS),
+            ("村", ["中村", "田中村子"], search.GRAMS),
+            ("揚", ["中村", "山田"], search.GRAMS),
+            ("0g", ["中村"], search.GRAMS),
+            ("中 鮭", ["田中村子"], search.GRAMS),
+            ("・", [], None),
+        ]
+        for q, expected, table in cases:
+            with self.subTest(q=q):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.names(q), expected)
+                sql = " ".join(x["sql"] for x in ctx.captured_queries)
+                if table:
+                    self.assertIn(f"{table} MATCH", sql)
+                else:
+                    self.assertNotIn("MATCH", sql)
+        # 索引を使わない（LIKE だけ）場合と同じ結果
+        with mock.patch.object(search, "available", return_value=False):
+            for q, expected, _ in cases:
+                self.assertEqual(self.names(q), expected)
+
+    def test_indexes_follow_update_and_delete(self):
+        Order.objects.filter(id=self.ids["香月"]).update(name="佐藤", okazu="エビフライ")
+        self.assertEqual(self.names("佐藤"), ["佐藤"])
+        self.assertEqual(self.names("香月"), [])
+        self.assertEqual(self.names("エビフライ"), ["佐藤"])
+        self.assertEqual(self.names("ハンバーグ"), [])
+        self.assertEqual(self.grams_hits('"香月"'), set())
+
+        Order.objects.filter(id=self.ids["中村"]).delete()
+        self.assertEqual(self.names("中村"), ["田中村子"])
+        self.assertEqual(self.names("ご飯150g"), [])
+        self.assertEqual(self.grams_hits('"中村"'), {self.ids["田中村子"]})
+
+
+class ChangesSinceTests(DataDirMixin, TestCase):
+    """/api/changes/ の元になる changes_since（在庫ロットの差分と resync）"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.data_dir / "zaikokanri.csv"
+        self.reload(force=True)
+        self.since = changes.current_version("default")
+
+    def reload(self, force=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            services.reload_from_csv(force=force)
+
+    def test_full_reload_records_changed_and_deleted_lots(self):
+        self.path.write_text("番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n1,唐揚げ,7,2099/12/1,5,\n", encoding="utf-8-sig")
+        self.reload(force=True)
+        data = changes.changes_since("default", self.since)
+        self.assertFalse(data["resync"])
+        self.assertEqual(data["lots"], [("唐揚げ", "2099-12-01", 7, 5, "")])
+        self.assertEqual(data["deleted_lots"], [["ご飯150g", "2099-12-31"]])
+
+    def test_tail_records_only_inserted_lots(self):
+        with self.path.open("a", encoding="utf-8") as f:
+            # 1行目は既にあるロットの重複なので入らない。3行目は2行目の重複
+            f.write("3,唐揚げ,99,2099/12/1,5,\n4,鮭弁当,4,2099/11/1,2,\n5,鮭弁当,8,2099/11/1,2,\n")
+        with mock.patch.object(services, "_reload_full", side_effect=AssertionError("full reload")):
+            self.reload()
+        data = changes.changes_since("default", self.since)
+        self.assertFalse(data["resync"])
+        self.assertEqual(data["lots"], [("鮭弁当", "2099-11-01", 4, 2, "")])
+        self.assertEqual(data["deleted_lots"], [])
+        self.assertEqual(Inventory.objects.get(item="唐揚げ").qty, 10)
+
+    def test_resync_after_chunked_reload(self):
+        with override_settings(ORDERS_CSV_STREAM_THRESHOLD=0):
+            self.reload(force=True)
+        self.assertTrue(changes.changes_since("default", self.since)["resync"])
+
+    def test_resync_when_over_limit(self):
+        self.path.write_text(ZAIKO_CSV.replace(",10,", ",7,").replace(",3,", ",2,"), encoding="utf-8-sig")
+        self.reload(force=True)
+        with override_settings(ORDERS_CHANGES_MAX=1):
+            self.assertTrue(changes.changes_since("default", self.since)["resync"])
+        with override_settings(ORDERS_CHANGES_MAX=2):
+            self.assertEqual(len(changes.changes_since("default", self.since)["lots"]), 2)
+
+    def test_resync_for_unknown_version(self):
+        self.assertTrue(changes.changes_since("default", self.since + 1)["resync"])
+        self.assertFalse(changes.changes_since("default", self.since)["resync"])
+
+
+class MemberTests(DataDirMixin, TestCase):
+    """名簿（Member）の差分同期・/api/members/ の前方一致・名簿外の注文"""
+
+    def setUp(self):
+        super().setUp()
+        self.writes = 0
+        self.write_roster("1,中村,なかむら\n2,中山,ナカヤマ\n3,香月,かつき\n")
+
+    def write_roster(self, rows):
+        path = self.data_dir / "meibo.csv"
+        path.write_text("番号,名前,ふりがな\n" + rows, encoding="utf-8-sig")
+        # 同じ秒に書いても同期し直すように mtime をずらす
+        self.writes += 1
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + self.writes * 10**9))
+
+    def members(self, q):
+        return self.client.get("/api/members/", {"q": q}).json()["members"]
+
+    def test_prefix_search_ignores_kana_width_and_case(self):
+        cases = {
+            "": ["中村", "中山", "香月"],
+            "中": ["中村", "中山"],
+            "ナカ": ["中村", "中山"],       # カタカナで引いてもひらがなの読みに当たる
+            "なかや": ["中山"],             # ひらがなで引いてもカタカナの読みに当たる
+            "ｶﾂ": ["香月"],                 # 半角カナ
+            "むら": [],                     # 前方一致だけ
+        }
+        for q, expected in cases.items():
+            with self.subTest(q=q):
+                self.assertEqual(self.members(q), expected)
+        self.assertEqual(self.client.get("/api/members/", {"limit": "x"}).status_code, 400)
+
+    def test_incremental_sync_deactivates_instead_of_deleting(self):
+        services.sync_members("default")
+        ids = dict(Member.objects.values_list("name", "id"))
+
+        self.write_roster("1,香月,かつき\n2,山田,やまだ\n3,中村,なかむら\n")
+        self.assertTrue(services.sync_members("default"))
+        # 変わっていなければ読まない
+        self.assertFalse(services.sync_members("default"))
+
+        rows = {m.name: m for m in Member.objects.all()}
+        self.assertEqual(set(rows), {"中村", "中山", "香月", "山田"})
+        self.assertFalse(rows["中山"].active)
+        self.assertEqual(rows["中村"].id, ids["中村"])
+        self.assertEqual(rows["香月"].position, 0)
+        self.assertEqual(self.members(""), ["香月", "山田", "中村"])
+
+        # 名簿に戻れば同じ行が有効に戻る
+        self.write_roster("1,中山,なかやま\n")
+        services.sync_members("default")
+        self.assertEqual(Member.objects.get(name="中山").id, ids["中山"])
+        self.assertEqual(self.members(""), ["中山"])
+
+    def test_order_requires_member(self):
+        def post(name):
+            return self.client.post("/api/order/", json.dumps({
+                "name": name, "okazu": "唐揚げ", "okazu_expiry": "2099-12-01",
+            }), content_type="application/json")
+
+        resp = post("佐藤")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.content.decode(), "unknown name")
+        self.assertEqual(post("中村").status_code, 200)
+        with override_settings(ORDERS_REQUIRE_MEMBER=False):
+            self.assertEqual(post("佐藤").status_code, 200)
+        self.assertEqual(sorted(Order.objects.values_list("name", flat=True)), ["中村", "佐藤"])
+
+
+class TimeseriesTests(DataDirMixin, TestCase):
+    """consumption_timeseries の期間の切り方（Asia/Tokyo）とアーカイブ済みの月"""
+
+    def setUp(self):
+        super().setUp()
+        # 00:30 JST は前日 15:30 UTC。UTC で切ると前の日/週/月に入ってしまう
+        for (y, m, d, hh, mm), okazu in (
+            ((2024, 3, 4, 23, 30), "唐揚げ"),   # 月曜
+            ((2024, 3, 5, 0, 30), "唐揚げ"),
+            ((2024, 3, 10, 23, 30), "鮭"),      # 日曜
+            ((2024, 3, 11, 0, 30), "唐揚げ"),   # 翌週の月曜
+            ((2024, 3, 31, 23, 30), "鮭"),
+            ((2024, 4, 1, 0, 30), "唐揚げ"),    # 翌月
+        ):
+            o = Order.objects.create(name="中村", okazu=okazu, okazu_expiry="2099-12-01", confirmed=True)
+            Order.objects.filter(id=o.id).update(created_at=timezone.make_aware(datetime(y, m, d, hh, mm)))
+        refs = catalog.ids_for({"唐揚げ", "鮭"})
+        for okazu, ref in refs.items():
+            Order.objects.filter(okazu=okazu).update(okazu_ref=ref)
+
+    def series(self, bucket, **kwargs):
+        data = services.consumption_timeseries("default", bucket, **kwargs)
+        return data["periods"], data["totals"], {i["label"]: i["counts"] for i in data["items"]}
+
+    def test_buckets_follow_local_dates(self):
+        cases = {
+            "day": (
+                ["2024-03-04", "2024-03-05", "2024-03-10", "2024-03-11", "2024-03-31", "2024-04-01"],
+                [1, 1, 1, 1, 1, 1],
+                {"唐揚げ": [1, 1, 0, 1, 0, 1], "鮭": [0, 0, 1, 0, 1, 0]},
+            ),
+            "week": (
+                ["2024-03-04", "2024-03-11", "2024-03-25", "2024-04-01"],
+                [3, 1, 1, 1],
+                {"唐揚げ": [2, 1, 0, 1], "鮭": [1, 0, 1, 0]},
+            ),
+            "month": (["2024-03-01", "2024-04-01"], [5, 1], {"唐揚げ": [3, 1], "鮭": [2, 0]}),
+        }
+        for bucket, expected in cases.items():
+            with self.subTest(bucket=bucket):
+                self.assertEqual(self.series(bucket), expected)
+        data = services.consumption_timeseries("default", "month")
+        self.assertEqual([i["label"] for i in data["items"]], ["唐揚げ", "鮭"])
+        with self.assertRaises(ValueError):
+            services.consumption_timeseries("default", "year")
+
+    def test_archived_months_are_merged(self):
+        before = {bucket: self.series(bucket) for bucket in services.TIMESERIES_BUCKETS}
+        archive.archive_orders(locations.get_location("default"), date(2024, 4, 1))
+        self.assertEqual(Order.objects.count(), 1)
+
+        # 期間を指定しなければアーカイブは読まない
+        self.assertEqual(self.series("month"), (["2024-04-01"], [1], {"唐揚げ": [1]}))
+        for bucket in services.TIMESERIES_BUCKETS:
+            with self.subTest(bucket=bucket):
+                self.assertEqual(self.series(bucket, with_archive=True), before[bucket])
+                self.assertEqual(self.series(bucket, start="2024-03-01", end="2024-04-30"), before[bucket])
+        self.assertEqual(self.series("day", start="2024-03-31", end="2024-04-01")[0], ["2024-03-31", "2024-04-01"])
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = locations.state_for("default").cache
+        with mock.patch.object(services, "_TIMESERIES_CACHE_SIZE", 2):
+            services.consumption_timeseries("default", "day")
+            services.consumption_timeseries("default", "week")
+            services.consumption_timeseries("default", "day")
+            services.consumption_timeseries("default", "month")
+            self.assertEqual([k[0] for k in cache["timeseries"]], ["day", "month"])
+            with CaptureQueriesContext(connection) as queries:
+                services.consumption_timeseries("default", "day")
+            # 版の確認だけ（集計し直さない）
+            self.assertEqual(len(queries), 1)
+
+
+@override_settings(ORDERS_METRICS_ENABLED=True)
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_prometheus_histogram_is_cumulative(self):
+        @metrics.timed("test.op")
+        def op():
+            return 42
+
+        with mock.patch.object(metrics.time, "perf_counter", side_effect=[10.0, 10.02]):
+            with self.assertLogs("orders.metrics", "DEBUG") as logs:
+                self.assertEqual(op(), 42)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {"op": "test.op", "ms": 20.0})
+        metrics.observe("test.op", 0.003, rows=5)
+        metrics.observe("test.op", 0.3, error=True)
+
+        text = self.client.get("/api/metrics/").content.decode()
+        lines = {}
+        for line in text.splitlines():
+            if 'op="test.op"' in line:
+                key, value = line.rsplit(" ", 1)
+                lines[key] = float(value)
+        buckets = [lines[f'orders_op_duration_seconds_bucket{{op="test.op",le="{b}"}}'] for b in metrics.BUCKETS]
+        self.assertEqual(buckets, [0, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 3])
+        self.assertEqual(lines['orders_op_duration_seconds_bucket{op="test.op",le="+Inf"}'], 3)
+        self.assertEqual(lines['orders_op_duration_seconds_count{op="test.op"}'], 3)
+        self.assertAlmostEqual(lines['orders_op_duration_seconds_sum{op="test.op"}'], 0.323)
+        self.assertEqual(lines['orders_op_rows_total{op="test.op"}'], 5)
+        self.assertEqual(lines['orders_op_errors_total{op="test.op"}'], 1)
+        self.assertIn("# TYPE orders_op_duration_seconds histogram", text)
+
+    def test_disabled_records_nothing(self):
+        with override_settings(ORDERS_METRICS_ENABLED=False):
+            with metrics.timer("test.op") as t:
+                t.rows = 1
+        self.assertEqual(metrics.snapshot(), {})
+
+
+class InventoryDashboardTests(DataDirMixin, TestCase):
+    """/api/inventory_csv/dashboard/ の各セクションが個別のエンドポイントと同じ中身であること"""
+
+    def setUp(self):
+        super().setUp()
+        (self.data_dir / "zaikokanri.csv").write_text(
+            "番号,お弁当,在庫数,賞味期限,補填ライン,アラート\n"
+            "1,唐揚げ,10,2099/12/1,15,\n2,唐揚げ,2,2020/1/1,15,\n3,ご飯150g,3,2099/12/31,5,要注意\n"
+            "4,鮭弁当,20,2099/11/1,2,\n",
+            encoding="utf-8-sig",
+        )
+        month = (date.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+        for item, expiry, qty in (("唐揚げ", "2099-12-01", 12), ("ハンバーグ", "2099-10-01", 4)):
+            CarryoverSnapshot.objects.create(month=month, item=item, expiry=expiry, qty=qty)
+
+    def test_sections_match_individual_endpoints(self):
+        dash = self.client.get("/api/inventory_csv/dashboard/").json()
+        alerts = self.client.get("/api/inventory_csv/alerts/").json()
+        self.assertEqual(set(dash), {"summary", "lots", "alerts", "exported", "carryover"})
+        self.assertEqual(dash["summary"], self.client.get("/api/inventory_csv/summary/").json()["summary"])
+        self.assertEqual(dash["lots"], self.client.get("/api/inventory_csv/lots/").json()["lots"])
+        self.assertEqual(dash["alerts"], alerts["alerts"])
+        self.assertEqual(dash["exported"], alerts["exported"])
+        self.assertEqual(dash["carryover"], self.client.get("/api/carryover/report/").json())
+        # 比べる中身が空でないこと
+        self.assertTrue(dash["alerts"])
+        self.assertTrue(dash["carryover"]["rows"])
+
+    def test_sections_filter(self):
+        dash = self.client.get("/api/inventory_csv/dashboard/", {"sections": "lots, summary,unknown"}).json()
+        self.assertEqual(set(dash), {"summary", "lots"})
@@ -10,14 +10,22 @@ urlpatterns = [
 
     path("api/csrf/", views.csrf, name="api_csrf"),
     path("api/options/", views.api_options, name="api_options"),
+    path("api/members/", views.api_members, name="api_members"),
     path("api/pending/", views.api_pending, name="api_pending"),
+    path("api/bootstrap/", views.api_bootstrap, name="api_bootstrap"),
     path("api/order/", views.api_create_order, name="api_create_order"),
     path("api/cancel/", views.api_cancel, name="api_cancel"),
+    path("api/cancel/bulk/", views.api_cancel_bulk, name="api_cancel_bulk"),
     path("api/confirm/", views.api_confirm_all, name="api_confirm_all"),
+    path("api/confirm/runs/", views.api_confirm_runs, name="api_confirm_runs"),
+    path("api/confirm/runs/<int:run_id>/", views.api_confirm_run, name="api_confirm_run"),
+    path("api/confirm/runs/<int:run_id>/abandon/", views.api_confirm_run_abandon, name="api_confirm_run_abandon"),
     path("api/history/", views.api_history, name="api_history"),
     path("api/summary/", views.api_summary, name="api_summary"),
+    path("api/summary/timeseries/", views.api_summary_timeseries, name="api_summary_timeseries"),
     path("api/inventory/", views.api_inventory, name="api_inventory"),
 
+    path("api/inventory_csv/dashboard/", views.api_inventory_csv_dashboard, name="api_inventory_csv_dashboard"),
     path("api/inventory_csv/lots/", views.api_inventory_csv_lots, name="api_inventory_csv_lots"),
     path("api/inventory_csv/summary/", views.api_inventory_csv_summary, name="api_inventory_csv_summary"),
     path("api/inventory_csv/alerts/", views.api_inventory_csv_alerts, name="api_inventory_csv_alerts"),
@@ -25,8 +33,15 @@ urlpatterns = [
     path("api/carryover/report/", views.api_carryover_report, name="api_carryover_report"),
     path("api/carryover/snapshot/", views.api_carryover_snapshot, name="api_carryover_snapshot"),
     path("api/sync/status/", views.api_sync_status, name="api_sync_status"),
+    path("api/changes/", views.api_changes, name="api_changes"),
+    path("api/locations/", views.api_locations, name="api_locations"),
+    path("api/metrics/", views.api_metrics, name="api_metrics"),
 
     path("api/export/history.csv", views.export_history_csv, name="export_history_csv"),
     path("api/export/ranking.csv", views.export_ranking_csv, name="export_ranking_csv"),
     path("api/export/expiry.csv", views.export_expiry_csv, name="export_expiry_csv"),
+
+    path("api/exports/", views.api_exports, name="api_exports"),
+    path("api/exports/<int:job_id>/", views.api_export_job, name="api_export_job"),
+    path("api/exports/<int:job_id>/download", views.api_export_job_download, name="api_export_job_download"),
 ]
@@ -2,18 +2,45 @@
 import json
 import csv
 import io
-from datetime import datetime, date
+from datetime import date
+from functools import wraps
 
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.utils.dateparse import parse_date
-from django.db.models import Count
-
-from .models import Order, Inventory
-from .services import (options, confirm_all, MEIBO_CSV, ZAIKO_CSV, inventory_csv_lots, inventory_csv_summary, generate_purchase_candidates, export_purchase_candidates_csv, get_latest_export, carryover_report, create_carryover_snapshot)
+from django.db import transaction
+
+from . import catalog, changes
+from .locations import DEFAULT_LOCATION, UnknownLocation, all_locations, get_location
+from .metrics import render_prometheus, timed, timer
+from .jobs import InvalidExportParams, UnknownExportKind, enqueue_export, job_dict
+from .models import ConfirmRun, ExportJob, Order, Inventory
+from .responses import json_response, table, table_response
+from .services import (HISTORY_COLUMNS, ConfirmBlocked, InvalidFilter, HISTORY_HEADER, RANKING_HEADER, EXPIRY_HEADER, history_rows, history_values, ranking_rows, expiry_rows, is_member, item_counts, options, reload_from_csv, search_members, cancel_orders, confirm_all, consumption_timeseries, confirm_run_dict, abandon_confirm_run, import_blocked_by, inventory_dashboard, LOT_COLUMNS, inventory_csv_lot_rows, inventory_csv_summary, generate_purchase_candidates, export_purchase_candidates_csv, get_latest_export, carryover_report, create_carryover_snapshot)
+
+
+def with_location(view):
+    """?location=（POSTはJSONの location も可）を解決して location 引数で渡す"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        code = request.GET.get("location") or ""
+        if not code and request.method == "POST":
+            try:
+                code = str(json.loads(request.body.decode("utf-8") or "{}").get("location") or "")
+            except Exception:
+                code = ""
+        try:
+            loc = get_location(code or DEFAULT_LOCATION)
+        except UnknownLocation:
+            return HttpResponseBadRequest("unknown location")
+        try:
+            return view(request, *args, location=loc.code, **kwargs)
+        except InvalidFilter as e:
+            # 絞り込みの日付などが読めない（services._parse_day）
+            return HttpResponseBadRequest(str(e))
+    return wrapper
 
 
 def react_page(request):
@@ -22,33 +49,60 @@ def react_page(request):
 
 @ensure_csrf_cookie
 def csrf(request):
-    return JsonResponse({"ok": True}, json_dumps_params={"ensure_ascii": False})
+    return json_response(request, {"ok": True})
 
 
-def api_options(request):
-    return JsonResponse(options(), json_dumps_params={"ensure_ascii": False})
+def _with_names(request) -> bool:
+    # ?names=0 なら名簿を返さない（名前は /api/members/?q= で検索する）
+    return request.GET.get("names") != "0"
 
 
-def api_pending(request):
-    qs = Order.objects.filter(confirmed=False, cancelled=False).order_by("-created_at")
-    data = [
-        {
-            "id": o.id,
-            "name": o.name,
-            "okazu": o.okazu,
-            "okazu_expiry": o.okazu_expiry,
-            "gohan": o.gohan,
-            "gohan_expiry": o.gohan_expiry,
-            "created_at": o.created_at.isoformat(),
-            "status": "未確定",
-        }
-        for o in qs
-    ]
-    return JsonResponse({"orders": data}, json_dumps_params={"ensure_ascii": False})
+def _with_archive(request) -> bool:
+    # 期間を指定しない履歴/集計は ?archive=1 のときだけアーカイブ済みの月も読む
+    return request.GET.get("archive") == "1"
+
+
+@with_location
+def api_options(request, location):
+    return json_response(request, options(location, names=_with_names(request)))
+
+
+@with_location
+def api_members(request, location):
+    """名前/読みの前方一致（かな・カナ・半角全角の違いは無視）"""
+    try:
+        limit = min(max(int(request.GET.get("limit") or 20), 1), 100)
+    except ValueError:
+        return HttpResponseBadRequest("invalid limit")
+    return json_response(request, {"members": search_members(location, request.GET.get("q") or "", limit)})
+
+
+@with_location
+def api_pending(request, location):
+    return json_response(request, {"orders": _pending_orders(request, location)})
+
+
+@with_location
+def api_bootstrap(request, location):
+    # 注文画面の初期表示（options + 未確定一覧）を1往復で
+    return json_response(
+        request,
+        {"options": options(location, names=_with_names(request)), "orders": _pending_orders(request, location)},
+    )
+
+
+ORDER_COLUMNS = ("id", "name", "okazu", "okazu_expiry", "gohan", "gohan_expiry", "created_at")
+
+
+def _pending_orders(request, location: str):
+    qs = Order.objects.filter(location=location, confirmed=False, cancelled=False).order_by("-created_at")
+    rows = [(*r, "未確定") for r in qs.values_list(*ORDER_COLUMNS)]
+    return table(request, ORDER_COLUMNS + ("status",), rows)
 
 
 @require_http_methods(["POST"])
-def api_create_order(request):
+@with_location
+def api_create_order(request, location):
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -62,6 +116,8 @@ def api_create_order(request):
 
     if not name:
         return HttpResponseBadRequest("name required")
+    if getattr(settings, "ORDERS_REQUIRE_MEMBER", True) and not is_member(location, name):
+        return HttpResponseBadRequest("unknown name")
     if okazu and not okazu_expiry:
         return HttpResponseBadRequest("okazu_expiry required")
     if gohan and not gohan_expiry:
@@ -69,18 +125,25 @@ def api_create_order(request):
     if not okazu and not gohan:
         return HttpResponseBadRequest("okazu or gohan required")
 
-    Order.objects.create(
-        name=name,
-        okazu=okazu,
-        okazu_expiry=okazu_expiry,
-        gohan=gohan,
-        gohan_expiry=gohan_expiry,
-    )
-    return JsonResponse({"ok": True}, json_dumps_params={"ensure_ascii": False})
+    with transaction.atomic():
+        refs = catalog.ids_for({okazu, gohan})
+        o = Order.objects.create(
+            location=location,
+            name=name,
+            okazu=okazu,
+            okazu_expiry=okazu_expiry,
+            gohan=gohan,
+            gohan_expiry=gohan_expiry,
+            okazu_ref_id=refs.get(okazu),
+            gohan_ref_id=refs.get(gohan),
+        )
+        changes.record_orders(location, [o.id])
+    return json_response(request, {"ok": True})
 
 
 @require_http_methods(["POST"])
-def api_cancel(request):
+@with_location
+def api_cancel(request, location):
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -88,205 +151,235 @@ def api_cancel(request):
     oid = payload.get("id")
     if not oid:
         return HttpResponseBadRequest("id required")
-    o = Order.objects.filter(id=oid, confirmed=False).first()
-    if not o:
+    with transaction.atomic():
+        if not Order.objects.filter(id=oid, location=location, confirmed=False).update(cancelled=True):
+            return HttpResponseBadRequest("not found")
+        changes.record_orders(location, [oid])
+    return json_response(request, {"ok": True})
+
+
+def _order_ids(payload: dict) -> list[int] | None:
+    """payload の ids（数値のリスト）。形式が不正なら None"""
+    ids = payload.get("ids") or []
+    if not isinstance(ids, list):
+        return None
+    try:
+        return [int(i) for i in ids]
+    except (TypeError, ValueError):
+        return None
+
+
+@require_http_methods(["POST"])
+@with_location
+def api_cancel_bulk(request, location):
+    # {"ids": [1, 2, ...]} の未確定注文をまとめて取消
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return HttpResponseBadRequest("invalid json")
+    ids = _order_ids(payload) if isinstance(payload, dict) else None
+    if not ids:
+        return HttpResponseBadRequest("ids required")
+    n = cancel_orders(location, ids)
+    return json_response(request, {"cancelled": n, "requested": len(set(ids))})
+
+
+@require_http_methods(["POST"])
+@with_location
+def api_confirm_all(request, location):
+    # 本文が空/{} のときだけ未確定をすべて確定。ids / name / start,end（YYYY-MM-DD）で絞り込める
+    # （Content-Type に関係なく本文を JSON として読む。空の ids や読めない日付は 400）
+    body = request.body
+    if request.content_type in ("multipart/form-data", "application/x-www-form-urlencoded") and not request.POST and not request.FILES:
+        # 項目の無いフォーム送信は空の本文と同じ
+        body = b""
+    try:
+        payload = json.loads(body.decode("utf-8") or "{}")
+    except Exception:
+        return HttpResponseBadRequest("invalid json")
+    if not isinstance(payload, dict):
+        return HttpResponseBadRequest("invalid json")
+    unknown = set(payload) - {"ids", "name", "start", "end", "location"}
+    if unknown:
+        return HttpResponseBadRequest(f"unknown field: {sorted(unknown)[0]}")
+    ids = None
+    if "ids" in payload:
+        ids = _order_ids(payload)
+        if ids is None:
+            return HttpResponseBadRequest("invalid ids")
+        if not ids:
+            return HttpResponseBadRequest("ids required")
+    params = {}
+    for key in ("name", "start", "end"):
+        if key not in payload:
+            continue
+        value = payload[key]
+        if not isinstance(value, str) or not value.strip():
+            return HttpResponseBadRequest(f"invalid {key}")
+        params[key] = value.strip()
+    try:
+        result = confirm_all(location, ids=ids, **params)
+    except ConfirmBlocked as e:
+        # 止まったチャンク確定の再開に失敗（その run が終わるか中止されるまで CSV の取込も止まる）
+        return json_response(request, {"error": "import blocked", "blocked_by": e.run_id, "detail": e.error}, status=409)
+    return json_response(request, result)
+
+
+@require_http_methods(["GET"])
+@with_location
+def api_confirm_runs(request, location):
+    # 大量の確定（チャンク処理）の進捗。別タブ/別端末からポーリングする
+    qs = ConfirmRun.objects.filter(location=location).order_by("-created_at")[:20]
+    return json_response(request, {"runs": [confirm_run_dict(r) for r in qs]})
+
+
+@require_http_methods(["GET"])
+@with_location
+def api_confirm_run(request, run_id, location):
+    run = ConfirmRun.objects.filter(id=run_id, location=location).first()
+    if not run:
         return HttpResponseBadRequest("not found")
-    o.cancelled = True
-    o.save(update_fields=["cancelled"])
-    return JsonResponse({"ok": True}, json_dumps_params={"ensure_ascii": False})
+    return json_response(request, {"run": confirm_run_dict(run)})
 
 
 @require_http_methods(["POST"])
-def api_confirm_all(request):
-    return JsonResponse(confirm_all(), json_dumps_params={"ensure_ascii": False})
+@with_location
+def api_confirm_run_abandon(request, run_id, location):
+    # 再開できなくなったチャンク確定を中止して CSV の取込を再開する（書き戻せる分は先に書き戻す）
+    run = abandon_confirm_run(location, run_id)
+    if not run:
+        return HttpResponseBadRequest("not found")
+    return json_response(request, {"run": confirm_run_dict(run)})
 
 
-def api_history(request):
-    qs = Order.objects.filter(confirmed=True, cancelled=False).order_by("-created_at")
+@with_location
+def api_history(request, location):
+    params = {k: request.GET.get(k) or "" for k in ("name", "start", "end", "q")}
+    rows = history_values(location, **params, with_archive=_with_archive(request))
+    return table_response(request, "orders", HISTORY_COLUMNS, rows)
 
-    name = request.GET.get("name") or ""
-    start = request.GET.get("start") or ""
-    end = request.GET.get("end") or ""
 
-    if name:
-        qs = qs.filter(name=name)
-    if start:
-        d = parse_date(start)
-        if d:
-            qs = qs.filter(created_at__date__gte=d)
-    if end:
-        d = parse_date(end)
-        if d:
-            qs = qs.filter(created_at__date__lte=d)
-
-    data = [
-        {
-            "id": o.id,
-            "name": o.name,
-            "okazu": o.okazu,
-            "okazu_expiry": o.okazu_expiry,
-            "gohan": o.gohan,
-            "gohan_expiry": o.gohan_expiry,
-            "created_at": o.created_at.isoformat(),
-        }
-        for o in qs
-    ]
-    return JsonResponse({"orders": data}, json_dumps_params={"ensure_ascii": False})
-
-
-def api_summary(request):
-    qs = Order.objects.filter(confirmed=True, cancelled=False)
+@with_location
+def api_summary(request, location):
     start = request.GET.get("start") or ""
     end = request.GET.get("end") or ""
-    if start:
-        d = parse_date(start)
-        if d:
-            qs = qs.filter(created_at__date__gte=d)
-    if end:
-        d = parse_date(end)
-        if d:
-            qs = qs.filter(created_at__date__lte=d)
-
-    okazu_qs = qs.exclude(okazu="").values("okazu").annotate(cnt=Count("id")).order_by("-cnt")[:50]
-    gohan_qs = qs.exclude(gohan="").values("gohan").annotate(cnt=Count("id")).order_by("-cnt")[:50]
-
-    return JsonResponse(
+    with_archive = _with_archive(request)
+    return json_response(
+        request,
         {
-            "okazu": [{"label": x["okazu"], "count": x["cnt"]} for x in okazu_qs],
-            "gohan": [{"label": x["gohan"], "count": x["cnt"]} for x in gohan_qs],
+            part: [
+                {"label": label, "count": cnt} for label, cnt in item_counts(location, part, start, end, 50, with_archive)
+            ]
+            for part in ("okazu", "gohan")
         },
-        json_dumps_params={"ensure_ascii": False},
     )
 
 
-def api_inventory(request):
-    qs = Inventory.objects.all().order_by("item", "expiry")
-    data = [
-        {"id": x.id, "item": x.item, "expiry": x.expiry, "qty": x.qty, "refill_line": x.refill_line, "alert": x.alert}
-        for x in qs
-    ]
-    return JsonResponse({"items": data}, json_dumps_params={"ensure_ascii": False})
+@with_location
+def api_summary_timeseries(request, location):
+    """?bucket=day|week|month&category=okazu|gohan&start=&end=&archive= の品目別件数の推移"""
+    params = {k: request.GET.get(k) or "" for k in ("start", "end")}
+    params["with_archive"] = _with_archive(request)
+    try:
+        data = consumption_timeseries(
+            location, request.GET.get("bucket") or "day", request.GET.get("category") or "okazu", **params
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return json_response(request, data)
+
+
+@with_location
+def api_inventory(request, location):
+    cols = ("id", "item", "expiry", "qty", "refill_line", "alert")
+    qs = Inventory.objects.filter(location=location).order_by("item", "expiry")
+    return table_response(request, "items", cols, qs.values_list(*cols))
 
 
 def _csv_response(filename: str, header: list[str], rows: list[list[str]]):
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(header)
-    for r in rows:
-        w.writerow(r)
-    data = buf.getvalue().encode("utf-8-sig")
+    with timer("view.csv_render") as t:
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(header)
+        for r in rows:
+            w.writerow(r)
+        data = buf.getvalue().encode("utf-8-sig")
+        t.rows = len(rows)
+        t.bytes = len(data)
     resp = HttpResponse(data, content_type="text/csv; charset=utf-8")
     resp["Content-Disposition"] = f'attachment; filename="{filename}"'
     return resp
 
 
-def export_history_csv(request):
-    qs = Order.objects.filter(confirmed=True, cancelled=False).order_by("-created_at")
-    name = request.GET.get("name") or ""
-    start = request.GET.get("start") or ""
-    end = request.GET.get("end") or ""
-
-    if name:
-        qs = qs.filter(name=name)
-    if start:
-        d = parse_date(start)
-        if d:
-            qs = qs.filter(created_at__date__gte=d)
-    if end:
-        d = parse_date(end)
-        if d:
-            qs = qs.filter(created_at__date__lte=d)
-
-    rows = []
-    for o in qs:
-        rows.append([
-            o.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            o.name,
-            o.okazu,
-            o.okazu_expiry,
-            o.gohan,
-            o.gohan_expiry,
-        ])
+@timed("view.export_history_csv")
+@with_location
+def export_history_csv(request, location):
+    params = {k: request.GET.get(k) or "" for k in ("name", "start", "end", "q")}
     fn = f"order_history_{date.today().isoformat()}.csv"
-    return _csv_response(fn, ["日時", "名前", "おかず", "おかず賞味期限", "ご飯", "ご飯賞味期限"], rows)
+    rows = history_rows(location=location, **params, with_archive=_with_archive(request))
+    return _csv_response(fn, HISTORY_HEADER, rows)
 
 
-def export_ranking_csv(request):
-    qs = Order.objects.filter(confirmed=True, cancelled=False)
-    start = request.GET.get("start") or ""
-    end = request.GET.get("end") or ""
-    if start:
-        d = parse_date(start)
-        if d:
-            qs = qs.filter(created_at__date__gte=d)
-    if end:
-        d = parse_date(end)
-        if d:
-            qs = qs.filter(created_at__date__lte=d)
-
-    okazu_qs = qs.exclude(okazu="").values("okazu").annotate(cnt=Count("id")).order_by("-cnt")[:200]
-    gohan_qs = qs.exclude(gohan="").values("gohan").annotate(cnt=Count("id")).order_by("-cnt")[:200]
-
-    rows = []
-    for x in okazu_qs:
-        rows.append(["おかず", x["okazu"], x["cnt"]])
-    for x in gohan_qs:
-        rows.append(["ご飯", x["gohan"], x["cnt"]])
-
+@timed("view.export_ranking_csv")
+@with_location
+def export_ranking_csv(request, location):
+    params = {k: request.GET.get(k) or "" for k in ("start", "end")}
     fn = f"ranking_{date.today().isoformat()}.csv"
-    return _csv_response(fn, ["区分", "品目", "件数"], rows)
+    rows = ranking_rows(location=location, **params, with_archive=_with_archive(request))
+    return _csv_response(fn, RANKING_HEADER, rows)
 
 
-def export_expiry_csv(request):
+@timed("view.export_expiry_csv")
+@with_location
+def export_expiry_csv(request, location):
     mode = (request.GET.get("mode") or "near").lower()  # near or expired
     days = int(request.GET.get("days") or 3)
+    fn = f"expiry_{mode}_{date.today().isoformat()}.csv"
+    return _csv_response(fn, EXPIRY_HEADER, expiry_rows(mode, days, location=location))
 
-    items = []
-    for inv in Inventory.objects.all():
-        exp = (inv.expiry or "").strip().replace("/", "-")
-        try:
-            d = datetime.fromisoformat(exp).date()
-        except Exception:
-            continue
-        diff = (d - date.today()).days
-        if mode == "expired":
-            if diff < 0:
-                items.append([inv.item, inv.expiry, str(inv.qty), str(diff)])
-        else:
-            if 0 <= diff <= days:
-                items.append([inv.item, inv.expiry, str(inv.qty), str(diff)])
 
-    fn = f"expiry_{mode}_{date.today().isoformat()}.csv"
-    return _csv_response(fn, ["品目", "賞味期限", "在庫数", "残日数"], items)
+@require_http_methods(["GET"])
+@with_location
+def api_inventory_csv_lots(request, location):
+    return table_response(request, "lots", LOT_COLUMNS, inventory_csv_lot_rows(location))
 
 
 @require_http_methods(["GET"])
-def api_inventory_csv_lots(request):
-    return JsonResponse({"lots": inventory_csv_lots()})
+@with_location
+def api_inventory_csv_dashboard(request, location):
+    # summary / lots / alerts / carryover をまとめて返す（?sections=summary,lots で絞り込み）
+    raw = request.GET.get("sections") or ""
+    sections = [x.strip() for x in raw.split(",") if x.strip()] or None
+    return json_response(request, inventory_dashboard(sections, location=location))
 
 
 @require_http_methods(["GET"])
-def api_inventory_csv_summary(request):
-    return JsonResponse({"summary": inventory_csv_summary()})
+@with_location
+def api_inventory_csv_summary(request, location):
+    return json_response(request, {"summary": inventory_csv_summary(location=location)})
 
 
 @require_http_methods(["GET"])
-def api_inventory_csv_alerts(request):
+@timed("view.inventory_csv_alerts")
+@with_location
+def api_inventory_csv_alerts(request, location):
     # 画面表示用 + 発注候補をCSV出力
-    candidates = generate_purchase_candidates()
-    export_path = export_purchase_candidates_csv()
-    return JsonResponse({
+    candidates = generate_purchase_candidates(location)
+    export_path = export_purchase_candidates_csv(location)
+    return json_response(request, {
         "alerts": candidates,
         "exported": str(export_path.name),
     })
 
 
 @require_http_methods(["GET"])
-def api_inventory_csv_export_latest(request):
-    p = get_latest_export("purchase_candidates")
+@timed("view.inventory_csv_export_latest")
+@with_location
+def api_inventory_csv_export_latest(request, location):
+    p = get_latest_export("purchase_candidates", location)
     if not p:
         # まだ出力が無い場合は生成
-        p = export_purchase_candidates_csv()
+        p = export_purchase_candidates_csv(location)
     with p.open("rb") as f:
         data = f.read()
     resp = HttpResponse(data, content_type="text/csv; charset=utf-8")
@@ -295,12 +388,14 @@ def api_inventory_csv_export_latest(request):
 
 
 @require_http_methods(["GET"])
-def api_carryover_report(request):
-    return JsonResponse(carryover_report())
+@with_location
+def api_carryover_report(request, location):
+    return json_response(request, carryover_report(location=location))
 
 
 @require_http_methods(["POST"])
-def api_carryover_snapshot(request):
+@with_location
+def api_carryover_snapshot(request, location):
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -312,19 +407,97 @@ def api_carryover_snapshot(request):
         first = today.replace(day=1)
         prev_last = first - __import__("datetime").timedelta(days=1)
         month = prev_last.strftime("%Y-%m")
-    n = create_carryover_snapshot(month)
-    return JsonResponse({"ok": True, "month": month, "count": n})
+    n = create_carryover_snapshot(month, location)
+    return json_response(request, {"ok": True, "month": month, "count": n})
 
 
 @require_http_methods(["GET"])
-def api_sync_status(request):
+@with_location
+def api_sync_status(request, location):
     # CSV更新検知用（フロントがポーリングする）
+    loc = get_location(location)
     try:
-        meibo_mtime = int(MEIBO_CSV.stat().st_mtime)
+        meibo_mtime = int(loc.meibo_csv.stat().st_mtime)
     except Exception:
         meibo_mtime = 0
     try:
-        zaiko_mtime = int(ZAIKO_CSV.stat().st_mtime)
+        zaiko_mtime = int(loc.zaiko_csv.stat().st_mtime)
     except Exception:
         zaiko_mtime = 0
-    return JsonResponse({"meibo_mtime": meibo_mtime, "zaiko_mtime": zaiko_mtime})
+    # import_blocked_by: CSVの取込を止めている（再開待ちの）チャンク確定の run id
+    return json_response(
+        request, {"meibo_mtime": meibo_mtime, "zaiko_mtime": zaiko_mtime, "import_blocked_by": import_blocked_by(location)}
+    )
+
+
+@require_http_methods(["GET"])
+@with_location
+def api_changes(request, location):
+    # ?since=<前回の version> 以降に変わったロット/注文だけ返す（resync=true なら一覧を取り直す）
+    try:
+        since = int(request.GET.get("since") or 0)
+    except ValueError:
+        return HttpResponseBadRequest("invalid since")
+    reload_from_csv(location)
+    data = changes.changes_since(location, since)
+    if not data["resync"]:
+        data["lots"] = table(request, changes.LOT_COLUMNS, data["lots"])
+        data["orders"] = table(request, changes.ORDER_COLUMNS, data["orders"])
+    return json_response(request, data)
+
+
+@require_http_methods(["GET"])
+def api_locations(request):
+    return json_response(request, {"locations": [{"code": l.code, "name": l.name} for l in all_locations()]})
+
+
+@require_http_methods(["GET"])
+def api_metrics(request):
+    # Prometheus スクレイプ用
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@require_http_methods(["GET", "POST"])
+@with_location
+def api_exports(request, location):
+    # POST: {"kind": "history|ranking|expiry|purchase_candidates", "params": {...}} で登録
+    # GET: 直近のジョブ一覧
+    if request.method == "GET":
+        qs = ExportJob.objects.filter(location=location).order_by("-created_at")[:50]
+        return json_response(request, {"jobs": [job_dict(j) for j in qs]})
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return HttpResponseBadRequest("invalid json")
+    if not isinstance(payload, dict) or not isinstance(payload.get("params") or {}, dict):
+        return HttpResponseBadRequest("invalid json")
+    try:
+        job = enqueue_export(payload.get("kind") or "", payload.get("params") or {}, location)
+    except UnknownExportKind:
+        return HttpResponseBadRequest("unknown kind")
+    except InvalidExportParams as e:
+        return HttpResponseBadRequest(str(e))
+    return json_response(request, {"job": job_dict(job)})
+
+
+@require_http_methods(["GET"])
+@with_location
+def api_export_job(request, job_id, location):
+    job = ExportJob.objects.filter(id=job_id, location=location).first()
+    if not job:
+        return HttpResponseBadRequest("not found")
+    return json_response(request, {"job": job_dict(job)})
+
+
+@require_http_methods(["GET"])
+@with_location
+def api_export_job_download(request, job_id, location):
+    job = ExportJob.objects.filter(id=job_id, location=location, status=ExportJob.DONE).first()
+    if not job:
+        return HttpResponseBadRequest("not ready")
+    p = get_location(location).exports_dir / job.file
+    if not p.exists():
+        return HttpResponseBadRequest("file removed")
+    resp = FileResponse(p.open("rb"), content_type="text/csv; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="{p.name}"'
+    return resp